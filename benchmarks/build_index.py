@@ -0,0 +1,70 @@
+"""
+    Benchmark: parallel index build
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Builds the page index and render cache of a generated wiki from
+    scratch with an increasing number of worker processes.
+
+    Run with ``python benchmarks/build_index.py [pages]``.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from wiki.core import RenderCache
+from wiki.core import Wiki
+
+
+PAGE = u"""\
+title: Page {0}
+tags: bench, group{1}
+
+# Page {0}
+
+Some text with a [[page{2}]] link and *emphasis*.
+
+```python
+def page_{0}(value):
+    return value * {0}
+```
+
+| a | b |
+|---|---|
+| {0} | {1} |
+"""
+
+
+def generate(root, pages):
+    for i in range(pages):
+        folder = os.path.join(root, 'group%d' % (i % 20))
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        with open(os.path.join(folder, 'page%d.md' % i), 'w') as f:
+            f.write(PAGE.format(i, i % 20, (i + 1) % pages))
+
+
+def main(pages=2000):
+    root = tempfile.mkdtemp()
+    try:
+        generate(root, pages)
+        jobs = 1
+        while jobs <= (os.cpu_count() or 1):
+            state = os.path.join(root, Wiki.state_folder)
+            if os.path.exists(state):
+                shutil.rmtree(state)
+            wiki = Wiki(root, render_cache=RenderCache())
+            start = time.time()
+            wiki.build_index(jobs=jobs)
+            elapsed = time.time() - start
+            print(u'{:>3} jobs {:8.2f} s {:8.0f} pages/s'.format(
+                jobs, elapsed, pages / elapsed))
+            wiki.page_index.close()
+            jobs *= 2
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
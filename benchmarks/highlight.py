@@ -0,0 +1,79 @@
+"""
+    Benchmark: highlight cache
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Renders a code-heavy page with a cold highlight cache and again
+    after an edit to its prose, when all code blocks are cached. The
+    page is rendered as a whole, the cache of rendered sections would
+    otherwise serve the unchanged code.
+
+    Run with ``python benchmarks/highlight.py [blocks]``.
+"""
+import sys
+import timeit
+
+from wiki.core import Processor
+from wiki.highlight import highlight_cache
+
+
+BLOCK = u"""\
+## Step {0}
+
+Run the following to configure step {0}:
+
+```python
+import os
+
+
+class Step{0}(object):
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.done = False
+
+    def run(self, *args, **kwargs):
+        for name in sorted(os.listdir(self.root)):
+            if name.endswith('.cfg'):
+                print(name, args, kwargs)
+        self.done = True
+        return {{'step': {0}, 'done': self.done}}
+```
+
+```yaml
+step: {0}
+settings:
+  retries: 3
+  timeout: 30
+```
+"""
+
+
+def page(blocks, prose=u'Runbook'):
+    return u'title: Runbook\n\n%s\n\n%s' % (
+        prose, u'\n'.join(BLOCK.format(i) for i in range(blocks)))
+
+
+def main(blocks=50, number=20):
+    Processor.block_threshold = sys.maxsize
+    text = page(blocks)
+    edited = page(blocks, u'Runbook, edited')
+
+    def cold():
+        highlight_cache.clear()
+        return Processor(text).process()
+
+    def warm():
+        return Processor(edited).process()
+
+    assert cold()[0].replace(u'Runbook', u'') == \
+        warm()[0].replace(u'Runbook, edited', u'')
+    for name, func in (('cold highlight cache', cold),
+                       ('prose edit, warm cache', warm)):
+        elapsed = timeit.timeit(func, number=number)
+        print(u'{:<24} {:8.2f} ms/page'.format(
+            name, elapsed / number * 1000))
+    print(highlight_cache.stats())
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
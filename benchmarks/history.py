@@ -0,0 +1,63 @@
+"""
+    Benchmark: page history
+    ~~~~~~~~~~~~~~~~~~~~~~~
+
+    Records many revisions of a page and looks up the latest ones, the
+    oldest ones and a diff of two revisions. The lookups read only the
+    revisions they return, so they take the same time whatever the
+    length of the history.
+
+    Run with ``python benchmarks/history.py [revisions]``.
+"""
+import difflib
+import shutil
+import sys
+import tempfile
+import timeit
+
+from wiki.history import History
+
+
+PAGE = u"""\
+title: Changelog
+
+{0}
+"""
+
+
+def main(revisions=10000, number=1000):
+    folder = tempfile.mkdtemp()
+    try:
+        history = History(folder)
+        lines = []
+        for i in range(revisions):
+            lines.append(u'* change %d' % i)
+            history.append(u'changelog', PAGE.format(u'\n'.join(lines[-50:])),
+                           author=u'bench', message=u'Change %d' % i)
+        assert history.count(u'changelog') == revisions
+
+        def latest():
+            return history.revisions(u'changelog', 20)
+
+        def oldest():
+            return history.revisions(u'changelog', 20, before=21)
+
+        def diff():
+            return list(difflib.unified_diff(
+                history.content(u'changelog', revisions - 1).splitlines(),
+                history.content(u'changelog', revisions).splitlines()))
+
+        assert latest()[0].number == revisions
+        assert oldest()[-1].number == 1
+        for name, func in (('latest 20 revisions', latest),
+                           ('oldest 20 revisions', oldest),
+                           ('diff of the last two', diff)):
+            elapsed = timeit.timeit(func, number=number)
+            print(u'{:<22} {:8.3f} ms'.format(
+                name, elapsed / number * 1000))
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,58 @@
+"""
+    Benchmark: markdown engine reuse
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Compares building a new :class:`markdown.Markdown` for every page
+    (as the processor used to do) with the per-thread engine returned
+    by :func:`wiki.core.get_markdown`.
+
+    Run with ``python benchmarks/markdown_engine.py``.
+"""
+import timeit
+
+import markdown
+
+from wiki.core import get_markdown
+from wiki.core import Processor
+
+
+PAGE = u"""\
+title: Benchmark
+tags: bench
+
+# A heading
+
+Some *text* with a [link](http://example.com) and a table:
+
+| a | b |
+|---|---|
+| 1 | 2 |
+
+```python
+def hello():
+    return 'world'
+```
+"""
+
+
+def fresh():
+    md = markdown.Markdown(extensions=Processor.extensions)
+    return md.convert(PAGE)
+
+
+def pooled():
+    md = get_markdown(Processor.extensions)
+    return md.convert(PAGE)
+
+
+def main(number=500):
+    assert fresh() == pooled()
+    for name, func in (('new engine per page', fresh),
+                       ('per-thread engine', pooled)):
+        elapsed = timeit.timeit(func, number=number)
+        print(u'{:<22} {:8.3f} ms/page'.format(
+            name, elapsed / number * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+    Benchmark: moving a subtree
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Moves a folder of pages, each linked from a page outside of it,
+    and rewrites all the links. The referring pages are found through
+    the link index, the other pages of the wiki are not touched.
+
+    Run with ``python benchmarks/move_tree.py [pages] [unrelated]``.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from wiki.core import Wiki
+
+
+PAGE = u"""\
+title: Page {0}
+
+See [[docs/page{1}]] and [[docs/page{2}|the next page]].
+"""
+
+REFERRER = u"""\
+title: Referrer {0}
+
+Documented in [[docs/page{0}]].
+"""
+
+UNRELATED = u"""\
+title: Unrelated {0}
+
+Nothing to see here, only [[other/unrelated{1}]].
+"""
+
+
+def write(path, content):
+    folder = os.path.dirname(path)
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+def main(pages=1000, unrelated=5000):
+    root = tempfile.mkdtemp()
+    try:
+        for i in range(pages):
+            write(os.path.join(root, 'docs', 'page%d.md' % i),
+                  PAGE.format(i, (i + 1) % pages, (i + 2) % pages))
+            write(os.path.join(root, 'refs', 'ref%d.md' % i),
+                  REFERRER.format(i))
+        for i in range(unrelated):
+            write(os.path.join(root, 'other', 'unrelated%d.md' % i),
+                  UNRELATED.format(i, (i + 1) % unrelated))
+        wiki = Wiki(root, watched=True)
+        wiki.build_index(render=False)
+
+        start = time.time()
+        wiki.move('docs', 'manual', subtree=True)
+        elapsed = time.time() - start
+        assert not wiki.broken_links()
+        assert len(wiki.page_index.backlinks('manual/page0')) == 3
+        print(u'moved {} pages, rewrote {} referring pages, '
+              u'{} unrelated pages: {:.2f} s'.format(
+                  pages, pages * 2, unrelated, elapsed))
+        wiki.page_index.close()
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
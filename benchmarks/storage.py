@@ -0,0 +1,56 @@
+"""
+    Benchmark: storages
+    ~~~~~~~~~~~~~~~~~~~
+
+    Fills every storage with the same pages in nested folders and
+    measures the scan that keeps the page index current before reads,
+    when nothing changed, and reading every page once.
+
+    Run with ``python benchmarks/storage.py [pages]``.
+"""
+import shutil
+import sys
+import tempfile
+import time
+
+from wiki.core import Wiki
+from wiki.storage import create_storage
+
+
+PAGE = u"""\
+title: Page {0}
+
+Some text of page {0}, linking to [[section{1}/page{1}]].
+"""
+
+
+def main(pages=20000, number=5):
+    for name in ('files', 'sqlite', 'memory'):
+        root = tempfile.mkdtemp()
+        try:
+            storage = create_storage(name, root, exclude=[Wiki.state_folder])
+            for i in range(pages):
+                storage.write(u'section%d/sub%d/page%d' % (i % 50, i % 7, i),
+                              PAGE.format(i, (i + 1) % 50))
+            wiki = Wiki(root, storage=storage)
+            wiki.build_index(jobs=1, render=False)
+
+            start = time.time()
+            for _ in range(number):
+                wiki.update_index()
+            scan = (time.time() - start) / number
+
+            start = time.time()
+            for url, _ in storage.walk():
+                storage.read(url)
+            read = time.time() - start
+            print(u'{:<8} scan {:8.1f} ms   read all {:8.1f} ms'.format(
+                name, scan * 1000, read * 1000))
+            wiki.page_index.close()
+            storage.close()
+        finally:
+            shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
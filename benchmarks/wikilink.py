@@ -0,0 +1,61 @@
+"""
+    Benchmark: wikilink postprocessor
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Compares the previous wikilink implementation, which rescanned the
+    whole html for every link, with the single pass of
+    :func:`wiki.core.wikilink` on a page with 1,000 wikilinks.
+
+    Run with ``python benchmarks/wikilink.py``.
+"""
+import re
+import timeit
+
+from wiki.core import clean_url
+from wiki.core import wikilink
+
+
+def url_formatter(endpoint, url):
+    return u'/{}/'.format(url)
+
+
+def rescanning_wikilink(text, url_formatter):
+    # the implementation before the single pass, kept for comparison
+    link_regex = re.compile(
+        r"((?<!\<code\>)\[\[([^<].+?) \s*([|] \s* (.+?) \s*)?]])",
+        re.X | re.U
+    )
+    for i in link_regex.findall(text):
+        title = [i[-1] if i[-1] else i[1]][0]
+        url = clean_url(i[1])
+        html_url = u"<a href='{0}'>{1}</a>".format(
+            url_formatter('wiki.display', url=url),
+            title
+        )
+        text = re.sub(link_regex, html_url, text, count=1)
+    return text
+
+
+def make_page(links=1000):
+    paragraphs = []
+    for i in range(links):
+        paragraphs.append(
+            u'<p>Some text about [[topic/{0}|Topic {0}]] and more text '
+            u'that has to be scanned as well.</p>'.format(i % 200))
+    return u'\n'.join(paragraphs)
+
+
+def main(number=5):
+    page = make_page()
+    assert rescanning_wikilink(page, url_formatter) == \
+        wikilink(page, url_formatter)
+    for name, func in (('rescanning', rescanning_wikilink),
+                       ('single pass', wikilink)):
+        elapsed = timeit.timeit(
+            lambda: func(page, url_formatter), number=number)
+        print(u'{:<12} {:10.3f} ms/page'.format(
+            name, elapsed / number * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+import os
+
+from click.testing import CliRunner
+from mock import patch
+
+from wiki.cli import main
+from wiki.core import block_cache
+from wiki.highlight import highlight_cache
+from wiki.web import create_app
+
+from . import CONFIGURATION
+from . import WikiBaseTestCase
+
+
+class CliTestCase(WikiBaseTestCase):
+    """
+        Contains various tests for the maintenance commands.
+    """
+
+    def setUp(self):
+        super(CliTestCase, self).setUp()
+        self.create_file(u'one.md', u'title: One\ntags: a\n\nOne [[two]]\n')
+        self.create_file(u'two.md', u'title: Two\n\n```python\nx = 2\n```\n')
+        self.runner = CliRunner()
+
+    def invoke(self, *args):
+        result = self.runner.invoke(
+            main, ['--directory', self.rootdir] + list(args))
+        assert result.exit_code == 0, result.output
+        return result.output
+
+    def test_reindex(self):
+        """
+            Assert the indexes are rebuilt.
+        """
+        output = self.invoke('reindex', '--jobs', '1')
+        assert 'Indexed 2 pages.' in output
+        assert self.wiki.tag_counts() == {'a': 1}
+
+    def test_stats(self):
+        """
+            Assert all the pages are measured.
+        """
+        output = self.invoke('stats', '--top', '1')
+        assert 'Pages: 2' in output
+        assert 'Slowest pages:' in output
+        assert 'Render time histogram:' in output
+        slowest = output.split('Slowest pages:\n')[1].split('\n\n')[0]
+        assert len(slowest.splitlines()) == 1
+
+    def test_stats_cold(self):
+        """
+            Assert every page is measured with empty caches.
+        """
+        with patch.object(highlight_cache, 'clear') as highlight, \
+                patch.object(block_cache, 'clear') as block:
+            self.invoke('stats')
+        assert highlight.call_count == block.call_count == 2
+
+    def test_migrate(self):
+        """
+            Assert the pages are copied to another storage, which the
+            wiki uses once it is configured.
+        """
+        output = self.invoke('migrate', 'sqlite')
+        assert 'Copied 2 pages' in output
+        self.create_file(u'config.py', CONFIGURATION + u"STORAGE='sqlite'\n")
+        for name in ('one.md', 'two.md'):
+            os.remove(os.path.join(self.rootdir, name))
+        client = create_app(self.rootdir).test_client()
+        assert b'One' in client.get('/one/').data
+        assert b'/two/' in client.get('/index/').data
+        result = self.runner.invoke(
+            main, ['--directory', self.rootdir, 'migrate', 'sqlite'])
+        assert result.exit_code != 0
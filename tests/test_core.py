@@ -2,15 +2,31 @@
 from io import open
 from unittest import TestCase
 import os
+import random
+import threading
+from mock import Mock
 from mock import patch
 
+import markdown
+from markdown.extensions import codehilite
+from markdown.extensions import fenced_code
 import pytest
 
+from wiki.core import ConflictException
 from wiki.core import InvalidFileException
 from wiki.core import clean_url
+from wiki.core import get_markdown
+from wiki.core import parse_meta
 from wiki.core import wikilink
 from wiki.core import Page
 from wiki.core import Processor
+from wiki.core import RenderCache
+from wiki.core import Wiki
+from wiki.core import block_cache
+from wiki.core import split_blocks
+from wiki.files import atomic_write
+from wiki.files import UMASK
+from wiki.highlight import highlight_cache
 
 from . import WikiBaseTestCase
 
@@ -143,6 +159,51 @@ class WikilinkTestCase(TestCase):
         )
 
 
+class ParseMetaTestCase(TestCase):
+    """
+        Contains various tests for the header-only meta parser.
+    """
+
+    def test_matches_processor(self):
+        """
+            Assert the meta header is parsed the same way the
+            processor does it.
+        """
+        meta, body = parse_meta(PAGE_CONTENT)
+        _, original, processed = Processor(PAGE_CONTENT).process()
+        assert meta == processed
+        assert list(meta) == list(processed)
+        assert body == original
+
+    def test_invalid(self):
+        """
+            Assert content without meta data is rejected.
+        """
+        with pytest.raises(InvalidFileException):
+            parse_meta(PAGE_CONTENT_INVALID)
+
+
+    def test_repeated_wikilinks(self):
+        """
+            Assert every target is only formatted once per call.
+        """
+        formatter = Mock(side_effect=simple_url_formatter)
+        formatted = wikilink(
+            u'[[one]] [[two|Two]] [[one|One]] [[ONE]]', formatter)
+        assert formatted == (
+            "<a href='/one'>one</a> <a href='/two'>Two</a>"
+            " <a href='/one'>One</a> <a href='/one'>ONE</a>"
+        )
+        assert formatter.call_count == 2
+
+    def test_wikilink_title_is_not_a_template(self):
+        """
+            Assert backslashes in titles are kept as they are.
+        """
+        formatted = wikilink(u'[[target|C:\\temp]]', simple_url_formatter)
+        assert formatted == u"<a href='/target'>C:\\temp</a>"
+
+
 class ProcessorTestCase(WikiBaseTestCase):
     """
         Contains various tests for the :class:`~wiki.core.Processors`
@@ -168,6 +229,20 @@ class ProcessorTestCase(WikiBaseTestCase):
             'tags': u'one, two, 3, jö'
         }
 
+    def test_engine_is_reused(self):
+        """
+            Assert processors share the markdown engine of the thread
+            and that it is reset between conversions.
+        """
+        self.processor.process()
+        engine = self.processor.md
+        processor = SimpleWikilinkProcessor(WIKILINK_PAGE_CONTENT)
+        processor.process()
+        assert processor.md is engine
+        assert processor.meta == {'title': u'link'}
+        assert get_markdown(Processor.extensions) is engine
+        assert engine.Meta == {}
+
     def test_process_wikilinks(self):
         """
             Assert that wikilinks are processed correctly.
@@ -177,6 +252,218 @@ class ProcessorTestCase(WikiBaseTestCase):
         assert html == WIKILINK_CONTENT_HTML
 
 
+#: pieces of markdown the documents of the block rendering tests are
+#: made of
+BLOCK_PIECES = [
+    u'# Heading',
+    u'## Heading with *emphasis* ##',
+    u'#no space',
+    u'Setext heading\n==============',
+    u'A paragraph with `code`, **bold** and a [link](http://example.com).',
+    u'A paragraph\nthat continues\n# right into a heading',
+    u'- one\n- two\n\n    continued\n- three',
+    u'1. first\n2. second\n    - nested',
+    u'> a quote\n> # with a heading\n\n> again',
+    u'    indented code\n\n    # still code',
+    u'```python\ndef f():\n\n# not a heading\n    return 1\n```',
+    u'~~~~\n```\n\n# inside\n~~~~',
+    u'```\nunclosed fence\n\n# heading',
+    u'| a | b |\n|---|---|\n| 1 | 2 |',
+    u'Math \\(x^2\\) and $$y$$ and $z$.',
+    u'\\[\n\\begin{align}a\\end{align}\n\\]',
+    u'---',
+    u'*',
+    u'   ',
+    u'<div>\n\n# html block\n\n</div>',
+    u'A [reference][ref] link.\n\n[ref]: http://example.com',
+]
+
+
+class BlockRenderingTestCase(WikiBaseTestCase):
+    """
+        Contains various tests for rendering long pages section by
+        section.
+    """
+
+    def setUp(self):
+        super(BlockRenderingTestCase, self).setUp()
+        block_cache.clear()
+
+    def render(self, text):
+        processor = Processor(text)
+        processor.block_threshold = 0
+        return processor.process()
+
+    def test_split(self):
+        """
+            Assert texts are only split in front of headings that are
+            not part of something else.
+        """
+        text = u'a: b\n\n# One\ntext\n```\n\n# code\n```\n\n# Two\n'
+        assert split_blocks(text) == [
+            u'a: b\n\n', u'# One\ntext\n```\n\n# code\n```\n\n', u'# Two\n']
+        assert split_blocks(u'a: b\n\n# One\n\n<div>\n\n# x\n</div>\n') == \
+            [u'a: b\n\n# One\n\n<div>\n\n# x\n</div>\n']
+
+    def test_identical_output(self):
+        """
+            Assert random documents render exactly like a conversion
+            of the whole document.
+        """
+        engine = markdown.Markdown(extensions=Processor.extensions)
+        split = 0
+        for seed in range(300):
+            rnd = random.Random(seed)
+            pieces = [rnd.choice(BLOCK_PIECES)
+                      for _ in range(rnd.randint(1, 12))]
+            separators = [rnd.choice([u'\n', u'\n\n', u'\n\n\n', u'\n \n'])
+                          for _ in pieces]
+            body = u''.join(p + s for p, s in zip(pieces, separators))
+            text = u'title: Random %d\ntags: a\n\n%s' % (seed, body)
+            if len(split_blocks(text)) > 1:
+                split += 1
+            engine.reset()
+            expected = engine.convert(text)
+            html, _, meta = self.render(text)
+            assert html == expected, seed
+            assert meta['title'] == u'Random %d' % seed
+            # and again from the cache
+            assert self.render(text)[0] == expected, seed
+        assert split > 100
+
+    def test_changed_section(self):
+        """
+            Assert only the changed section is converted again.
+        """
+        sections = [u'# Section %d\n\ntext %d\n' % (i, i) for i in range(5)]
+        text = u'title: Long\n\n' + u'\n'.join(sections)
+        self.render(text)
+        misses = block_cache.stats()['misses']
+        self.render(text.replace(u'text 2', u'changed'))
+        assert block_cache.stats()['misses'] == misses + 1
+
+
+class RenderCacheTestCase(WikiBaseTestCase):
+    """
+        Contains various tests for the :class:`~wiki.core.RenderCache`
+        class.
+    """
+
+    def test_processor_uses_cache(self):
+        """
+            Assert the markdown stage is skipped for cached content
+            while the result stays the same.
+        """
+        cache = RenderCache()
+        first = Processor(PAGE_CONTENT, cache=cache).process()
+        processor = Processor(PAGE_CONTENT, cache=cache)
+        with patch.object(processor, 'process_markdown') as process:
+            second = processor.process()
+        assert not process.called
+        assert first == second
+        assert cache.stats()['hits'] == 1
+        assert cache.stats()['misses'] == 1
+
+    def test_lru_eviction(self):
+        """
+            Assert the least recently used entries are evicted once
+            the byte budget is exceeded.
+        """
+        cache = RenderCache(max_bytes=10)
+        cache.set('a', (u'aaaa', u'', {}))
+        cache.set('b', (u'bbbb', u'', {}))
+        assert cache.get('a') is not None
+        cache.set('c', (u'cccc', u'', {}))
+        assert cache.get('b') is None
+        assert cache.get('a') is not None
+        assert cache.get('c') is not None
+        assert cache.stats()['evictions'] == 1
+        assert cache.stats()['bytes'] == 8
+
+    def test_disk_tier(self):
+        """
+            Assert entries survive in the on-disk tier.
+        """
+        folder = os.path.join(self.rootdir, 'cache')
+        RenderCache(folder=folder).set('key', (u'html', u'body', {'a': 'b'}))
+        cache = RenderCache(folder=folder)
+        assert cache.get('key') == (u'html', u'body', {'a': 'b'})
+        assert cache.stats()['disk_hits'] == 1
+
+
+class HighlightCacheTestCase(WikiBaseTestCase):
+    """
+        Contains various tests for the cache of highlighted code
+        blocks.
+    """
+
+    CODE = u"""\
+title: Code
+
+Some prose.
+
+```python
+def one():
+    return 1
+```
+
+    indented = True
+"""
+
+    def setUp(self):
+        super(HighlightCacheTestCase, self).setUp()
+        highlight_cache.clear()
+
+    def test_same_output(self):
+        """
+            Assert the cached output is the same as the highlighted.
+        """
+        first = Processor(self.CODE).process()[0]
+        with patch('markdown.extensions.codehilite.highlight') as highlight:
+            second = Processor(self.CODE).process()[0]
+        assert not highlight.called
+        assert first == second
+        assert u'<span class="k">def</span>' in first
+        assert u'codehilite' in first
+
+    def test_prose_edit(self):
+        """
+            Assert unchanged blocks are not highlighted again after
+            the prose of a page changed.
+        """
+        Processor(self.CODE).process()
+        misses = highlight_cache.stats()['misses']
+        changed = self.CODE.replace(u'Some prose.', u'Other prose.')
+        Processor(changed).process()
+        assert highlight_cache.stats()['misses'] == misses
+        Processor(changed.replace(u'one', u'two')).process()
+        assert highlight_cache.stats()['misses'] == misses + 1
+
+    def test_no_patching(self):
+        """
+            Assert the highlighters of the markdown package are left
+            alone.
+        """
+        Processor(self.CODE).process()
+        assert codehilite.CodeHilite.__module__ == \
+            'markdown.extensions.codehilite'
+        assert fenced_code.CodeHilite is codehilite.CodeHilite
+
+    def test_eviction(self):
+        """
+            Assert the cache stays within its budget.
+        """
+        budget = highlight_cache.max_bytes
+        highlight_cache.max_bytes = 10
+        try:
+            highlight_cache.set('a', u'aaaaaa')
+            highlight_cache.set('b', u'bbbbbb')
+            assert highlight_cache.get('a') is None
+            assert highlight_cache.stats()['bytes'] == 6
+        finally:
+            highlight_cache.max_bytes = budget
+
+
 class PageTestCase(WikiBaseTestCase):
     """
         Contains various tests for the :class:`~wiki.core.Page`
@@ -204,6 +491,33 @@ class PageTestCase(WikiBaseTestCase):
         assert self.page.title == u'Test'
         assert self.page.tags == u'one, two, 3, jö'
 
+    def test_page_saving_conflict(self):
+        """
+            Assert a page is only saved over the version it was loaded
+            from, if one is given.
+        """
+        version = self.page.version
+        self.page.save(version=version)
+        other = Page(self.page_path, 'test')
+        other.body = u'Changed'
+        other.save(version=version)
+        with pytest.raises(ConflictException) as error:
+            self.page.save(version=version)
+        assert error.value.version == other.version
+        assert Page(self.page_path, 'test').body == u'Changed'
+
+    def test_page_renders_lazily(self):
+        """
+            Assert markdown is only rendered once the html is accessed.
+        """
+        with patch('wiki.core.Processor', wraps=Processor) as processor:
+            page = Page(self.page_path, 'test')
+            assert page.title == u'Test'
+            assert processor.call_count == 0
+            assert page.html == CONTENT_HTML
+            assert page.html == CONTENT_HTML
+        assert processor.call_count == 1
+
     def test_page_saving(self):
         """
             Assert that saving a page back to disk persists it
@@ -294,6 +608,72 @@ class WikiTestCase(WikiBaseTestCase):
         testpage = pages[1]
         assert testpage.url == 'test'
 
+    def test_index_is_persisted(self):
+        """
+            Assert the index is stored in the content directory and
+            only changed files are parsed again.
+        """
+        self.create_file('test.md', PAGE_CONTENT)
+        self.create_file('one/two/three.md', WIKILINK_PAGE_CONTENT)
+        self.wiki.index()
+        assert os.path.exists(
+            os.path.join(self.rootdir, '.wiki', 'index.db'))
+
+        self.create_file('test.md', PAGE_CONTENT.replace(u'Test', u'Tested'))
+        with patch('wiki.core.parse_meta', wraps=parse_meta) as parser:
+            pages = self.wiki.index()
+        assert parser.call_count == 1
+        assert [page.title for page in pages] == [u'link', u'Tested']
+
+    def test_index_pagination(self):
+        """
+            Assert the index can be fetched in pages sorted by title.
+        """
+        for url, title in ((u'b', u'b'), (u'a', u'a'), (u'c', u'c'),
+                           (u'x', u'B')):
+            self.create_file(u'%s.md' % url,
+                             u'title: %s\n\ncontent\n' % title)
+        pages, cursor = self.wiki.index_page(limit=3)
+        assert [page.url for page in pages] == ['a', 'b', 'x']
+        pages, cursor = self.wiki.index_page(cursor, limit=3)
+        assert [page.url for page in pages] == ['c']
+        assert cursor is None
+        assert [page.url for page in self.wiki.iter_index(batch=2)] == \
+            ['a', 'b', 'x', 'c']
+        with pytest.raises(ValueError):
+            self.wiki.index_page(u'invalid')
+
+    def test_index_removes_deleted(self):
+        """
+            Assert pages deleted from disk disappear from the index.
+        """
+        self.create_file('test.md', PAGE_CONTENT)
+        assert len(self.wiki.index()) == 1
+        os.remove(os.path.join(self.rootdir, 'test.md'))
+        assert self.wiki.index() == []
+
+    def test_scan_interval(self):
+        """
+            Assert the content directory is scanned at most once per
+            interval, while changes made through the wiki show up
+            right away.
+        """
+        self.create_file('test.md', PAGE_CONTENT)
+        wiki = Wiki(self.rootdir, scan_interval=60)
+        assert len(wiki.index()) == 1
+        self.create_file('other.md', PAGE_CONTENT)
+        with patch.object(wiki, '_update_index') as update:
+            assert len(wiki.index()) == 1
+            assert wiki.tag_counts()
+        assert not update.called
+        page = wiki.get_bare('new')
+        page.title = u'New'
+        page.body = u'Content\n'
+        page.save()
+        assert len(wiki.index()) == 2
+        wiki._scanned -= 60
+        assert len(wiki.index()) == 3
+
     def test_move(self):
         """
             Assert that pages are moved correctly, including URL sanitization.
@@ -307,3 +687,392 @@ class WikiTestCase(WikiBaseTestCase):
         assert self.wiki.move('test_2', 'Test 3') == "test_3"
         assert self.wiki.exists('test_3')
         assert not self.wiki.exists('test_2')
+
+
+class QueryTestCase(WikiBaseTestCase):
+    """
+        Contains various tests for the full-text search of the
+        :class:`~wiki.core.Wiki` class.
+    """
+
+    def setUp(self):
+        super(QueryTestCase, self).setUp()
+        self.create_file('python.md', u"title: Python\ntags: language\n\n"
+                         u"A programming language.\n")
+        self.create_file('snake.md', u"title: Snakes\ntags: animal\n\n"
+                         u"The python is a large snake, not a language.\n")
+        self.create_file('other.md', u"title: Other\n\nNothing here.\n")
+
+    def urls(self, query):
+        return [page.url for page in self.wiki.query(query)]
+
+    def test_ranking(self):
+        """
+            Assert all terms have to match and title matches rank
+            higher than body matches.
+        """
+        assert self.urls(u'python') == ['python', 'snake']
+        assert self.urls(u'python snake') == ['snake']
+        assert self.urls(u'missing') == []
+
+    def test_prefix(self):
+        """
+            Assert prefix queries match every term with that prefix.
+        """
+        assert self.urls(u'snak*') == ['snake']
+        assert sorted(self.urls(u'lang*')) == ['python', 'snake']
+
+    def test_phrase(self):
+        """
+            Assert phrase queries only match consecutive terms.
+        """
+        assert self.urls(u'"large snake"') == ['snake']
+        assert self.urls(u'"snake large"') == []
+        assert self.urls(u'"programming language"') == ['python']
+
+    def test_updated_on_write(self):
+        """
+            Assert saving, moving and deleting pages updates the
+            index.
+        """
+        self.wiki.index()
+        page = self.wiki.get('other')
+        page.body = u'A page about lizards.\n'
+        page.save()
+        with patch.object(self.wiki, 'update_index'):
+            assert self.urls(u'lizards') == ['other']
+            self.wiki.move('other', 'reptiles')
+            assert self.urls(u'lizards') == ['reptiles']
+            self.wiki.delete('reptiles')
+            assert self.urls(u'lizards') == []
+
+
+class TagIndexTestCase(WikiBaseTestCase):
+    """
+        Contains various tests for the tag index of the
+        :class:`~wiki.core.Wiki` class.
+    """
+
+    def setUp(self):
+        super(TagIndexTestCase, self).setUp()
+        self.create_file('one.md', u"title: One\ntags: py, web\n\nOne\n")
+        self.create_file('two.md', u"title: Two\ntags: python\n\nTwo\n")
+
+    def test_tag_counts(self):
+        """
+            Assert all tags are counted.
+        """
+        assert self.wiki.tag_counts() == {'py': 1, 'web': 1, 'python': 1}
+        tags = self.wiki.get_tags()
+        assert [page.url for page in tags['python']] == ['two']
+
+    def test_exact_match(self):
+        """
+            Assert tags are matched exactly and not as substrings.
+        """
+        assert [page.url for page in self.wiki.index_by_tag('py')] == ['one']
+        assert self.wiki.index_by_tag('pyt') == []
+
+    def test_updated_on_save(self):
+        """
+            Assert the tag index is updated when a page is saved.
+        """
+        self.wiki.index()
+        page = self.wiki.get('two')
+        page.tags = u'py, snake'
+        page.save()
+        with patch.object(self.wiki, 'update_index'):
+            assert self.wiki.tag_counts() == {'py': 2, 'web': 1, 'snake': 1}
+            assert [page.url for page in self.wiki.index_by_tag('py')] == \
+                ['one', 'two']
+
+
+class LinkGraphTestCase(WikiBaseTestCase):
+    """
+        Contains various tests for the link graph of the
+        :class:`~wiki.core.Wiki` class.
+    """
+
+    def setUp(self):
+        super(LinkGraphTestCase, self).setUp()
+        self.create_file('home.md', u"title: Home\n\n[[One]] and [[Missing]]\n")
+        self.create_file('one.md', u"title: One\n\n[[sub/two|Two]], [[one]]\n")
+        self.create_file('sub/two.md', u"title: Two\n\ntext\n")
+        self.create_file('lonely.md', u"title: Lonely\n\n[[one]]\n")
+
+    def test_links(self):
+        """
+            Assert outgoing and incoming links are known without
+            rendering any page.
+        """
+        with patch.object(Processor, 'process') as process:
+            assert self.wiki.links('home') == ['missing', 'one']
+            assert [page.url for page in self.wiki.backlinks('one')] == \
+                ['home', 'lonely', 'one']
+            assert [page.url for page in self.wiki.backlinks('missing')] == \
+                ['home']
+        assert not process.called
+
+    def test_reports(self):
+        """
+            Assert broken links and orphans are found.
+        """
+        assert [(page.url, target) for page, target
+                in self.wiki.broken_links()] == [('home', 'missing')]
+        assert [page.url for page in self.wiki.orphans()] == ['lonely']
+
+    def test_links_in_code(self):
+        """
+            Assert wikilinks in code spans and fenced blocks are no
+            links.
+        """
+        self.create_file('code.md', u"title: Code\n\nUse `[[target]]` or "
+                                    u"``[[one]]``:\n\n```\n[[example/page]]"
+                                    u"\n```\n\n[[sub/two]]\n")
+        assert self.wiki.links('code') == ['sub/two']
+        assert [(page.url, target) for page, target
+                in self.wiki.broken_links()] == [('home', 'missing')]
+
+    def test_updated_on_change(self):
+        """
+            Assert the link graph follows saves, moves and deletes.
+        """
+        self.wiki.index()
+        page = self.wiki.get('lonely')
+        page.body = u'[[missing]]\n'
+        page.save()
+        with patch.object(self.wiki, 'update_index'):
+            assert [page.url for page in self.wiki.backlinks('missing')] == \
+                ['home', 'lonely']
+            assert [page.url for page in self.wiki.backlinks('one')] == \
+                ['home', 'one']
+        self.wiki.move('sub/two', 'missing', rewrite_links=False)
+        with patch.object(self.wiki, 'update_index'):
+            assert [(page.url, target) for page, target
+                    in self.wiki.broken_links()] == [('one', 'sub/two')]
+            assert [page.url for page in self.wiki.orphans()] == ['lonely']
+        self.wiki.delete('lonely')
+        with patch.object(self.wiki, 'update_index'):
+            assert [page.url for page in self.wiki.backlinks('missing')] == \
+                ['home']
+
+
+class MoveTestCase(WikiBaseTestCase):
+    """
+        Contains various tests for moving pages and subtrees.
+    """
+
+    def setUp(self):
+        super(MoveTestCase, self).setUp()
+        self.create_file('home.md', u"title: Home\n\n[[docs]], [[Docs/One]] "
+                                    u"and [[docs/two|the second]]\n")
+        self.create_file('docs.md', u"title: Docs\n\n[[docs/one]]\n")
+        self.create_file('docs/one.md', u"title: One\n\n[[docs/two]]\n")
+        self.create_file('docs/two.md', u"title: Two\n\n[[home]]\n")
+        self.create_file('docs/image.png', u"png")
+        self.create_file('other.md', u"title: Other\n\n`[[docs/two]]`\n")
+
+    def read(self, name):
+        with open(os.path.join(self.rootdir, name), encoding='utf-8') as f:
+            return f.read()
+
+    def test_move_page(self):
+        """
+            Assert the links to a moved page are rewritten, keeping
+            their text.
+        """
+        assert self.wiki.move('docs/two', 'Second') == 'second'
+        assert self.read('home.md') == (
+            u"title: Home\n\n[[docs]], [[Docs/One]] and "
+            u"[[second|the second]]\n")
+        assert self.read('docs/one.md') == u"title: One\n\n[[second|docs/two]]\n"
+        assert self.wiki.broken_links() == []
+
+    def test_move_subtree(self):
+        """
+            Assert a page is moved together with all the files below
+            it, and the index is updated without a scan.
+        """
+        self.wiki.index()
+        with patch.object(self.wiki, 'update_index'):
+            self.wiki.move('docs', 'manual', subtree=True)
+            assert sorted(page.url for page in self.wiki.index()) == \
+                ['home', 'manual', 'manual/one', 'manual/two', 'other']
+            assert self.wiki.broken_links() == []
+            assert [page.url for page in self.wiki.backlinks('manual/two')] \
+                == ['home', 'manual/one']
+        assert not os.path.exists(os.path.join(self.rootdir, 'docs'))
+        assert self.read('manual/image.png') == u'png'
+        assert self.read('manual.md') == \
+            u"title: Docs\n\n[[manual/one|docs/one]]\n"
+        assert self.read('other.md') == u"title: Other\n\n`[[docs/two]]`\n"
+        assert self.read('manual/one.md') == \
+            u"title: One\n\n[[manual/two|docs/two]]\n"
+
+    def test_rollback(self):
+        """
+            Assert nothing changes if the batch fails.
+        """
+        before = self.read('home.md')
+        calls = []
+
+        def failing(path, data):
+            calls.append(path)
+            if len(calls) == 2:
+                raise OSError()
+            atomic_write(path, data)
+
+        with patch('wiki.storage.atomic_write', side_effect=failing):
+            with pytest.raises(OSError):
+                self.wiki.move('docs', 'manual', subtree=True)
+        assert os.path.exists(os.path.join(self.rootdir, 'docs', 'one.md'))
+        assert not os.path.exists(os.path.join(self.rootdir, 'manual.md'))
+        assert self.read('home.md') == before
+
+    def test_exists(self):
+        """
+            Assert existing pages are not overwritten, and pages are
+            not moved into themselves.
+        """
+        with pytest.raises(RuntimeError):
+            self.wiki.move('docs/one', 'other')
+        with pytest.raises(RuntimeError):
+            self.wiki.move('missing', 'somewhere')
+        with pytest.raises(RuntimeError):
+            self.wiki.move('docs', 'docs/sub', subtree=True)
+        with pytest.raises(RuntimeError):
+            self.wiki.move('docs', 'Docs')
+
+
+class CrashRecoveryTestCase(WikiBaseTestCase):
+    """
+        Contains various tests for the atomic writes and the journal
+        of the :class:`~wiki.core.Wiki` class.
+    """
+
+    def test_save_is_atomic(self):
+        """
+            Assert a failed write leaves the old page and no temporary
+            files behind.
+        """
+        self.create_file('test.md', PAGE_CONTENT)
+        page = self.wiki.get('test')
+        page.body = u'Changed'
+        with patch('wiki.files.os.replace', side_effect=OSError()):
+            with pytest.raises(OSError):
+                page.save()
+        assert [name for name in os.listdir(self.rootdir)
+                if name.startswith('.test.md')] == []
+        assert self.wiki.get('test').body.strip() == \
+            PAGE_CONTENT.split(u'\n\n', 1)[1].strip()
+
+    @pytest.mark.skipif(os.name == 'nt', reason='no file modes')
+    def test_save_keeps_mode(self):
+        """
+            Assert saved pages keep their mode, and new pages get the
+            mode of the umask instead of a private one.
+        """
+        path = self.create_file('test.md', PAGE_CONTENT)
+        os.chmod(path, 0o644)
+        page = self.wiki.get('test')
+        page.body = u'Changed'
+        page.save()
+        assert os.stat(path).st_mode & 0o777 == 0o644
+        page = self.wiki.get_bare('new')
+        page.title = u'New'
+        page.body = u'Content\n'
+        page.save()
+        assert os.stat(os.path.join(self.rootdir, 'new.md')).st_mode \
+            & 0o777 == 0o666 & ~UMASK
+
+    def test_journal(self):
+        """
+            Assert completed changes leave an empty journal.
+        """
+        page = self.wiki.get_bare('test')
+        page.title = u'Test'
+        page.body = u'Content\n'
+        page.save()
+        self.wiki.move('test', 'moved')
+        self.wiki.delete('moved')
+        assert self.wiki.journal.pending() == {}
+        assert os.path.getsize(self.wiki.journal.path) == 0
+
+    def test_recover(self):
+        """
+            Assert an interrupted change is replayed into the index.
+        """
+        self.create_file('test.md', PAGE_CONTENT)
+        assert [page.url for page in self.wiki.index()] == ['test']
+        # a crash after the files changed, before the index did
+        self.wiki.journal.begin(['test', 'moved'])
+        os.rename(os.path.join(self.rootdir, 'test.md'),
+                  os.path.join(self.rootdir, 'moved.md'))
+        with patch.object(self.wiki, 'update_index'):
+            assert [page.url for page in self.wiki.index()] == ['test']
+            assert self.wiki.recover() == ['moved', 'test']
+            assert [page.url for page in self.wiki.index()] == ['moved']
+        assert self.wiki.journal.pending() == {}
+
+    def test_partial_record(self):
+        """
+            Assert a record cut off by a crash is ignored.
+        """
+        change = self.wiki.journal.begin(['test'])
+        with open(self.wiki.journal.path, 'ab') as f:
+            f.write(b'{"id": "cut')
+        assert list(self.wiki.journal.pending()) == [change]
+
+    def test_readers_do_not_wait(self):
+        """
+            Assert the index scan is skipped while a writer holds the
+            lock.
+        """
+        with patch.object(self.wiki, '_update_index') as update:
+            with self.wiki.changing(['test']):
+                thread = threading.Thread(target=self.wiki.update_index)
+                thread.start()
+                thread.join(5)
+                assert not thread.is_alive()
+                assert not update.called
+            self.wiki.update_index()
+            assert update.called
+
+
+class BuildIndexTestCase(WikiBaseTestCase):
+    """
+        Contains various tests for the parallel index build of the
+        :class:`~wiki.core.Wiki` class.
+    """
+
+    def setUp(self):
+        super(BuildIndexTestCase, self).setUp()
+        self.create_file('test.md', PAGE_CONTENT)
+        self.create_file('one/two.md', u'title: Two\n\n```python\nx = 1\n```\n')
+        self.create_file('invalid.md', PAGE_CONTENT_INVALID)
+        self._wiki = Wiki(self.rootdir, render_cache=RenderCache())
+
+    def test_parallel_build(self):
+        """
+            Assert a parallel build indexes and renders all pages.
+        """
+        assert self.wiki.build_index(jobs=2, batch=1) == 3
+        assert self.wiki.render_cache.stats()['entries'] == 2
+        with patch.object(self.wiki, 'read_entry') as read:
+            pages = self.wiki.index()
+        assert not read.called
+        assert [page.url for page in pages] == ['test', 'one/two']
+        assert pages[0].html == CONTENT_HTML
+        assert self.wiki.render_cache.stats()['hits'] == 1
+
+    def test_incremental_build(self):
+        """
+            Assert only changed files are processed again unless a
+            full build is requested.
+        """
+        assert self.wiki.build_index(jobs=1) == 3
+        assert self.wiki.build_index(jobs=1) == 0
+        os.remove(os.path.join(self.rootdir, 'test.md'))
+        assert self.wiki.build_index(jobs=1) == 0
+        assert [page.url for page in self.wiki.index()] == ['one/two']
+        assert self.wiki.build_index(jobs=1, full=True) == 2
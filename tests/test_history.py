@@ -0,0 +1,184 @@
+from io import open
+import shutil
+from tempfile import mkdtemp
+from unittest import TestCase
+
+from wiki.core import Wiki
+from wiki.history import History
+from wiki.history import OFFSET
+
+from . import CONFIGURATION
+from . import WikiBaseTestCase
+
+
+class HistoryTestCase(TestCase):
+    """
+        Contains various tests for the
+        :class:`~wiki.history.History` class.
+    """
+
+    def setUp(self):
+        self.folder = mkdtemp()
+        self.history = History(self.folder)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_revisions(self):
+        """
+            Assert revisions are numbered and listed newest first.
+        """
+        for number in range(1, 6):
+            revision = self.history.append(
+                u'test', u'version %d' % number, author=u'me')
+            assert revision.number == number
+        assert self.history.count(u'test') == 5
+        revisions = self.history.revisions(u'test', 2)
+        assert [revision.number for revision in revisions] == [5, 4]
+        assert revisions[0].author == u'me'
+        assert [revision.number for revision in
+                self.history.revisions(u'test', 2, before=2)] == [1]
+        assert self.history.content(u'test', 3) == u'version 3'
+        assert self.history.revision(u'test', 6) is None
+        assert self.history.revisions(u'missing') == []
+
+    def test_unchanged(self):
+        """
+            Assert saving the same content twice records one revision.
+        """
+        self.history.append(u'test', u'same')
+        self.history.append(u'test', u'same')
+        assert self.history.count(u'test') == 1
+        self.history.append(u'test', u'', deleted=True)
+        assert self.history.revision(u'test', 2).deleted
+
+    def test_repair(self):
+        """
+            Assert a record without its offset is indexed, and a
+            record cut off by a crash is dropped.
+        """
+        self.history.append(u'test', u'one')
+        self.history.append(u'test', u'two')
+        log, idx = self.history.paths(u'test')
+        with open(idx, 'rb+') as f:
+            f.truncate(OFFSET.size + 3)
+        with open(log, 'ab') as f:
+            f.write(b'{"number": 3, "size": 1000')
+        assert self.history.append(u'test', u'three').number == 3
+        assert [self.history.content(u'test', number)
+                for number in (1, 2, 3)] == [u'one', u'two', u'three']
+
+    def test_move(self):
+        """
+            Assert the history moves with a page, and is appended to
+            an existing one.
+        """
+        self.history.append(u'one', u'first')
+        self.history.move(u'one', u'two')
+        assert self.history.count(u'one') == 0
+        assert self.history.content(u'two', 1) == u'first'
+        self.history.append(u'three', u'third')
+        self.history.move(u'two', u'three')
+        assert self.history.count(u'two') == 0
+        assert [self.history.content(u'three', number)
+                for number in (1, 2)] == [u'third', u'first']
+
+
+class WikiHistoryTestCase(WikiBaseTestCase):
+    """
+        Contains various tests for the history kept by the
+        :class:`~wiki.core.Wiki` class.
+    """
+
+    def setUp(self):
+        super(WikiHistoryTestCase, self).setUp()
+        self.create_file(u'test.md', u'title: Test\n\nfirst\n')
+        self.create_file(u'other.md', u'title: Other\n\n[[test]]\n')
+        self._wiki = Wiki(self.rootdir, history=True)
+
+    def test_save(self):
+        """
+            Assert saves are recorded, after the source the page had
+            before.
+        """
+        page = self.wiki.get(u'test')
+        page.body = u'second\n'
+        page.save(author=u'me', message=u'Changed')
+        history = self.wiki.history
+        assert [(revision.author, revision.message) for revision in
+                history.revisions(u'test')] == [
+            (u'me', u'Changed'), (None, u'Imported')]
+        assert history.content(u'test', 1) == u'title: Test\n\nfirst\n'
+        assert history.content(u'test', 2) == \
+            u'title: Test\n\nsecond\n'
+
+    def test_move_and_delete(self):
+        """
+            Assert the history follows moved pages, records rewritten
+            links and deletions.
+        """
+        page = self.wiki.get(u'test')
+        page.save()
+        self.wiki.move(u'test', u'moved')
+        history = self.wiki.history
+        assert history.count(u'test') == 0
+        assert history.count(u'moved') == 1
+        assert history.content(u'other', 2) == \
+            u'title: Other\n\n[[moved|test]]\n'
+        self.wiki.delete(u'moved', author=u'me')
+        assert history.revision(u'moved', 2).deleted
+
+
+class HistoryWebTestCase(WikiBaseTestCase):
+    """
+        Test cases around the history routes.
+    """
+
+    config_content = CONFIGURATION + u"HISTORY=True\nHISTORY_PAGE_SIZE=2\n"
+
+    def setUp(self):
+        super(HistoryWebTestCase, self).setUp()
+        self.create_file(u'test.md', u'title: Test\n\nrevision 0\n')
+        app = self.app.application
+        with app.app_context():
+            wiki = app.extensions['wiki']
+            for number in range(1, 4):
+                page = wiki.get(u'test')
+                page.body = u'revision %d\n' % number
+                page.save(message=u'Change %d' % number)
+
+    def test_history(self):
+        """
+            Assert the latest revisions are listed, older ones on the
+            next page.
+        """
+        html = self.app.get(u'/history/test/').get_data(as_text=True)
+        assert u'Change 3' in html and u'Change 2' in html
+        assert u'Change 1' not in html
+        assert u'before=3' in html
+        html = self.app.get(u'/history/test/?before=3').get_data(
+            as_text=True)
+        assert u'Change 1' in html and u'Imported' in html
+        assert u'/history/test/' in \
+            self.app.get(u'/test/').get_data(as_text=True)
+        assert self.app.get(u'/history/missing/').status_code == 404
+
+    def test_diff(self):
+        """
+            Assert the diff shows the changes of a revision.
+        """
+        html = self.app.get(u'/diff/test/').get_data(as_text=True)
+        assert u'<del>-revision 2</del>' in html
+        assert u'<ins>+revision 3</ins>' in html
+        html = self.app.get(u'/diff/test/?old=1&new=4').get_data(
+            as_text=True)
+        assert u'-revision 0' in html and u'+revision 3' in html
+        assert self.app.get(u'/diff/test/?new=9').status_code == 404
+
+    def test_disabled(self):
+        """
+            Assert the routes are missing without a history.
+        """
+        self.create_file(u'config.py', CONFIGURATION)
+        self._app = None
+        assert self.app.get(u'/history/test/').status_code == 404
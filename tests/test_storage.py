@@ -0,0 +1,247 @@
+import os
+import pickle
+import shutil
+from tempfile import mkdtemp
+from unittest import TestCase
+
+import pytest
+
+from wiki.core import Wiki
+from wiki.storage import create_storage
+from wiki.storage import FileStorage
+from wiki.storage import MemoryStorage
+from wiki.storage import SQLiteStorage
+
+from . import WikiBaseTestCase
+
+
+class StorageTests(object):
+    """
+        The tests every storage has to pass, mixed into a test case
+        per storage.
+    """
+
+    def setUp(self):
+        self.folder = mkdtemp()
+        self.storage = self.create()
+
+    def tearDown(self):
+        self.storage.close()
+        shutil.rmtree(self.folder)
+
+    def test_read_write(self):
+        """
+            Assert pages are written, read and replaced, and every
+            write changes the stat.
+        """
+        assert self.storage.stat(u'one') is None
+        with pytest.raises(FileNotFoundError):
+            self.storage.read(u'one')
+        self.storage.write(u'one', u'first')
+        stat = self.storage.stat(u'one')
+        assert stat.st_size == 5
+        assert self.storage.read(u'one') == b'first'
+        self.storage.write(u'one', b'again')
+        assert self.storage.read(u'one') == b'again'
+        assert self.storage.stat(u'one') != stat
+        self.storage.delete(u'one')
+        assert not self.storage.exists(u'one')
+        with pytest.raises(FileNotFoundError):
+            self.storage.delete(u'one')
+
+    def test_walk(self):
+        """
+            Assert all pages, or the ones below a url, are listed.
+        """
+        for url in (u'a', u'a/b', u'a/b/c', u'ab', u'b'):
+            self.storage.write(url, url)
+        assert sorted(url for url, _ in self.storage.walk()) == \
+            [u'a', u'a/b', u'a/b/c', u'ab', u'b']
+        assert sorted(url for url, _ in self.storage.walk(u'a')) == \
+            [u'a/b', u'a/b/c']
+        assert self.storage.is_folder(u'a')
+        assert not self.storage.is_folder(u'ab')
+
+    def test_rename(self):
+        """
+            Assert pages and folders are renamed.
+        """
+        for url in (u'a', u'a/b', u'a/b/c', u'ab'):
+            self.storage.write(url, url)
+        self.storage.rename(u'a', u'x')
+        self.storage.rename_folder(u'a', u'x')
+        assert sorted(url for url, _ in self.storage.walk()) == \
+            [u'ab', u'x', u'x/b', u'x/b/c']
+        assert self.storage.read(u'x/b/c') == b'a/b/c'
+        with pytest.raises(FileNotFoundError):
+            self.storage.rename(u'a', u'y')
+
+
+class FileStorageTestCase(StorageTests, TestCase):
+    """
+        Contains the storage tests for the
+        :class:`~wiki.storage.FileStorage` class.
+    """
+
+    def create(self):
+        return FileStorage(self.folder, exclude=['.wiki'])
+
+    def test_files(self):
+        """
+            Assert pages are markdown files, the excluded folders are
+            not walked.
+        """
+        self.storage.write(u'a/b', u'b')
+        assert os.path.exists(os.path.join(self.folder, 'a', 'b.md'))
+        os.makedirs(os.path.join(self.folder, '.wiki'))
+        with open(os.path.join(self.folder, '.wiki', 'c.md'), 'w'):
+            pass
+        assert [url for url, _ in self.storage.walk()] == [u'a/b']
+
+    def test_unclean_names(self):
+        """
+            Assert files whose names are not clean urls are read and
+            written through the path they were found at.
+        """
+        for name in ('Foo.md', 'My Page.md', os.path.join('Docs', 'A.md')):
+            folder = os.path.dirname(os.path.join(self.folder, name))
+            if not os.path.exists(folder):
+                os.makedirs(folder)
+            with open(os.path.join(self.folder, name), 'w') as f:
+                f.write(name)
+        assert sorted(url for url, _ in self.storage.walk()) == \
+            [u'docs/a', u'foo', u'my_page']
+        assert self.storage.read(u'my_page') == b'My Page.md'
+        assert self.storage.stat(u'docs/a') is not None
+        self.storage.write(u'foo', u'changed')
+        with open(os.path.join(self.folder, 'Foo.md')) as f:
+            assert f.read() == u'changed'
+        self.storage.delete(u'foo')
+        assert not self.storage.exists(u'foo')
+
+    def test_unclean_names_found(self):
+        """
+            Assert files whose names are not clean urls are found
+            without a walk, e.g. after a restart.
+        """
+        os.makedirs(os.path.join(self.folder, 'My Docs'))
+        with open(os.path.join(self.folder, 'My Docs', 'Intro.md'), 'w') as f:
+            f.write(u'intro')
+        assert self.storage.read(u'my_docs/intro') == b'intro'
+        assert self.storage.is_folder(u'my_docs')
+        assert [url for url, _ in self.storage.walk(u'my_docs')] == \
+            [u'my_docs/intro']
+        self.storage.rename_folder(u'my_docs', u'docs')
+        assert self.storage.read(u'docs/intro') == b'intro'
+        assert not self.storage.exists(u'my_docs/intro')
+        self.storage.write(u'my_docs/intro', u'new')
+        assert os.path.exists(
+            os.path.join(self.folder, 'my_docs', 'intro.md'))
+
+
+class WikiUncleanNamesTestCase(WikiBaseTestCase):
+    """
+        Contains tests for content directories with files whose names
+        are not clean urls.
+    """
+
+    def test_index(self):
+        """
+            Assert such pages are indexed, read and kept by the
+            watcher scan.
+        """
+        self.create_file(u'low.md', u'title: Low\n\n[[my_page]]\n')
+        self.create_file(u'My Page.md', u'title: Mine\n\ntext\n')
+        self.create_file(u'Foo.md', u'title: Foo\n\ntags: x\n')
+        assert sorted(page.url for page in self.wiki.index()) == \
+            [u'foo', u'low', u'my_page']
+        assert self.wiki.get(u'my_page').title == u'Mine'
+        assert [page.url for page in self.wiki.backlinks(u'my_page')] == \
+            [u'low']
+        assert self.wiki.broken_links() == []
+        self.wiki.refresh([os.path.join(self.rootdir, u'My Page.md')])
+        assert self.wiki.exists(u'my_page')
+        assert len(self.wiki.index()) == 3
+
+    def test_display(self):
+        """
+            Assert such pages are shown by a fresh app, before the
+            content directory was walked.
+        """
+        self.create_file(u'My Page.md', u'title: Mine\n\ntext\n')
+        assert self.app.get(u'/my_page/').status_code == 200
+
+
+class SQLiteStorageTestCase(StorageTests, TestCase):
+    """
+        Contains the storage tests for the
+        :class:`~wiki.storage.SQLiteStorage` class.
+    """
+
+    def create(self):
+        return SQLiteStorage(os.path.join(self.folder, 'pages.db'))
+
+    def test_pickle(self):
+        """
+            Assert a storage sent to a worker process opens its own
+            connection.
+        """
+        self.storage.write(u'one', u'first')
+        copy = pickle.loads(pickle.dumps(self.storage))
+        assert copy.read(u'one') == b'first'
+        copy.close()
+
+
+class MemoryStorageTestCase(StorageTests, TestCase):
+    """
+        Contains the storage tests for the
+        :class:`~wiki.storage.MemoryStorage` class.
+    """
+
+    def create(self):
+        return MemoryStorage()
+
+
+class WikiStorageTestCase(WikiBaseTestCase):
+    """
+        Contains various tests for wikis kept in other storages than
+        the content directory.
+    """
+
+    def test_wiki(self):
+        """
+            Assert pages are saved, listed, searched, moved and deleted
+            without touching the content directory.
+        """
+        for name in ('sqlite', 'memory'):
+            storage = create_storage(name, self.rootdir)
+            wiki = Wiki(self.rootdir, storage=storage)
+            for url in (u'docs', u'docs/one', u'home'):
+                page = wiki.get_bare(url)
+                page.title = url.title()
+                page.body = u'See [[docs/one]]\n'
+                page.save()
+            assert [page.url for page in wiki.index()] == \
+                [u'docs', u'docs/one', u'home']
+            assert wiki.get(u'docs/one').body == u'See [[docs/one]]\n'
+            wiki.move(u'docs', u'manual', subtree=True)
+            assert sorted(page.url for page in wiki.index()) == \
+                [u'home', u'manual', u'manual/one']
+            assert wiki.get(u'home').body == \
+                u'See [[manual/one|docs/one]]\n'
+            assert [page.url for page in wiki.search(u'see')]
+            assert wiki.delete(u'home')
+            assert not wiki.exists(u'home')
+            assert wiki.build_index(jobs=2, batch=1, full=True) == 2
+            wiki.page_index.close()
+            storage.close()
+            os.remove(os.path.join(self.rootdir, '.wiki', 'index.db'))
+        assert not [name for name in os.listdir(self.rootdir)
+                    if name.endswith('.md')]
+
+    def test_unknown(self):
+        """
+            Assert unknown storages are rejected.
+        """
+        with pytest.raises(ValueError):
+            create_storage('cloud', self.rootdir)
@@ -0,0 +1,134 @@
+import os
+import sys
+
+from wiki.core import Processor
+from wiki.typeset import CommandTypesetter
+from wiki.typeset import MathRenderer
+from wiki.typeset import StandInTypesetter
+from wiki.typeset import TypesetError
+from wiki.typeset import create_renderer
+from wiki.web.caching import template_version
+
+from . import CONFIGURATION
+from . import WikiBaseTestCase
+
+
+class CountingTypesetter(StandInTypesetter):
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, tex, display=False):
+        self.calls.append((tex, display))
+        if tex == u'fail':
+            raise TypesetError(tex)
+        return super(CountingTypesetter, self).__call__(tex, display)
+
+
+class MathRendererTestCase(WikiBaseTestCase):
+    """
+        Test cases around the server-side math rendering.
+    """
+
+    def test_render(self):
+        """
+            Assert inline and display math is replaced with SVG.
+        """
+        renderer = MathRenderer(StandInTypesetter())
+        html = Processor(
+            u'a: b\n\nInline \\(x < 2\\) and\n\n$$y^2$$\n').process()[0]
+        html = renderer(html)
+        assert u'<script' not in html
+        assert u'<span class="math"><svg' in html
+        assert u'class="math display"' in html
+        assert u'x &lt; 2' in html
+
+    def test_cache(self):
+        """
+            Assert formulas are typeset once, also across restarts.
+        """
+        folder = os.path.join(self.rootdir, 'math')
+        typesetter = CountingTypesetter()
+        renderer = MathRenderer(typesetter, folder)
+        html = u'<script type="math/tex">x</script>' * 3
+        assert renderer(html) == renderer(html)
+        assert typesetter.calls == [(u'x', False)]
+
+        other = MathRenderer(typesetter, folder)
+        assert other(html) == renderer(html)
+        assert len(typesetter.calls) == 1
+
+    def test_error(self):
+        """
+            Assert formulas that fail are left to the browser.
+        """
+        renderer = MathRenderer(CountingTypesetter())
+        html = u'<script type="math/tex">fail</script>'
+        assert renderer(html) == html
+
+
+class CommandTypesetterTestCase(WikiBaseTestCase):
+    """
+        Contains tests for the
+        :class:`~wiki.typeset.CommandTypesetter` class.
+    """
+
+    #: prints its arguments like an svg, fails on unknown options
+    SCRIPT = (
+        u"import sys\n"
+        u"args = sys.argv[1:]\n"
+        u"if args[0] == '--inline':\n"
+        u"    args = args[1:]\n"
+        u"if args[0] != '--':\n"
+        u"    sys.exit('unknown option: %s' % args[0])\n"
+        u"print('<svg>%s</svg>' % args[1])\n")
+
+    def test_dash(self):
+        """
+            Assert formulas starting with a dash are no options.
+        """
+        script = self.create_file(u'tex2svg.py', self.SCRIPT)
+        typesetter = CommandTypesetter([sys.executable, script])
+        assert typesetter(u'-x^2', display=True) == u'<svg>-x^2</svg>'
+        assert typesetter(u'--y') == u'<svg>--y</svg>'
+
+
+class MathPageTestCase(WikiBaseTestCase):
+    """
+        Test cases around math in the web interface.
+    """
+
+    config_content = CONFIGURATION + u"MATH_RENDERER='standin'\n"
+
+    def test_server_side(self):
+        """
+            Assert rendered math does not load tex-svg.js.
+        """
+        self.create_file(u'math.md', u'title: Math\n\n\\(x^2\\)\n')
+        self.create_file(u'plain.md', u'title: Plain\n\ntext\n')
+        html = self.app.get('/math/').get_data(as_text=True)
+        assert u'math-standin' in html
+        assert u'tex-svg' not in html
+        html = self.app.get('/plain/').get_data(as_text=True)
+        assert u'tex-svg' not in html
+
+    def test_client_side(self):
+        """
+            Assert single dollar math still loads tex-svg.js.
+        """
+        self.create_file(u'dollar.md', u'title: Dollar\n\n$x^2$\n')
+        html = self.app.get('/dollar/').get_data(as_text=True)
+        assert u'tex-svg' in html
+
+    def test_template_version(self):
+        """
+            Assert changing the math renderer changes the version of
+            the pages.
+        """
+        app = self.app.application
+        version = template_version(app)
+        app.extensions['math'] = create_renderer(
+            'command', command=('tex2svg', '--inline'))
+        assert template_version(app) != version
+        del app.extensions['math']
+        assert template_version(app) != version
@@ -0,0 +1,69 @@
+import os
+
+from mock import patch
+
+from wiki.core import Wiki
+from wiki.watcher import PollingWatcher
+from wiki.watcher import create_watcher
+
+from . import WikiBaseTestCase
+
+
+class PollingWatcherTestCase(WikiBaseTestCase):
+    """
+        Contains various tests for the
+        :class:`~wiki.watcher.PollingWatcher` class.
+    """
+
+    def setUp(self):
+        super(PollingWatcherTestCase, self).setUp()
+        self.create_file('one.md', u"title: One\ntags: a\n\nOne\n")
+        self._wiki = Wiki(self.rootdir, watched=True)
+        self.watcher = PollingWatcher(self.wiki, interval=0)
+        self.watcher.prepare()
+        self.wiki.update_index()
+
+    def titles(self):
+        return [page.title for page in self.wiki.index()]
+
+    def test_reads_do_not_scan(self):
+        """
+            Assert a watched wiki does not scan on reads.
+        """
+        with patch.object(self.wiki, 'update_index') as update:
+            assert self.titles() == [u'One']
+        assert not update.called
+
+    def test_changes_are_batched(self):
+        """
+            Assert created, modified and deleted files are picked up
+            in one batch.
+        """
+        self.create_file('two.md', u"title: Two\ntags: b\n\nTwo\n")
+        self.create_file('one.md', u"title: Uno\ntags: b\n\nUno!\n")
+        with patch.object(self.wiki, 'refresh',
+                          wraps=self.wiki.refresh) as refresh:
+            changed = self.watcher.check()
+        assert refresh.call_count == 1
+        assert len(changed) == 2
+        assert self.titles() == [u'Two', u'Uno']
+        assert self.wiki.tag_counts() == {'b': 2}
+
+        os.remove(os.path.join(self.rootdir, 'two.md'))
+        self.watcher.check()
+        assert self.titles() == [u'Uno']
+
+    def test_ignores_state_folder(self):
+        """
+            Assert nothing changes when only the index changed.
+        """
+        assert self.watcher.check() == set()
+
+    def test_thread(self):
+        """
+            Assert the watcher can be started and stopped.
+        """
+        watcher = create_watcher(self.wiki, interval=0.01, polling=True)
+        watcher.start()
+        watcher.stop()
+        assert isinstance(watcher, PollingWatcher)
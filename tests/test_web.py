@@ -1,3 +1,20 @@
+import gzip
+from io import open
+import os
+from threading import Thread
+
+from mock import patch
+
+from wiki.files import UMASK
+from wiki.web import get_users
+from wiki.web import get_wiki
+from wiki.web.assets import _gzip
+from wiki.web.build import MANIFEST
+from wiki.web.build import StaticBuilder
+from wiki.web.caching import conditional
+from wiki.web.user import UserManager
+
+from . import CONFIGURATION
 from . import WikiBaseTestCase
 
 
@@ -25,6 +42,481 @@ class WebContentTestCase(WikiBaseTestCase):
         assert rsp.status_code == 200
 
 
+class IndexTestCase(WikiBaseTestCase):
+    """
+        Test cases around the page index.
+    """
+
+    config_content = WikiBaseTestCase.config_content + u"INDEX_PAGE_SIZE=2\n"
+
+    def setUp(self):
+        super(IndexTestCase, self).setUp()
+        for name in (u'one', u'two', u'three'):
+            self.create_file(u'%s.md' % name, u'title: %s\n\ntext\n' % name)
+
+    def test_pagination(self):
+        """
+            Assert the index is split into pages linked by a cursor.
+        """
+        rsp = self.app.get('/index/')
+        assert b'/one/' in rsp.data and b'/three/' in rsp.data
+        assert b'/two/' not in rsp.data
+        assert b'?after=' in rsp.data
+
+        rsp = self.app.get('/index/?after=invalid')
+        assert rsp.status_code == 400
+
+    def test_stream(self):
+        """
+            Assert the whole index can be streamed.
+        """
+        rsp = self.app.get('/index/?stream=1')
+        assert rsp.is_streamed
+        data = rsp.get_data()
+        assert b'/one/' in data and b'/two/' in data and b'/three/' in data
+        assert b'?after=' not in data
+        # paginated again
+        assert b'?after=' in self.app.get('/index/?stream=0').data
+
+
+class ConditionalTestCase(WikiBaseTestCase):
+    """
+        Test cases around conditional requests.
+    """
+
+    # files are changed behind the back of the wiki
+    config_content = WikiBaseTestCase.config_content + \
+        u"CACHE_CONTROL='public, max-age=60'\nSCAN_INTERVAL=0\n"
+
+    def setUp(self):
+        super(ConditionalTestCase, self).setUp()
+        self.create_file(u'one.md', u'title: One\ntags: a\n\ntext\n')
+
+    def test_page(self):
+        """
+            Assert pages are only rendered again when they changed.
+        """
+        rsp = self.app.get('/one/')
+        assert rsp.status_code == 200
+        assert rsp.headers['Cache-Control'] == 'public, max-age=60'
+        assert rsp.last_modified is not None
+        etag = rsp.headers['ETag']
+        modified = rsp.headers['Last-Modified']
+
+        rsp = self.app.get('/one/', headers={'If-None-Match': etag})
+        assert rsp.status_code == 304
+        assert rsp.data == b''
+        rsp = self.app.get('/one/', headers={'If-Modified-Since': modified})
+        assert rsp.status_code == 304
+
+        self.create_file(u'one.md', u'title: One\n\nchanged\n')
+        rsp = self.app.get('/one/', headers={'If-None-Match': etag})
+        assert rsp.status_code == 200
+        assert rsp.headers['ETag'] != etag
+        assert self.app.get('/missing/').status_code == 404
+
+    def test_listings(self):
+        """
+            Assert the listings change with the page index.
+        """
+        for url in ('/index/', '/tags/', '/tag/a/'):
+            etag = self.app.get(url).headers['ETag']
+            rsp = self.app.get(url, headers={'If-None-Match': etag})
+            assert rsp.status_code == 304
+        self.create_file(u'two.md', u'title: Two\ntags: a\n\ntext\n')
+        for url in ('/index/', '/tags/', '/tag/a/'):
+            rsp = self.app.get(url, headers={'If-None-Match': etag})
+            assert rsp.status_code == 200
+
+
+class PrivateConditionalTestCase(WikiBaseTestCase):
+    """
+        Test cases around conditional requests of private wikis.
+    """
+
+    config_content = CONFIGURATION_PRIVATE
+
+    def test_private(self):
+        """
+            Assert responses of private wikis are not shared.
+        """
+        with self.app.application.test_request_context():
+            rsp = conditional(u'validator', None, lambda: u'html')
+        assert rsp.headers['Cache-Control'] == 'private, no-cache'
+        assert 'Cookie' in rsp.vary
+
+
+class LinkReportTestCase(WikiBaseTestCase):
+    """
+        Test cases around the link reports.
+    """
+
+    def setUp(self):
+        super(LinkReportTestCase, self).setUp()
+        self.create_file(u'one.md', u'title: One\n\n[[two]] [[gone]]\n')
+        self.create_file(u'two.md', u'title: Two\n\ntext\n')
+
+    def test_reports(self):
+        """
+            Assert the link reports list the right pages.
+        """
+        html = self.app.get('/backlinks/two/').get_data(as_text=True)
+        assert u'/one/' in html
+        html = self.app.get('/broken/').get_data(as_text=True)
+        assert u'/edit/gone/' in html
+        html = self.app.get('/orphans/').get_data(as_text=True)
+        assert u'/one/' in html and u'/two/' not in html
+        html = self.app.get('/two/').get_data(as_text=True)
+        assert u'/backlinks/two/' in html
+
+
+class AssetsTestCase(WikiBaseTestCase):
+    """
+        Test cases around the fingerprinted static files.
+    """
+
+    config_content = CONFIGURATION + u"ASSETS_COMPRESS=True\nGZIP_HTML=True\n"
+
+    def test_fingerprinted(self):
+        """
+            Assert pages link fingerprinted files, which are served
+            compressed and cached forever.
+        """
+        assets = self.app.application.extensions['assets']
+        name = assets.files['bootstrap.css']
+        assert name.startswith('bootstrap.') and name != 'bootstrap.css'
+        self.create_file(u'one.md', u'title: One\n\ntext\n')
+        html = self.app.get('/one/').get_data(as_text=True)
+        assert u'/assets/%s' % name in html
+
+        rsp = self.app.get('/assets/%s' % name,
+                           headers={'Accept-Encoding': 'gzip'})
+        assert rsp.status_code == 200
+        assert rsp.headers['Content-Encoding'] == 'gzip'
+        assert 'immutable' in rsp.headers['Cache-Control']
+        assert 'Accept-Encoding' in rsp.vary
+        assert rsp.mimetype == 'text/css'
+        with open(os.path.join(self.app.application.static_folder,
+                               'bootstrap.css'), 'rb') as f:
+            assert gzip.decompress(rsp.get_data()) == f.read()
+
+        rsp = self.app.get('/assets/%s' % name)
+        assert 'Content-Encoding' not in rsp.headers
+        assert self.app.get('/assets/bootstrap.css').status_code == 404
+
+    def test_gzip_stable(self):
+        """
+            Assert the compressed variants do not change between runs.
+        """
+        data = _gzip(b'body {}')
+        assert gzip.decompress(data) == b'body {}'
+        assert data[4:8] == b'\0\0\0\0'
+        assert _gzip(b'body {}') == data
+
+    def test_gzip_html(self):
+        """
+            Assert html is compressed for clients accepting it, and
+            their cached copies stay valid.
+        """
+        self.create_file(u'one.md', u'title: One\n\ntext\n')
+        rsp = self.app.get('/one/', headers={'Accept-Encoding': 'gzip'})
+        assert rsp.headers['Content-Encoding'] == 'gzip'
+        assert b'One' in gzip.decompress(rsp.get_data())
+        rsp = self.app.get('/one/', headers={
+            'Accept-Encoding': 'gzip', 'If-None-Match': rsp.headers['ETag']})
+        assert rsp.status_code == 304
+        rsp = self.app.get('/one/')
+        assert 'Content-Encoding' not in rsp.headers
+
+
+class StaticBuildTestCase(WikiBaseTestCase):
+    """
+        Test cases around the static build.
+    """
+
+    def setUp(self):
+        super(StaticBuildTestCase, self).setUp()
+        self.create_file(u'home.md', u'title: Home\ntags: a\n\n[[sub/page]]\n')
+        self.create_file(u'sub/page.md', u'title: Sub\ntags: a, b\n\ntext\n')
+        self.out = os.path.join(self.rootdir, 'out')
+        self.builder = StaticBuilder(self.app.application, self.out)
+
+    def read(self, *path):
+        with open(os.path.join(self.out, *path), encoding='utf-8') as f:
+            return f.read()
+
+    def test_build(self):
+        """
+            Assert pages, listings and static files are written.
+        """
+        assert self.builder.build(jobs=1) == (2, 0)
+        assert u"href='/sub/page/'" in self.read('index.html')
+        assert u'Sub' in self.read('sub', 'page', 'index.html')
+        assert u'/sub/page/' in self.read('index', 'index.html')
+        assert u'/tag/b/' in self.read('tags', 'index.html')
+        assert u'/sub/page/' in self.read('tag', 'b', 'index.html')
+        assert os.path.exists(os.path.join(self.out, 'static', 'bootstrap.css'))
+        assets = self.app.application.extensions['assets']
+        assert os.path.exists(os.path.join(
+            self.out, 'assets', assets.files['bootstrap.css']))
+        if os.name != 'nt':
+            # readable by the web server
+            for name in ('index.html', os.path.join('sub', 'page',
+                         'index.html'), MANIFEST):
+                mode = os.stat(os.path.join(self.out, name)).st_mode
+                assert mode & 0o777 == 0o666 & ~UMASK
+
+    def test_incremental(self):
+        """
+            Assert only changed pages are rendered again and deleted
+            pages are removed.
+        """
+        self.builder.build(jobs=1)
+        assert self.builder.build(jobs=1) == (0, 2)
+        self.create_file(u'home.md', u'title: Home\n\nchanged\n')
+        assert self.builder.build(jobs=1) == (1, 1)
+        os.remove(os.path.join(self.rootdir, 'sub', 'page.md'))
+        assert self.builder.build(jobs=1) == (0, 1)
+        assert not os.path.exists(
+            os.path.join(self.out, 'sub', 'page', 'index.html'))
+
+    def test_render_changed(self):
+        """
+            Assert the changed pages are rendered in parallel even if
+            their index entries are current already.
+        """
+        wiki = self.builder.wiki
+        wiki.build_index(jobs=1, render=False)
+        assert wiki.render_cache.stats()['entries'] == 0
+        with patch.object(wiki, 'render_pages',
+                          wraps=wiki.render_pages) as render_pages:
+            self.builder.build(jobs=2)
+            assert sorted(render_pages.call_args[0][0]) == \
+                [u'home', u'sub/page']
+            self.builder.build(jobs=2)
+            assert render_pages.call_args[0][0] == []
+        assert wiki.render_cache.stats()['entries'] == 2
+
+
+class EditConflictTestCase(WikiBaseTestCase):
+    """
+        Test cases around concurrent edits of a page.
+    """
+
+    config_content = CONFIGURATION + \
+        u"WTF_CSRF_ENABLED=False\nSECRET_KEY='test'\n"
+
+    def setUp(self):
+        super(EditConflictTestCase, self).setUp()
+        self.create_file(u'test.md', u'title: Test\n\nfirst\nline\n')
+
+    def version(self):
+        return self.app.get('/version/test/').get_json()['version']
+
+    def edit(self, body, **data):
+        data.update(title=u'Test', body=body, tags=u'')
+        return self.app.post('/edit/test/', data=data)
+
+    def test_save_current_version(self):
+        """
+            Assert a page saved over the version it was opened with is
+            written.
+        """
+        html = self.app.get('/edit/test/').get_data(as_text=True)
+        assert self.version() in html
+        rsp = self.edit(u'mine\n', version=self.version())
+        assert rsp.status_code == 302
+        assert b'mine' in self.app.get('/test/').data
+
+    def test_conflict(self):
+        """
+            Assert a page saved over an outdated version is rejected
+            with the changes of both sides.
+        """
+        self.app.get('/edit/test/')
+        base = self.version()
+        assert self.edit(u'theirs\nline\n', version=base).status_code == 302
+        with patch('wiki.core.Processor') as processor:
+            rsp = self.edit(u'mine\nline\n', version=base)
+            assert not processor.called
+        assert rsp.status_code == 409
+        html = rsp.get_data(as_text=True)
+        assert u'+theirs' in html and u'+mine' in html
+        assert u'-first' in html
+        # the editor now carries the current version
+        assert self.version() in html
+        assert self.edit(u'mine\n', version=self.version()).status_code \
+            == 302
+
+    def test_created_concurrently(self):
+        """
+            Assert creating a page that was created in the meantime
+            conflicts.
+        """
+        data = dict(title=u'New', body=u'mine', tags=u'', version=u'')
+        assert self.app.post('/edit/new/', data=data).status_code == 302
+        assert self.app.post('/edit/new/', data=data).status_code == 409
+
+    def test_without_version(self):
+        """
+            Assert clients that do not send a version still save.
+        """
+        assert self.edit(u'mine\n').status_code == 302
+
+    def test_version_polling(self):
+        """
+            Assert the version is answered conditionally and changes
+            with the page.
+        """
+        rsp = self.app.get('/version/test/')
+        again = self.app.get('/version/test/', headers={
+            'If-None-Match': rsp.headers['ETag']})
+        assert again.status_code == 304
+        self.edit(u'changed\n')
+        assert self.version() != rsp.get_json()['version']
+        assert self.app.get('/version/missing/').status_code == 404
+
+
+class AppScopeTestCase(WikiBaseTestCase):
+    """
+        Test cases around the lifecycle of the shared objects.
+    """
+
+    def test_shared_between_requests(self):
+        """
+            Assert all requests use the same wiki and user manager.
+        """
+        app = self.app.application
+        with app.test_request_context():
+            wiki, users = get_wiki(), get_users()
+        with app.test_request_context():
+            assert get_wiki() is wiki
+            assert get_users() is users
+
+    def test_concurrent_saves(self):
+        """
+            Assert pages saved from multiple threads all end up in the
+            index of the shared wiki.
+        """
+        app = self.app.application
+        with app.test_request_context():
+            wiki = get_wiki()
+
+        def save(number):
+            page = wiki.get_bare('page%d' % number)
+            page.title = u'Page %d' % number
+            page.body = u'Content\n'
+            page.save()
+
+        threads = [Thread(target=save, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(wiki.index()) == 8
+
+
+class UserManagerTestCase(WikiBaseTestCase):
+    """
+        Test cases around the :class:`~wiki.web.user.UserManager`.
+    """
+
+    def setUp(self):
+        super(UserManagerTestCase, self).setUp()
+        self.users = UserManager(self.rootdir)
+        self.users.add_user(u'name', u'secret',
+                            authentication_method='cleartext')
+
+    def test_cached_read(self):
+        """
+            Assert the file is only parsed again after it changed.
+        """
+        with patch('wiki.web.user.json.loads') as loads:
+            assert self.users.get_user(u'name').check_password(u'secret')
+            assert self.users.get_user(u'name') is not None
+        assert not loads.called
+
+        other = UserManager(self.rootdir)
+        other.add_user(u'other', u'secret',
+                       authentication_method='cleartext')
+        assert self.users.get_user(u'other') is not None
+
+    def test_users_are_copies(self):
+        """
+            Assert changing a user does not change the cache.
+        """
+        user = self.users.get_user(u'name')
+        user.data['active'] = False
+        assert self.users.get_user(u'name').is_active()
+
+    def test_unchanged_update_is_skipped(self):
+        """
+            Assert setting a value that did not change does not write
+            the file.
+        """
+        user = self.users.get_user(u'name')
+        with patch.object(self.users, 'write') as write:
+            user.set('authenticated', False)
+            assert not write.called
+            user.set('authenticated', True)
+            assert write.called
+
+    def test_atomic_write(self):
+        """
+            Assert no temporary files are left behind.
+        """
+        self.users.delete_user(u'name')
+        assert self.users.get_user(u'name') is None
+        assert sorted(os.listdir(self.rootdir)) == \
+            ['config.py', 'users.json', 'users.json.lock']
+
+
+class MoveTestCase(WikiBaseTestCase):
+    """
+        Test cases around moving pages.
+    """
+
+    config_content = CONFIGURATION + \
+        u"WTF_CSRF_ENABLED=False\nSECRET_KEY='test'\n"
+
+    def setUp(self):
+        super(MoveTestCase, self).setUp()
+        self.create_file(u'docs.md', u'title: Docs\n\n[[docs/one]]\n')
+        self.create_file(u'docs/one.md', u'title: One\n\ntext\n')
+        self.create_file(u'manual/two.md', u'title: Two\n\ntext\n')
+
+    def test_move(self):
+        """
+            Assert a page is moved with the pages below it.
+        """
+        rsp = self.app.post('/move/docs/', data={
+            'url': u'guide', 'subtree': u'y', 'links': u'y'})
+        assert rsp.status_code == 302
+        assert self.app.get('/guide/one/').status_code == 200
+
+    def test_folder_exists(self):
+        """
+            Assert moving a subtree onto an existing folder shows an
+            error instead of failing.
+        """
+        rsp = self.app.post('/move/docs/', data={
+            'url': u'manual', 'subtree': u'y', 'links': u'y'})
+        assert rsp.status_code == 200
+        assert u'The url exists already: manual' in rsp.get_data(as_text=True)
+        assert self.app.get('/docs/one/').status_code == 200
+
+    def test_into_itself(self):
+        """
+            Assert moving a page below itself shows an error.
+        """
+        rsp = self.app.post('/move/docs/', data={
+            'url': u'docs/sub', 'subtree': u'y', 'links': u'y'})
+        assert rsp.status_code == 200
+        assert u'Cannot move a page into itself' in \
+            rsp.get_data(as_text=True)
+        assert self.app.get('/docs/one/').status_code == 200
+
+
 class AuthenticationTestCase(WikiBaseTestCase):
     """
         Test cases around authentication.
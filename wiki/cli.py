@@ -3,9 +3,16 @@
     ~~~
 """
 import os
+import time
 
 import click
+from wiki.core import block_cache
+from wiki.core import Processor
+from wiki.core import Wiki
+from wiki.highlight import highlight_cache
+from wiki.storage import create_storage
 from wiki.web import create_app
+from wiki.web.build import StaticBuilder
 
 @click.group()
 @click.option('--directory', type=click.Path(exists=True), default=None)
@@ -42,3 +49,128 @@ def web(ctx, debug, host, port):
     """
     app = create_app(ctx.meta['directory'])
     app.run(debug=debug, host=host, port=port)
+
+
+@main.command()
+@click.option('--out', required=True,
+              type=click.Path(file_okay=False, writable=True))
+@click.option('--jobs', default=None, type=int)
+@click.pass_context
+def build(ctx, out, jobs):
+    """
+        Render the wiki to static html files.
+
+        \b
+        :param str out: the folder to write the files to.
+        :param int jobs: the number of processes used to render pages.
+            The default is the number of CPUs.
+    """
+    app = create_app(ctx.meta['directory'])
+    rendered, skipped = StaticBuilder(app, out).build(jobs=jobs)
+    click.echo('Rendered %d pages, %d were unchanged.' % (rendered, skipped))
+
+
+@main.command()
+@click.option('--jobs', default=None, type=int)
+@click.pass_context
+def reindex(ctx, jobs):
+    """
+        Rebuild the page, tag and search indexes from scratch. If the
+        render cache is kept on disk, it is warmed as well.
+
+        \b
+        :param int jobs: the number of processes used. The default is
+            the number of CPUs.
+    """
+    app = create_app(ctx.meta['directory'])
+    wiki = app.extensions['wiki']
+    render = wiki.render_cache.folder is not None
+    total = sum(1 for _ in wiki.walk())
+    with click.progressbar(length=total, label='Indexing') as bar:
+        wiki.build_index(jobs=jobs, full=True, render=render,
+                         progress=bar.update)
+    click.echo('Indexed %d pages.' % len(wiki.index()))
+
+
+@main.command()
+@click.argument('target', type=click.Choice(['files', 'sqlite']))
+@click.pass_context
+def migrate(ctx, target):
+    """
+        Copy all the pages from the storage of the STORAGE setting to
+        another storage. Pages that exist there already are replaced.
+        Set STORAGE to the new storage afterwards.
+
+        \b
+        :param str target: the storage to copy the pages to, either
+            files or sqlite.
+    """
+    directory = ctx.meta['directory']
+    app = create_app(directory)
+    source = app.extensions['wiki'].storage
+    if source.name == target:
+        raise click.UsageError(
+            'The pages are kept in the %s storage already.' % target)
+    storage = create_storage(target, directory, exclude=[Wiki.state_folder])
+    urls = [url for url, _ in source.walk()]
+    with click.progressbar(urls, label='Copying') as bar:
+        for url in bar:
+            storage.write(url, source.read(url))
+    storage.close()
+    click.echo('Copied %d pages, set STORAGE=%r in config.py to use them.'
+               % (len(urls), target))
+
+
+#: the upper bounds of the render time histogram, in milliseconds
+HISTOGRAM = [1, 5, 10, 50, 100, 500, 1000]
+
+
+@main.command()
+@click.option('--top', default=10, type=int)
+@click.pass_context
+def stats(ctx, top):
+    """
+        Render every page once and report page count, size and the
+        pages that are slowest to render. Every page is rendered with
+        empty caches, so the times do not depend on the order.
+
+        \b
+        :param int top: how many of the slowest pages to show.
+    """
+    app = create_app(ctx.meta['directory'])
+    wiki = app.extensions['wiki']
+    pages = wiki.index()
+    size = 0
+    timings = []
+    with app.test_request_context():
+        for page in pages:
+            content = page.content
+            size += len(content.encode('utf-8'))
+            highlight_cache.clear()
+            block_cache.clear()
+            start = time.perf_counter()
+            Processor(content).process()
+            timings.append(((time.perf_counter() - start) * 1000, page.url))
+
+    click.echo('Pages: %d' % len(pages))
+    click.echo('Total size: %d bytes' % size)
+    if not timings:
+        return
+    click.echo('Total render time: %.1f ms' % sum(t for t, _ in timings))
+    click.echo('')
+    click.echo('Slowest pages:')
+    for elapsed, url in sorted(timings, reverse=True)[:top]:
+        click.echo('  %10.2f ms  %s' % (elapsed, url))
+    click.echo('')
+    click.echo('Render time histogram:')
+    counts = [0] * (len(HISTOGRAM) + 1)
+    for elapsed, _ in timings:
+        bucket = 0
+        while bucket < len(HISTOGRAM) and elapsed >= HISTOGRAM[bucket]:
+            bucket += 1
+        counts[bucket] += 1
+    labels = ['< %d ms' % bound for bound in HISTOGRAM]
+    labels.append('>= %d ms' % HISTOGRAM[-1])
+    for label, count in zip(labels, counts):
+        bar = '#' * int(round(40.0 * count / len(timings)))
+        click.echo('  %10s %6d %s' % (label, count, bar))
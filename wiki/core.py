@@ -3,13 +3,40 @@
     ~~~~~~~~~
 """
 from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import difflib
+from contextlib import contextmanager
+from contextlib import ExitStack
+from contextlib import nullcontext
+import hashlib
 from io import open
+import json
 import os
 import re
+import tempfile
+import threading
+import time
 
 from flask import abort
+from flask import g
+from flask import has_request_context
 from flask import url_for
 import markdown
+from markdown.extensions.fenced_code import FencedBlockPreprocessor
+import pygments
+
+from wiki.files import atomic_write
+from wiki.files import file_lock
+from wiki.history import History
+from wiki.index import decode_cursor
+from wiki.index import encode_cursor
+from wiki.index import IndexEntry
+from wiki.index import PageIndex
+from wiki.journal import Journal
+from wiki.storage import FileStorage
+from wiki.typeset import DOLLAR_RE
+from wiki.typeset import MATH_RE
+from wiki.typeset import render_math
 
 
 class InvalidFileException(Exception):
@@ -19,6 +46,23 @@ class InvalidFileException(Exception):
     """
 
 
+class ConflictException(Exception):
+    """
+        This exception is raised when a page is saved over a version
+        other than the one it was edited from.
+
+        :param str url: the url of the page
+        :param str version: the current version of the page, empty if
+            the page does not exist (anymore).
+    """
+
+    def __init__(self, url, version):
+        super(ConflictException, self).__init__(
+            'The page "%s" was changed in the meantime.' % url)
+        self.url = url
+        self.version = version
+
+
 def clean_url(url):
     """
         Cleans the url and corrects various errors. Removes multiple
@@ -38,6 +82,13 @@ def clean_url(url):
     return url
 
 
+#: the pattern of a wikilink within the rendered html
+LINK_RE = re.compile(
+    r"((?<!\<code\>)\[\[([^<].+?) \s*([|] \s* (.+?) \s*)?]])",
+    re.X | re.U
+)
+
+
 def wikilink(text, url_formatter=None):
     """
         Processes Wikilink syntax "[[Link]]" within the html body.
@@ -59,19 +110,433 @@ def wikilink(text, url_formatter=None):
     """
     if url_formatter is None:
         url_formatter = url_for
-    link_regex = re.compile(
-        r"((?<!\<code\>)\[\[([^<].+?) \s*([|] \s* (.+?) \s*)?]])",
-        re.X | re.U
-    )
-    for i in link_regex.findall(text):
-        title = [i[-1] if i[-1] else i[1]][0]
-        url = clean_url(i[1])
-        html_url = u"<a href='{0}'>{1}</a>".format(
-            url_formatter('wiki.display', url=url),
-            title
-        )
-        text = re.sub(link_regex, html_url, text, count=1)
-    return text
+        # the urls only depend on the app, so they can be shared by
+        # all the pages rendered within the same request
+        urls = g.setdefault('_wikilink_urls', {}) \
+            if has_request_context() else {}
+    else:
+        urls = {}
+
+    def replace(match):
+        url = clean_url(match.group(2))
+        try:
+            html_url = urls[url]
+        except KeyError:
+            html_url = urls[url] = url_formatter('wiki.display', url=url)
+        return u"<a href='{0}'>{1}</a>".format(
+            html_url, match.group(4) or match.group(2))
+
+    return LINK_RE.sub(replace, text)
+
+
+#: the pattern of an inline code span in markdown, which does not
+#: continue past the end of its paragraph
+CODE_SPAN_RE = re.compile(
+    r"(?<!`)(`+)(?!`) (?:(?!\n[ \t]*\n).)+? (?<!`)\1(?!`)",
+    re.X | re.S
+)
+
+
+def split_code(text):
+    """
+        Splits markdown into the parts outside and inside of fenced
+        blocks and inline code spans.
+
+        :param str text: the markdown
+
+        :returns: the parts, which join to the original text. Parts
+            with an odd index are code.
+        :rtype: list
+    """
+    parts = []
+    start = 0
+    index = 0
+    while True:
+        fence = FencedBlockPreprocessor.FENCED_BLOCK_RE.search(text, index)
+        end = fence.start() if fence else len(text)
+        for span in CODE_SPAN_RE.finditer(text, index, end):
+            parts.extend((text[start:span.start()], span.group(0)))
+            start = span.end()
+        if fence is None:
+            break
+        parts.extend((text[start:fence.start()], fence.group(0)))
+        start = index = fence.end()
+    parts.append(text[start:])
+    return parts
+
+
+def extract_links(text):
+    """
+        Get the urls of all the wikilinks in markdown, without
+        rendering it. Wikilinks in code are not rendered, so they are
+        left out.
+
+        :param str text: the markdown
+
+        :returns: the cleaned urls, sorted and without duplicates
+        :rtype: list
+    """
+    return sorted(set(
+        clean_url(match.group(2))
+        for part in split_code(text)[::2]
+        for match in LINK_RE.finditer(part)))
+
+
+#: the patterns used by the markdown meta extension, used to parse
+#: the meta header without having to run markdown.
+META_RE = re.compile(r'^[ ]{0,3}(?P<key>[A-Za-z0-9_-]+):\s*(?P<value>.*)')
+META_MORE_RE = re.compile(r'^[ ]{4,}(?P<value>.*)')
+
+
+def parse_meta(text):
+    """
+        Parses only the meta header of the given file content, the
+        same way :meth:`Processor.process_meta` would, but without
+        rendering the body.
+
+        :param str text: the content of a wiki file
+
+        :raises InvalidFileException: if the text has no meta data
+            and body.
+
+        :returns: a tuple of the ordered meta data and the raw body
+        :rtype: tuple
+    """
+    try:
+        meta_raw, body = text.split('\n\n', 1)
+    except ValueError:
+        raise InvalidFileException("No metadata & body.")
+    # first collect the values the same way the markdown meta
+    # extension does, then order them by their appearance
+    values = {}
+    key = None
+    for line in meta_raw.split('\n'):
+        match = META_RE.match(line)
+        if match:
+            key = match.group('key').lower().strip()
+            values.setdefault(key, []).append(match.group('value').strip())
+            continue
+        match = META_MORE_RE.match(line)
+        if match and key:
+            values[key].append(match.group('value').strip())
+        else:
+            break
+    meta = OrderedDict()
+    for line in meta_raw.split('\n'):
+        key = line.split(':', 1)[0].lower()
+        try:
+            meta[key] = '\n'.join(values[key])
+        except KeyError:
+            raise InvalidFileException("Invalid metadata: %s" % line)
+    return meta, body
+
+
+#: markdown engines of the current thread, by extension list
+_engines = threading.local()
+
+
+def get_markdown(extensions):
+    """
+        Get a markdown engine with the given extensions for the
+        current thread. Setting up the extensions is expensive, so
+        every thread keeps one engine per extension list around and
+        resets it before handing it out again.
+
+        :param list extensions: the markdown extensions to load
+
+        :returns: a freshly reset markdown engine
+        :rtype: markdown.Markdown
+    """
+    engines = getattr(_engines, 'engines', None)
+    if engines is None:
+        engines = _engines.engines = {}
+    key = tuple(extensions)
+    md = engines.get(key)
+    if md is None:
+        md = engines[key] = markdown.Markdown(extensions=list(extensions))
+    else:
+        md.reset()
+    return md
+
+
+class RenderCache(object):
+    """
+        Cache for the output of the markdown stage of the
+        :class:`Processor`, which is by far the most expensive part
+        of rendering a page (especially code highlighting).
+
+        Entries are keyed by the hash of the content and the processor
+        configuration, so they never have to be invalidated when a
+        page changes, the stale entries simply age out. The cache has
+        an in-memory LRU tier limited to ``max_bytes`` and an optional
+        on-disk tier that survives restarts.
+
+        :param int max_bytes: the budget of the in-memory tier.
+        :param str folder: the folder of the on-disk tier, if not
+            provided only the in-memory tier is used.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, folder=None):
+        self.max_bytes = max_bytes
+        self.folder = folder
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(text, config):
+        """
+            Builds the cache key for the given text and processor
+            configuration.
+
+            :param str text: the input of the processor
+            :param str config: a description of the processor
+                configuration, see :meth:`Processor.config`
+        """
+        digest = hashlib.sha1(config.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(text.encode('utf-8'))
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.folder, key[:2], key + '.json')
+
+    def _sizeof(self, value):
+        html, body, _ = value
+        return len(html) + len(body)
+
+    def _store(self, key, value):
+        # has to be called while holding the lock
+        if key in self.entries:
+            self.size -= self._sizeof(self.entries.pop(key))
+        size = self._sizeof(value)
+        if size > self.max_bytes:
+            return
+        self.entries[key] = value
+        self.size += size
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= self._sizeof(evicted)
+            self.evictions += 1
+
+    def get(self, key):
+        """
+            Get a cached result.
+
+            :returns: a tuple of html, body and meta or ``None`` if
+                the key is unknown.
+        """
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+        if self.folder is not None:
+            try:
+                with open(self._path(key), 'r', encoding='utf-8') as f:
+                    html, body, meta = json.load(f)
+            except (IOError, OSError, ValueError):
+                pass
+            else:
+                value = (html, body, OrderedDict(meta))
+                with self.lock:
+                    self.disk_hits += 1
+                    self._store(key, value)
+                return value
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, value):
+        """
+            Store a result in the cache.
+
+            :param str key: the key as returned by :meth:`key`
+            :param tuple value: a tuple of html, body and meta
+        """
+        with self.lock:
+            self._store(key, value)
+        if self.folder is not None:
+            html, body, meta = value
+            path = self._path(key)
+            folder = os.path.dirname(path)
+            if not os.path.exists(folder):
+                os.makedirs(folder)
+            # write to a temporary file first, so concurrent readers
+            # never see a partial entry
+            fd, tmp = tempfile.mkstemp(dir=folder)
+            with open(fd, 'w', encoding='utf-8') as f:
+                f.write(json.dumps([html, body, list(meta.items())]))
+            os.replace(tmp, path)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        """
+            Get the counters of the cache.
+
+            :rtype: dict
+        """
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self.entries),
+                'bytes': self.size,
+            }
+
+
+class TextCache(object):
+    """
+        LRU cache of rendered fragments (e.g. code blocks), limited to
+        ``max_bytes`` of text.
+
+        :param int max_bytes: the budget of the cache
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            if key in self.entries:
+                self.size -= len(self.entries.pop(key))
+            if len(value) > self.max_bytes:
+                return
+            self.entries[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        """
+            Get the counters of the cache.
+
+            :rtype: dict
+        """
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self.entries),
+                'bytes': self.size,
+            }
+
+
+#: markdown that may refer to other top-level blocks (reference link
+#: definitions) or span them (raw html), see :func:`split_blocks`
+SPANNING_RE = re.compile(r'^ {0,3}(\[[^\]\n]+\]:|<[a-zA-Z!/?])', re.M)
+
+#: the heading rendered after a block to find where it ends
+BLOCK_SENTINEL = u'wikiblocksentinel'
+
+
+def split_blocks(text):
+    """
+        Splits markdown into top-level sections, every section but
+        the first starts with a heading that follows a blank line
+        outside of fenced code. The sections can be rendered on their
+        own, see :meth:`Processor.render_blocks`.
+
+        Texts that contain markdown which could connect sections are
+        not split.
+
+        :param str text: the markdown
+
+        :returns: the sections, which join to the original text
+        :rtype: list
+    """
+    if SPANNING_RE.search(text):
+        return [text]
+    fences = []
+    index = 0
+    while True:
+        match = FencedBlockPreprocessor.FENCED_BLOCK_RE.search(text, index)
+        if match is None:
+            break
+        fences.append(match.span())
+        index = match.end()
+    blocks = []
+    start = 0
+    offset = 0
+    blank = False
+    for line in text.split(u'\n'):
+        if offset > 0 and blank and line.startswith(u'#') and \
+                not any(begin < offset < end for begin, end in fences):
+            blocks.append(text[start:offset])
+            start = offset
+        blank = not line.strip()
+        offset += len(line) + 1
+    blocks.append(text[start:])
+    return blocks
+
+
+#: the rendered sections of long pages
+block_cache = TextCache(32 * 1024 * 1024)
+
+#: the sources pages were recently edited from, by version, the base
+#: of the diffs shown when an edit conflicts
+source_cache = TextCache(16 * 1024 * 1024)
+
+
+def diff_versions(base, theirs, mine):
+    """
+        Get the three-way diff of two concurrent edits of a page: the
+        changes of both sides against the version they started from.
+        If that version is unknown, the changes from theirs to mine.
+
+        :param str base: the source both edits started from, or
+            ``None`` if it is not known.
+        :param str theirs: the source that was saved in the meantime
+        :param str mine: the source that conflicted
+
+        :returns: a tuple of the unified diff lines of theirs and of
+            mine.
+        :rtype: tuple
+    """
+    def diff(old, new, old_name, new_name):
+        return list(difflib.unified_diff(
+            old.splitlines(), new.splitlines(), old_name, new_name,
+            lineterm=u''))
+
+    if base is None:
+        return [], diff(theirs, mine, u'theirs', u'mine')
+    return (diff(base, theirs, u'base', u'theirs'),
+            diff(base, mine, u'base', u'mine'))
 
 
 class Processor(object):
@@ -84,21 +549,29 @@ class Processor(object):
     """
 
     preprocessors = []
-    postprocessors = [wikilink]
+    postprocessors = [wikilink, render_math]
+    #: texts of at least this size are rendered section by section,
+    #: so only changed sections are converted again
+    block_threshold = 16 * 1024
+    extensions = [
+        'codehilite',
+        'fenced_code',
+        'meta',
+        'tables',
+        'mdx_math', # mathjax support
+        'wiki.highlight' # caches the highlighted code blocks
+    ]
 
-    def __init__(self, text):
+    def __init__(self, text, cache=None):
         """
             Initialization of the processor.
 
             :param str text: the text to process
+            :param RenderCache cache: a cache for the markdown stage,
+                optional.
         """
-        self.md = markdown.Markdown(extensions=[
-            'codehilite',
-            'fenced_code',
-            'meta',
-            'tables',
-            'mdx_math' # mathjax support
-        ])
+        self.md = None
+        self.cache = cache
         self.input = text
         self.markdown = None
         self.meta_raw = None
@@ -121,8 +594,62 @@ class Processor(object):
         """
             Convert to HTML.
         """
-        self.html = self.md.convert(self.pre)
+        # the engine is shared within the thread, so only take it
+        # when it is actually used
+        self.md = get_markdown(self.extensions)
+        html = None
+        if len(self.pre) >= self.block_threshold:
+            blocks = split_blocks(self.pre)
+            if len(blocks) > 1:
+                html = self.render_blocks(blocks)
+                if html is None:
+                    self.md.reset()
+        if html is None:
+            html = self.md.convert(self.pre)
+        self.html = html
 
+    def render_blocks(self, blocks):
+        """
+            Converts the sections of a text one by one, the sections
+            are cached by their content in :data:`block_cache`. The
+            result is the same as converting the whole text.
+
+            :param list blocks: the sections, see :func:`split_blocks`
+
+            :returns: the html or ``None`` if the sections could not
+                be rendered separately.
+        """
+        config = self.config()
+        sentinel = u'<h1>%s</h1>' % BLOCK_SENTINEL
+        parts = []
+        for number, block in enumerate(blocks):
+            last = number == len(blocks) - 1
+            digest = hashlib.sha1(config.encode('utf-8'))
+            digest.update(b'\0last\0' if last else b'\0')
+            digest.update(block.encode('utf-8'))
+            key = digest.hexdigest()
+            html = block_cache.get(key)
+            if html is None:
+                self.md.reset()
+                if last:
+                    html = self.md.convert(block)
+                else:
+                    # the sentinel heading is rendered the same way
+                    # as the heading of the next section, so what is
+                    # in front of it is exactly the part of the whole
+                    # document, including the whitespace at its end
+                    html = self.md.convert(block + u'# %s\n' % BLOCK_SENTINEL)
+                    end = html.rfind(sentinel)
+                    if end < 0:
+                        return None
+                    html = html[:end]
+                block_cache.set(key, html)
+            parts.append(html)
+        # the meta data is read from the engine, only the header of the
+        # first section is needed for that
+        self.md.reset()
+        self.md.convert(blocks[0].split(u'\n\n', 1)[0])
+        return u''.join(parts)
 
     def split_raw(self):
         """
@@ -157,57 +684,198 @@ class Processor(object):
             current = processor(current)
         self.final = current
 
+    def config(self):
+        """
+            Describes everything that influences the output of the
+            markdown stage, used as part of the cache key.
+        """
+        return u'|'.join(
+            list(self.extensions) +
+            [getattr(p, '__qualname__', repr(p)) for p in self.preprocessors] +
+            [markdown.__version__, pygments.__version__]
+        )
+
     def process(self):
         """
             Runs the full suite of processing on the given text, all
             pre and post processing, markdown rendering and meta data
             handling.
+
+            If a cache was given, the markdown rendering and meta data
+            handling are skipped for content that was rendered before.
+            The postprocessors always run, as their output may depend
+            on the current request.
         """
         self.process_pre()
-        self.process_markdown()
-        self.split_raw()
-        self.process_meta()
+        cached = key = None
+        if self.cache is not None:
+            key = self.cache.key(self.pre, self.config())
+            cached = self.cache.get(key)
+        if cached is not None:
+            self.html, self.markdown, meta = cached
+            # never hand out the cached dictionary, pages modify it
+            self.meta = OrderedDict(meta)
+        else:
+            self.process_markdown()
+            self.split_raw()
+            self.process_meta()
+            if self.cache is not None:
+                self.cache.set(
+                    key, (self.html, self.markdown, OrderedDict(self.meta)))
         self.process_post()
 
         return self.final, self.markdown, self.meta
 
 
 class Page(object):
-    def __init__(self, path, url, new=False):
+    """
+        A single wiki page.
+
+        Creating a page only reads the file and parses its meta
+        header, the markdown is rendered on the first access of
+        :attr:`html`. Pages that are created with ``meta`` (e.g. from
+        the page index) do not even touch the file until their
+        content or body is needed.
+
+        :param str path: the path of the markdown file
+        :param str url: the url of the page
+        :param bool new: whether the page does not exist yet
+        :param dict meta: already known meta data of the page
+        :param RenderCache cache: the cache to render with, optional.
+        :param Wiki wiki: the wiki the page belongs to, its indexes are
+            updated whenever the page is saved.
+    """
+
+    def __init__(self, path, url, new=False, meta=None, cache=None,
+                 wiki=None):
         self.path = path
         self.url = url
+        self.cache = cache
+        self.wiki = wiki
         self._meta = OrderedDict()
-        if not new:
+        self._content = None
+        self._body = None
+        self._html = None
+        self._version = None
+        if meta is not None:
+            self._meta = meta
+        elif not new:
             self.load()
-            self.render()
 
     def __repr__(self):
         return u"<Page: {}@{}>".format(self.url, self.path)
 
+    def read(self):
+        """
+            Get the source of the page, from the storage of its wiki
+            or, for pages without a wiki, from its file.
+        """
+        if self.wiki is not None:
+            return self.wiki.storage.read(self.url)
+        with open(self.path, 'rb') as f:
+            return f.read()
+
     def load(self):
-        with open(self.path, 'r', encoding='utf-8') as f:
-            self.content = f.read()
+        raw = self.read()
+        self._version = hashlib.sha1(raw).hexdigest()
+        # the newlines are translated like in text mode
+        self._content = raw.decode('utf-8').replace(
+            u'\r\n', u'\n').replace(u'\r', u'\n')
+        self._meta, self._body = parse_meta(self._content)
+        self._html = None
 
     def render(self):
-        processor = Processor(self.content)
+        processor = Processor(self.content, cache=self.cache)
         try:
-            self._html, self.body, self._meta = processor.process()
+            self._html, self._body, self._meta = processor.process()
         except ValueError:
             raise InvalidFileException("No metadata & body.")
 
-    def save(self, update=True):
-        folder = os.path.dirname(self.path)
-        if not os.path.exists(folder):
-            os.makedirs(folder)
-        with open(self.path, 'w', encoding='utf-8') as f:
-            for key, value in self._meta.items():
-                line = u'%s: %s\n' % (key, value)
-                f.write(line)
-            f.write(u'\n')
-            f.write(self.body.replace(u'\r\n', u'\n'))
+    @property
+    def version(self):
+        """
+            The sha1 of the file the page was loaded from, empty for
+            pages that do not exist yet.
+        """
+        if self._version is None:
+            self._version = u''
+            try:
+                self.load()
+            except FileNotFoundError:
+                pass
+        return self._version
+
+    def stored_version(self):
+        """
+            Get the version of the file as it is now, without rendering
+            or, if the page index is current, even reading it.
+        """
+        if self.wiki is not None:
+            fingerprint = self.wiki.fingerprint(self.url)
+            return fingerprint[0] if fingerprint else u''
+        try:
+            return hashlib.sha1(self.read()).hexdigest()
+        except (IOError, OSError):
+            return u''
+
+    def serialize(self):
+        """
+            Get the content of the file the page is saved as.
+        """
+        content = u''.join(
+            u'%s: %s\n' % (key, value) for key, value in self._meta.items())
+        return content + u'\n' + self.body.replace(u'\r\n', u'\n')
+
+    def save(self, update=True, version=None, author=None, message=None):
+        """
+            Writes the page back to the storage of its wiki, or to its
+            file for pages without a wiki.
+
+            :param bool update: whether to load the page again afterwards
+            :param str version: the version the changes were made to,
+                see :attr:`version`. If given and the page has changed
+                since, nothing is written.
+            :param str author: who made the change, for the history
+            :param str message: what changed, for the history
+
+            :raises ConflictException: if the version does not match
+        """
+        content = self.serialize()
+        # the page is replaced atomically, so readers never see a
+        # partially written page
+        lock = self.wiki.changing([self.url]) if self.wiki is not None \
+            else nullcontext()
+        with lock:
+            if version is not None:
+                current = self.stored_version()
+                if current != version:
+                    raise ConflictException(self.url, current)
+            if self.wiki is None:
+                atomic_write(self.path, content)
+            else:
+                previous = self.wiki.untracked(self.url)
+                self.wiki.storage.write(self.url, content)
+                self.wiki.reindex(self.url)
+                self.wiki.record(self.url, content, previous,
+                                 author=author, message=message)
         if update:
             self.load()
-            self.render()
+
+    @property
+    def content(self):
+        if self._content is None:
+            self.load()
+        return self._content
+
+    @property
+    def body(self):
+        if self._body is None:
+            self.load()
+        return self._body
+
+    @body.setter
+    def body(self, value):
+        self._body = value
 
     @property
     def meta(self):
@@ -221,11 +889,22 @@ class Page(object):
 
     @property
     def html(self):
+        if self._html is None:
+            self.render()
         return self._html
 
     def __html__(self):
         return self.html
 
+    @property
+    def has_math(self):
+        """
+            Whether the page contains math that still has to be
+            typeset in the browser.
+        """
+        return MATH_RE.search(self.html) is not None or \
+            DOLLAR_RE.search(self.html) is not None
+
     @property
     def title(self):
         try:
@@ -249,21 +928,200 @@ class Page(object):
         self['tags'] = value
 
 
+def read_entry(storage, url, stat=None):
+    """
+        Reads and parses a single page for the page index.
+
+        :param storage: the :class:`~wiki.storage.Storage` of the page
+        :param str url: the url of the page
+        :param stat: the :class:`~wiki.storage.Stat` of the page,
+            optional.
+
+        :returns: a tuple of the :class:`~wiki.index.IndexEntry` and
+            the content of the page, which is ``None`` if the page is
+            not valid.
+        :rtype: tuple
+    """
+    if stat is None:
+        stat = storage.stat(url)
+    raw = storage.read(url)
+    if stat is None:
+        # created right after the stat
+        stat = storage.stat(url)
+    entry = IndexEntry(
+        url, storage.path(url), stat.st_mtime_ns, stat.st_size,
+        hashlib.sha1(raw).hexdigest(), None)
+    try:
+        text = raw.decode('utf-8')
+        meta, body = parse_meta(text)
+    except (InvalidFileException, UnicodeDecodeError):
+        return entry, None
+    return entry._replace(
+        meta=meta, body=body, links=extract_links(body)), text
+
+
+def build_entries(storage, urls, render=True):
+    """
+        Reads, parses and renders a batch of pages for
+        :meth:`Wiki.build_index`. This runs in worker processes, so it
+        only takes and returns plain data.
+
+        :param storage: the :class:`~wiki.storage.Storage` of the pages
+        :param list urls: the urls of the pages
+        :param bool render: whether to run the markdown stage of the
+            :class:`Processor` as well.
+
+        :returns: a list of tuples of the index entry, whether it is
+            valid, and the render cache key and value (both ``None``
+            if the page was not rendered).
+        :rtype: list
+    """
+    results = []
+    for url in urls:
+        try:
+            entry, text = read_entry(storage, url)
+        except (IOError, OSError):
+            # the page vanished in the meantime
+            continue
+        key = value = None
+        if text is not None and render:
+            processor = Processor(text)
+            try:
+                processor.process_pre()
+                processor.process_markdown()
+                processor.split_raw()
+                processor.process_meta()
+            except (ValueError, KeyError):
+                pass
+            else:
+                key = RenderCache.key(processor.pre, processor.config())
+                value = (processor.html, processor.markdown, processor.meta)
+        results.append((entry, text is not None, key, value))
+    return results
+
+
 class Wiki(object):
-    def __init__(self, root):
+    #: the folder inside the content directory that holds the
+    #: persistent indexes and caches
+    state_folder = '.wiki'
+
+    def __init__(self, root, render_cache=None, watched=False,
+                 history=False, storage=None, scan_interval=0):
         self.root = root
+        #: where the pages are kept, see :mod:`wiki.storage`
+        self.storage = storage
+        if storage is None:
+            self.storage = FileStorage(root, exclude=[self.state_folder])
+        self.page_index = PageIndex(
+            os.path.join(root, self.state_folder, 'index.db'))
+        self.render_cache = render_cache
+        #: whether a :mod:`~wiki.watcher` keeps the page index current,
+        #: otherwise the content directory is scanned before reads
+        self.watched = watched
+        #: the seconds during which the index is read without scanning
+        #: again, changes made through the wiki are indexed right away
+        self.scan_interval = scan_interval
+        self._scanned = None
+        #: a wiki may be shared by the threads of a process, all
+        #: changes to the content and the indexes hold this lock
+        self.lock = threading.RLock()
+        #: records the pages that are being changed, see :meth:`recover`
+        self.journal = Journal(
+            os.path.join(root, self.state_folder, 'journal'))
+        #: the revisions of the pages, if a history is kept
+        self.history = None
+        if history:
+            self.history = History(
+                os.path.join(root, self.state_folder, 'history'))
+
+    @contextmanager
+    def changing(self, urls):
+        """
+            Context manager around changes to the files of the given
+            pages. It holds the lock of the wiki and the advisory file
+            locks of the pages, so writers in other processes wait as
+            well, and records the change in the journal. Readers do
+            not take any of these locks.
+
+            :param list urls: the urls of the pages that change
+        """
+        urls = sorted(set(urls))
+        with self.lock, ExitStack() as stack:
+            # always locked in the same order, so writers changing
+            # several pages cannot deadlock
+            for url in urls:
+                stack.enter_context(file_lock(self.lock_path(url)))
+            with self.journal.record(urls):
+                yield
+
+    def lock_path(self, url):
+        name = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.root, self.state_folder, 'locks', name)
+
+    def untracked(self, url):
+        """
+            Get the source of an existing page that has no history yet,
+            to be recorded as its first revision before it changes.
+
+            :returns: the source, or ``None`` if no history is kept,
+                the page has a history or does not exist.
+            :rtype: bytes
+        """
+        if self.history is None or self.history.count(url):
+            return None
+        try:
+            return self.storage.read(url)
+        except (IOError, OSError):
+            return None
+
+    def record(self, url, content, previous=None, **kwargs):
+        """
+            Records a revision of a page, if a history is kept. The
+            keyword arguments are passed to
+            :meth:`~wiki.history.History.append`.
+
+            :param str previous: the source before the change, see
+                :meth:`untracked`, optional.
+
+            :returns: the revision
+            :rtype: ~wiki.history.Revision
+        """
+        if self.history is None:
+            return None
+        if previous is not None:
+            self.history.append(url, previous, message=u'Imported')
+        return self.history.append(url, content, **kwargs)
+
+    def recover(self):
+        """
+            Completes the changes that were interrupted, e.g. by a
+            crash: the index entries of the pages they touched are read
+            again from the files. As pages are written atomically, the
+            files are either in their old or their new state. Cached
+            renderings are keyed by content, so they are never stale.
+
+            :returns: the urls of the pages that were reindexed
+            :rtype: list
+        """
+        recovered = set()
+        for change, urls in self.journal.pending().items():
+            with self.lock:
+                for url in urls:
+                    self.reindex(url)
+            self.journal.done(change)
+            recovered.update(urls)
+        return sorted(recovered)
 
     def path(self, url):
-        return os.path.join(self.root, url + '.md')
+        return self.storage.path(url)
 
     def exists(self, url):
-        path = self.path(url)
-        return os.path.exists(path)
+        return self.storage.exists(url)
 
     def get(self, url):
-        path = os.path.join(self.root, url + '.md')
         if self.exists(url):
-            return Page(path, url)
+            return Page(self.path(url), url, cache=self.render_cache,
+                        wiki=self)
         return None
 
     def get_or_404(self, url):
@@ -276,11 +1134,58 @@ class Wiki(object):
         path = self.path(url)
         if self.exists(url):
             return False
-        return Page(path, url, new=True)
+        return Page(path, url, new=True, cache=self.render_cache,
+                    wiki=self)
 
-    def move(self, url, newurl):
+    def fingerprint(self, url):
+        """
+            Get what identifies the current source of a page without
+            reading it, if the page index is current for it.
+
+            :returns: a tuple of the sha1 of the file and its mtime in
+                seconds, or ``None`` if the page does not exist.
+            :rtype: tuple
+        """
+        stat = self.storage.stat(url)
+        if stat is None:
+            return None
+        modified = stat.st_mtime_ns / 1e9
+        for entry in self.page_index.entries([url]):
+            if (entry.mtime, entry.size) == (stat.st_mtime_ns, stat.st_size):
+                return entry.hash, modified
+        try:
+            return hashlib.sha1(self.storage.read(url)).hexdigest(), modified
+        except (IOError, OSError):
+            return None
+
+    def revision(self):
+        """
+            Get the revision of the page index after making sure it is
+            current, see :meth:`~wiki.index.PageIndex.revision`.
+        """
+        self.ensure_index()
+        return self.page_index.revision()
+
+    def move(self, url, newurl, subtree=False, rewrite_links=True):
+        """
+            Moves a page, and optionally all the pages below it, to a
+            new url.
+
+            The pages linking to moved pages are found through the
+            link index and their wikilinks are rewritten in one batch.
+            If anything fails, the files that were already changed are
+            restored.
+
+            :param str url: the current url of the page
+            :param str newurl: the new url, it is cleaned first
+            :param bool subtree: also move all the pages below it, with
+                the files storage the whole folder of the page.
+            :param bool rewrite_links: rewrite the wikilinks pointing
+                to moved pages.
+
+            :returns: the cleaned new url
+        """
         newurl = clean_url(newurl)
-        source = os.path.join(self.root, url) + '.md'
         target = os.path.join(self.root, newurl) + '.md'
         # normalize root path (just in case somebody defined it absolute,
         # having some '../' inside) to correctly compare it to the target
@@ -294,46 +1199,405 @@ class Wiki(object):
             raise RuntimeError(
                 'Possible write attempt outside content directory: '
                 '%s' % newurl)
-        # create folder if it does not exists yet
-        folder = os.path.dirname(target)
-        if not os.path.exists(folder):
-            os.makedirs(folder)
-        os.rename(source, target)
+        if newurl == url or newurl.startswith(url + u'/'):
+            raise RuntimeError(
+                'Cannot move a page into itself: %s' % newurl)
+        with self.lock:
+            self.ensure_index()
+            # tuples of the old and new url and whether it is a folder
+            renames = []
+            moved = {}
+            if self.storage.exists(url):
+                if self.storage.exists(newurl):
+                    raise RuntimeError('The url exists already: %s' % newurl)
+                renames.append((url, newurl, False))
+                moved[url] = newurl
+            if subtree and self.storage.is_folder(url):
+                if self.storage.is_folder(newurl):
+                    raise RuntimeError('The url exists already: %s' % newurl)
+                renames.append((url, newurl, True))
+                for child in self.page_index.descendants(url):
+                    moved[child] = newurl + child[len(url):]
+            if not renames:
+                raise RuntimeError('Nothing to move: %s' % url)
+            referrers = []
+            if rewrite_links:
+                referrers = self.page_index.referrers(moved)
+            urls = set(moved)
+            urls.update(moved.values())
+            urls.update(referrers)
+            with self.changing(urls):
+                rewrites = self._rewrite_links(moved, referrers)
+                self._apply_move(renames, rewrites)
+
+                # update the index entries of all the changed pages at
+                # once
+                changed = set(moved.values())
+                changed.update(rewrites)
+                entries = []
+                invalid = []
+                for changed_url in changed:
+                    if self.storage.exists(changed_url):
+                        entry, valid = self.read_entry(changed_url)
+                        (entries if valid else invalid).append(entry)
+                self.page_index.update(
+                    entries, set(moved) - changed, invalid)
+
+                if self.history is not None:
+                    for old, new in moved.items():
+                        self.history.move(old, new)
+                    for changed_url in sorted(rewrites):
+                        text, rewritten = rewrites[changed_url]
+                        self.record(
+                            changed_url, rewritten,
+                            text if not self.history.count(changed_url)
+                            else None,
+                            message=u'Updated the links to %s' % newurl)
         return newurl
 
-    def delete(self, url):
-        path = self.path(url)
-        if not self.exists(url):
-            return False
-        os.remove(path)
+    def _rewrite_links(self, moved, referrers):
+        # returns the new url of every page linking to a moved page,
+        # mapped to its old and its rewritten content. Wikilinks in
+        # code are left alone, just like by extract_links.
+        def replace(match):
+            target = clean_url(match.group(2))
+            if target not in moved:
+                return match.group(0)
+            return u'[[%s|%s]]' % (
+                moved[target], match.group(4) or match.group(2))
+
+        rewrites = {}
+        for referrer in referrers:
+            text = self.storage.read(referrer).decode('utf-8')
+            parts = split_code(text)
+            parts[::2] = [LINK_RE.sub(replace, part) for part in parts[::2]]
+            rewritten = u''.join(parts)
+            if rewritten != text:
+                rewrites[moved.get(referrer, referrer)] = (text, rewritten)
+        return rewrites
+
+    def _rename(self, source, target, folder):
+        if folder:
+            self.storage.rename_folder(source, target)
+        else:
+            self.storage.rename(source, target)
+
+    def _apply_move(self, renames, rewrites):
+        renamed = []
+        written = []
+        try:
+            for source, target, folder in renames:
+                self._rename(source, target, folder)
+                renamed.append((source, target, folder))
+            for url in sorted(rewrites):
+                text, rewritten = rewrites[url]
+                self.storage.write(url, rewritten)
+                written.append((url, text))
+        except BaseException:
+            for url, text in reversed(written):
+                self.storage.write(url, text)
+            for source, target, folder in reversed(renamed):
+                self._rename(target, source, folder)
+            raise
+
+    def delete(self, url, author=None):
+        with self.lock:
+            if not self.exists(url):
+                return False
+            with self.changing([url]):
+                previous = self.untracked(url)
+                self.storage.delete(url)
+                self.reindex(url)
+                self.record(url, u'', previous, author=author, deleted=True)
         return True
 
+    def walk(self, prefix=None):
+        """
+            Yields every page of the storage.
+
+            :param str prefix: only the pages below this url, optional.
+
+            :returns: a generator of tuples of url, path and the
+                :class:`~wiki.storage.Stat` of every page.
+        """
+        for url, stat in self.storage.walk(prefix):
+            yield url, self.storage.path(url), stat
+
+    def read_entry(self, url, stat=None):
+        """
+            Reads and parses a single page for the page index.
+
+            :param str url: the url of the page
+            :param stat: the :class:`~wiki.storage.Stat` of the page,
+                optional.
+
+            :returns: a tuple of the :class:`~wiki.index.IndexEntry`
+                and whether the page is valid.
+            :rtype: tuple
+        """
+        entry, text = read_entry(self.storage, url, stat)
+        return entry, text is not None
+
+    def update_index(self):
+        """
+            Brings the persistent page index up to date with the
+            content directory. Only files whose mtime or size changed
+            since they were indexed are read and parsed again.
+
+            While another thread is changing the wiki, the scan is
+            skipped instead of waiting, the writer updates the index
+            of the pages it changes itself.
+        """
+        if not self.lock.acquire(blocking=False):
+            return
+        try:
+            self._update_index()
+            self._scanned = time.monotonic()
+        finally:
+            self.lock.release()
+
+    def _update_index(self):
+        known = self.page_index.stats()
+        seen = set()
+        entries = []
+        invalid = []
+        for url, _, stat in self.walk():
+            if url in seen:
+                continue
+            seen.add(url)
+            if known.get(url) == (stat.st_mtime_ns, stat.st_size):
+                continue
+            try:
+                entry, valid = self.read_entry(url, stat)
+            except (IOError, OSError):
+                # the page vanished in the meantime
+                seen.discard(url)
+                continue
+            (entries if valid else invalid).append(entry)
+        removed = set(known) - seen
+        if entries or invalid or removed:
+            self.page_index.update(entries, removed, invalid)
+
+    def build_index(self, jobs=None, full=False, render=True, batch=100,
+                    progress=None):
+        """
+            Builds the page index (and warms the render cache) with a
+            pool of worker processes, for cold starts and deploys where
+            most of the files have to be parsed and rendered.
+
+            :param int jobs: the number of worker processes, defaults
+                to the number of CPUs. With a single job everything
+                runs in the current process.
+            :param bool full: rebuild every entry, instead of only the
+                ones of files that changed.
+            :param bool render: also render the pages into the render
+                cache, if the wiki has one.
+            :param int batch: the number of files handed to a worker
+                at once.
+            :param function progress: called with the number of files
+                of every batch that was merged into the index,
+                optional.
+
+            :returns: the number of files that were processed
+            :rtype: int
+        """
+        render = render and self.render_cache is not None
+        with self.lock:
+            known = {} if full else self.page_index.stats()
+            seen = set()
+            items = []
+            for url, _, stat in self.walk():
+                if url in seen:
+                    continue
+                seen.add(url)
+                if known.get(url) != (stat.st_mtime_ns, stat.st_size):
+                    items.append(url)
+            removed = set(self.page_index.stats()) - seen
+            self._build(items, jobs, render, batch, progress)
+            if removed:
+                self.page_index.update(removed=removed)
+        return len(items)
+
+    def render_pages(self, urls, jobs=None, batch=100):
+        """
+            Renders the given pages into the render cache with a pool
+            of worker processes, whether their index entries are
+            current or not. Their entries are updated along the way.
+
+            :param list urls: the urls of the pages
+            :param int jobs: see :meth:`build_index`
+            :param int batch: see :meth:`build_index`
+
+            :returns: the number of pages that were rendered
+            :rtype: int
+        """
+        if self.render_cache is None:
+            return 0
+        urls = list(urls)
+        with self.lock:
+            self._build(urls, jobs, True, batch)
+        return len(urls)
+
+    def _build(self, urls, jobs, render, batch, progress=None):
+        batches = [urls[i:i + batch] for i in range(0, len(urls), batch)]
+        if jobs == 1 or len(batches) < 2 or not self.storage.parallel:
+            self._merge_built(
+                (build_entries(self.storage, chunk, render)
+                 for chunk in batches),
+                progress)
+        else:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                self._merge_built(executor.map(
+                    build_entries, [self.storage] * len(batches),
+                    batches, [render] * len(batches)),
+                    progress)
+
+    def _merge_built(self, results, progress=None):
+        # writes the results of build_entries batch by batch, so the
+        # memory used does not depend on the size of the wiki
+        for result in results:
+            entries = []
+            invalid = []
+            for entry, valid, key, value in result:
+                (entries if valid else invalid).append(entry)
+                if key is not None:
+                    self.render_cache.set(key, value)
+            self.page_index.update(entries, (), invalid)
+            if progress is not None:
+                progress(len(result))
+
+    def ensure_index(self):
+        """
+            Makes sure the page index is current before it is read.
+            Unless a watcher keeps it current, this scans the content
+            directory, at most once every ``scan_interval`` seconds.
+        """
+        if self.watched:
+            return
+        if self._scanned is not None and \
+                time.monotonic() - self._scanned < self.scan_interval:
+            return
+        self.update_index()
+
+    def url_for_path(self, path):
+        """
+            Get the url of a markdown file in the content directory,
+            for the watchers of the files storage.
+
+            :returns: the url or ``None`` if the path is no page
+        """
+        return self.storage.url_for_path(path)
+
+    def refresh(self, paths):
+        """
+            Updates the index entries of the given files in one batch,
+            used by the watchers. Files that did not change since they
+            were indexed (e.g. because they were saved through the
+            wiki) are skipped. Rendered pages do not have to be
+            invalidated as the render cache is keyed by content.
+
+            :param list paths: the paths of the changed files
+        """
+        with self.lock:
+            self._refresh(paths)
+
+    def _refresh(self, paths):
+        known = self.page_index.stats()
+        entries = []
+        invalid = []
+        removed = []
+        for path in paths:
+            url = self.url_for_path(path)
+            if url is None:
+                continue
+            stat = self.storage.stat(url)
+            if stat is None:
+                if url in known:
+                    removed.append(url)
+                continue
+            if known.get(url) == (stat.st_mtime_ns, stat.st_size):
+                continue
+            try:
+                entry, valid = self.read_entry(url, stat)
+            except (IOError, OSError):
+                continue
+            (entries if valid else invalid).append(entry)
+        if entries or invalid or removed:
+            self.page_index.update(entries, removed, invalid)
+
+    def reindex(self, url):
+        """
+            Updates the index entry of a single page after it was
+            written, moved or deleted.
+
+            :param str url: the url of the page
+        """
+        with self.lock:
+            try:
+                entry, valid = self.read_entry(url)
+            except (IOError, OSError):
+                self.page_index.update(removed=[url])
+                return
+            if valid:
+                self.page_index.update(entries=[entry])
+            else:
+                self.page_index.update(invalid=[entry])
+
     def index(self):
         """
             Builds up a list of all the available pages.
 
+            The pages are served from the persistent page index, they
+            are only loaded once their content is accessed.
+
             :returns: a list of all the wiki pages
             :rtype: list
         """
-        # make sure we always have the absolute path for fixing the
-        # walk path
-        pages = []
-        root = os.path.abspath(self.root)
-        for cur_dir, _, files in os.walk(root):
-            # get the url of the current directory
-            cur_dir_url = cur_dir[len(root)+1:]
-            for cur_file in files:
-                path = os.path.join(cur_dir, cur_file)
-                if cur_file.endswith('.md'):
-                    url = clean_url(os.path.join(cur_dir_url, cur_file[:-3]))
-                    try:
-                        page = Page(path, url)
-                        pages.append(page)
-                    except InvalidFileException:
-                        # for now we just ignore files that are invalid
-                        # entirely
-                        pass
-        return sorted(pages, key=lambda x: x.title.lower())
+        self.ensure_index()
+        return [self.page_from_entry(entry)
+                for entry in self.page_index.listing()]
+
+    def index_page(self, cursor=None, limit=100):
+        """
+            Get one page of the index, sorted by title.
+
+            :param str cursor: the cursor returned for the previous
+                page of the index, optional.
+            :param int limit: the number of pages to return
+
+            :raises ValueError: if the cursor is invalid
+
+            :returns: a tuple of the pages and the cursor of the next
+                page of the index, which is ``None`` on the last one.
+            :rtype: tuple
+        """
+        after = decode_cursor(cursor) if cursor else None
+        self.ensure_index()
+        entries = self.page_index.listing(after, limit + 1)
+        following = None
+        if len(entries) > limit:
+            entries = entries[:limit]
+            following = encode_cursor(entries[-1])
+        return [self.page_from_entry(entry) for entry in entries], following
+
+    def iter_index(self, batch=500):
+        """
+            Iterates over all pages sorted by title, reading them from
+            the index in batches so the first pages are available
+            immediately.
+
+            :param int batch: the number of pages read at once
+        """
+        self.ensure_index()
+        after = None
+        while True:
+            entries = self.page_index.listing(after, batch)
+            for entry in entries:
+                yield self.page_from_entry(entry)
+            if len(entries) < batch:
+                break
+            last = entries[-1]
+            after = (last.meta.get('title', last.url).lower(), last.url)
 
     def index_by(self, key):
         """
@@ -359,30 +1623,142 @@ class Wiki(object):
         pages = self.index(attr='title')
         return pages.get(title)
 
+    def page_from_entry(self, entry):
+        """
+            Creates a page from an entry of the page index.
+
+            :param IndexEntry entry: the entry
+        """
+        return Page(entry.path, entry.url, meta=entry.meta,
+                    cache=self.render_cache, wiki=self)
+
+    def pages(self, urls):
+        """
+            Get the pages with the given urls from the page index.
+
+            :param list urls: the urls of the pages
+
+            :returns: the pages in the order of the given urls, unknown
+                urls are skipped.
+            :rtype: list
+        """
+        entries = dict(
+            (entry.url, entry) for entry in self.page_index.entries(urls))
+        return [self.page_from_entry(entries[url])
+                for url in urls if url in entries]
+
     def get_tags(self):
-        pages = self.index()
+        """
+            Get all tags together with the pages tagged with them.
+
+            :returns: a dictionary mapping every tag to a list of
+                pages.
+            :rtype: dict
+        """
+        self.ensure_index()
+        tagged = self.page_index.tagged()
+        pages = dict(
+            (page.url, page)
+            for page in self.pages(list(set(url for _, url in tagged))))
         tags = {}
-        for page in pages:
-            pagetags = page.tags.split(',')
-            for tag in pagetags:
-                tag = tag.strip()
-                if tag == '':
-                    continue
-                elif tags.get(tag):
-                    tags[tag].append(page)
-                else:
-                    tags[tag] = [page]
+        for tag, url in tagged:
+            tags.setdefault(tag, []).append(pages[url])
         return tags
 
+    def tag_counts(self):
+        """
+            Get all tags in use together with the number of pages
+            tagged with them, without loading any pages.
+
+            :rtype: dict
+        """
+        self.ensure_index()
+        return self.page_index.tag_counts()
+
     def index_by_tag(self, tag):
-        pages = self.index()
-        tagged = []
-        for page in pages:
-            if tag in page.tags:
-                tagged.append(page)
+        """
+            Get all pages tagged with exactly the given tag.
+
+            :param str tag: the tag
+
+            :returns: the pages, sorted by title
+            :rtype: list
+        """
+        self.ensure_index()
+        tagged = self.pages([url for _, url in self.page_index.tagged(tag)])
         return sorted(tagged, key=lambda x: x.title.lower())
 
+    def links(self, url):
+        """
+            Get the urls a page links to, whether they exist or not.
+
+            :rtype: list
+        """
+        self.ensure_index()
+        return self.page_index.links(url)
+
+    def backlinks(self, url):
+        """
+            Get the pages linking to a page ("what links here").
+
+            :param str url: the url of the page, which does not have
+                to exist.
+
+            :returns: the pages, sorted by title
+            :rtype: list
+        """
+        self.ensure_index()
+        pages = self.pages(self.page_index.backlinks(url))
+        return sorted(pages, key=lambda x: x.title.lower())
+
+    def broken_links(self):
+        """
+            Get the links to pages that do not exist.
+
+            :returns: a list of tuples of the linking page and the url
+                it links to, sorted by url.
+            :rtype: list
+        """
+        self.ensure_index()
+        broken = self.page_index.broken_links()
+        pages = dict((page.url, page) for page in self.pages(
+            list(set(source for source, _ in broken))))
+        return [(pages[source], target) for source, target in broken
+                if source in pages]
+
+    def orphans(self):
+        """
+            Get the pages no other page links to, except the home
+            page, which is linked from the navigation.
+
+            :returns: the pages, sorted by title
+            :rtype: list
+        """
+        self.ensure_index()
+        pages = self.pages(
+            [url for url in self.page_index.orphans() if url != 'home'])
+        return sorted(pages, key=lambda x: x.title.lower())
+
+    def query(self, text, limit=None):
+        """
+            Full-text search using the persistent index.
+
+            :param str text: the query, supports plain terms, prefixes
+                (``wiki*``) and phrases (``"markdown wiki"``), see
+                :func:`wiki.index.parse_query`.
+            :param int limit: the maximum number of results, optional.
+
+            :returns: the matching pages, best match first
+            :rtype: list
+        """
+        self.ensure_index()
+        return self.pages(self.page_index.search(text, limit=limit))
+
     def search(self, term, ignore_case=True, attrs=['title', 'tags', 'body']):
+        """
+            Regex search over all the pages, loads every page so
+            it should only be used where :meth:`query` does not fit.
+        """
         pages = self.index()
         regex = re.compile(term, re.IGNORECASE if ignore_case else 0)
         matched = []
@@ -0,0 +1,119 @@
+"""
+    File helpers
+    ~~~~~~~~~~~~
+"""
+from contextlib import contextmanager
+from io import open
+import os
+import tempfile
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+
+def _read_umask():
+    # the umask can only be read by setting it
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return umask
+
+
+#: the umask of the process, read once as reading it is not thread
+#: safe
+UMASK = _read_umask()
+
+
+def atomic_write(path, data, encoding='utf-8'):
+    """
+        Writes a file atomically: the data is written to a temporary
+        file in the same folder, flushed to disk and then renamed over
+        the target. Readers either see the old or the new content,
+        never a partial one, and never have to wait for the writer.
+        The file keeps its mode, new files get the mode :func:`open`
+        would give them, instead of the private one of temporary files.
+
+        :param str path: the file to write
+        :param data: the content, either text or bytes
+        :param str encoding: the encoding used for text
+    """
+    folder = os.path.dirname(os.path.abspath(path))
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    if not isinstance(data, bytes):
+        data = data.encode(encoding)
+    try:
+        mode = os.stat(path).st_mode & 0o7777
+    except OSError:
+        mode = 0o666 & ~UMASK
+    fd, tmp = tempfile.mkstemp(
+        dir=folder, prefix='.' + os.path.basename(path) + '.')
+    try:
+        with open(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp, mode)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    fsync_folder(folder)
+
+
+def fsync_folder(folder):
+    """
+        Flushes the entries of a folder to disk, so a rename within it
+        survives a crash. Not every platform can open folders, there
+        this does nothing.
+    """
+    try:
+        fd = os.open(folder, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def file_lock(path):
+    """
+        Holds an exclusive advisory lock on the given lock file, used
+        to serialize writers across processes. Readers do not need to
+        take the lock, as all writes are atomic.
+
+        :param str path: the lock file, created if necessary
+    """
+    folder = os.path.dirname(os.path.abspath(path))
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    with open(path, 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        elif msvcrt is not None:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK gives up after ten seconds
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            elif msvcrt is not None:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
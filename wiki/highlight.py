@@ -0,0 +1,122 @@
+"""
+    Highlighting
+    ~~~~~~~~~~~~
+
+    A markdown extension that caches the Pygments output of every code
+    block, so pages sharing snippets, and pages rendered again after an
+    edit to their prose, only highlight code that actually changed.
+"""
+import hashlib
+
+from markdown.extensions import Extension
+from markdown.extensions.codehilite import CodeHilite
+from markdown.extensions.codehilite import CodeHiliteExtension
+from markdown.extensions.codehilite import HiliteTreeprocessor
+from markdown.extensions.fenced_code import FencedBlockPreprocessor
+
+from wiki.core import TextCache
+
+
+#: the cache shared by all markdown engines of the process
+highlight_cache = TextCache(8 * 1024 * 1024)
+
+
+def cache_key(*parts):
+    """
+        Get the key of a code block in :data:`highlight_cache`, the
+        parts are its source and all the options of the highlighter.
+    """
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+class CachedHiliteTreeprocessor(HiliteTreeprocessor):
+    """
+        Highlights indented code blocks like the ``codehilite``
+        extension, looking up the output in :data:`highlight_cache`
+        first.
+    """
+
+    def run(self, root):
+        for block in root.iter('pre'):
+            if len(block) != 1 or block[0].tag != 'code' or \
+                    block[0].text is None:
+                continue
+            code = self.code_unescape(block[0].text)
+            key = cache_key(
+                u'indented', code, self.md.tab_length,
+                sorted(self.config.items()))
+            html = highlight_cache.get(key)
+            if html is None:
+                config = self.config.copy()
+                html = CodeHilite(
+                    code, tab_length=self.md.tab_length,
+                    style=config.pop('pygments_style', 'default'),
+                    **config).hilite()
+                highlight_cache.set(key, html)
+            placeholder = self.md.htmlStash.store(html)
+            # replaced by the html, just like by codehilite
+            block.clear()
+            block.tag = 'p'
+            block.text = placeholder
+
+
+class CachedFencedBlockPreprocessor(FencedBlockPreprocessor):
+    """
+        Highlights fenced code blocks like the ``fenced_code``
+        extension, looking up the output in :data:`highlight_cache`
+        first. Blocks that are not cached are handed to the original
+        preprocessor one by one, so the output does not change.
+    """
+
+    def highlight(self, block):
+        key = cache_key(
+            u'fenced', block, sorted(self.config.items()),
+            sorted(self.codehilite_conf.items()), self.use_attr_list)
+        html = highlight_cache.get(key)
+        stash = self.md.htmlStash
+        if html is not None:
+            return u'\n%s\n' % stash.store(html)
+        count = stash.html_counter
+        text = u'\n'.join(
+            super(CachedFencedBlockPreprocessor, self).run(block.split(u'\n')))
+        if stash.html_counter == count + 1:
+            highlight_cache.set(key, stash.rawHtmlBlocks[-1])
+        return text
+
+    def run(self, lines):
+        if not self.checked_for_deps:
+            # finds the configuration of codehilite
+            super(CachedFencedBlockPreprocessor, self).run([])
+        text = u'\n'.join(lines)
+        parts = []
+        start = 0
+        for match in self.FENCED_BLOCK_RE.finditer(text):
+            parts.append(text[start:match.start()])
+            parts.append(self.highlight(match.group(0)))
+            start = match.end()
+        parts.append(text[start:])
+        return u''.join(parts).split(u'\n')
+
+
+class HighlightCacheExtension(Extension):
+    """
+        Replaces the processors of the ``codehilite`` and
+        ``fenced_code`` extensions with their cached versions. It has
+        to be loaded after them, their configuration is kept.
+    """
+
+    def extendMarkdown(self, md):
+        for extension in md.registeredExtensions:
+            if isinstance(extension, CodeHiliteExtension):
+                hiliter = CachedHiliteTreeprocessor(md)
+                hiliter.config = extension.getConfigs()
+                md.treeprocessors.register(hiliter, 'hilite', 30)
+        if 'fenced_code_block' in md.preprocessors:
+            fenced = md.preprocessors['fenced_code_block']
+            md.preprocessors.register(
+                CachedFencedBlockPreprocessor(md, fenced.config),
+                'fenced_code_block', 25)
+
+
+def makeExtension(**kwargs):
+    return HighlightCacheExtension(**kwargs)
@@ -0,0 +1,220 @@
+"""
+    History
+    ~~~~~~~
+
+    Keeps every saved version of the pages in an append-only log per
+    page. Next to each log, an offset file holds the position of every
+    revision in fixed-size slots, so the latest revisions of a page, or
+    any single one, are found with a seek, whatever the length of its
+    history.
+"""
+from collections import namedtuple
+import hashlib
+from io import open
+import json
+import os
+import struct
+import time
+import zlib
+
+from wiki.files import file_lock
+
+
+#: a revision of a page, the content is read with
+#: :meth:`History.content`
+Revision = namedtuple(
+    'Revision', 'url number time author message version deleted')
+
+#: a slot of the offset file
+OFFSET = struct.Struct('>Q')
+
+
+class History(object):
+    """
+        The log of a page is a sequence of records, each a json header
+        line followed by the zlib compressed content. Records are only
+        ever appended, a record is part of the history once its offset
+        is written, which happens last.
+
+        :param str folder: the folder of the logs, created on first use
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+
+    def paths(self, url):
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        base = os.path.join(self.folder, key[:2], key)
+        return base + '.log', base + '.idx'
+
+    def _header(self, f, offset):
+        f.seek(offset)
+        return json.loads(f.readline().decode('utf-8'))
+
+    def _repair(self, log, idx):
+        # completes the offsets of records that were written before a
+        # crash, and drops the ones that were cut off
+        size = os.path.getsize(idx)
+        count = size // OFFSET.size
+        with open(idx, 'r+b') as index, open(log, 'r+b') as f:
+            index.truncate(count * OFFSET.size)
+            end = 0
+            if count:
+                index.seek((count - 1) * OFFSET.size)
+                offset, = OFFSET.unpack(index.read(OFFSET.size))
+                header = self._header(f, offset)
+                end = f.tell() + header['size']
+            total = os.fstat(f.fileno()).st_size
+            while end < total:
+                f.seek(end)
+                line = f.readline()
+                try:
+                    header = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    break
+                if end + len(line) + header['size'] > total:
+                    break
+                index.seek(0, os.SEEK_END)
+                index.write(OFFSET.pack(end))
+                end += len(line) + header['size']
+            f.truncate(end)
+
+    def _revision(self, url, number, header):
+        return Revision(
+            url, number, header['time'], header['author'],
+            header['message'], header['version'], header['deleted'])
+
+    def count(self, url):
+        """
+            Get the number of revisions of a page.
+        """
+        try:
+            return os.path.getsize(self.paths(url)[1]) // OFFSET.size
+        except OSError:
+            return 0
+
+    def append(self, url, content, author=None, message=None,
+               deleted=False):
+        """
+            Records a revision of a page. Saving the content of the
+            latest revision again does not record a new one.
+
+            :param str url: the url of the page
+            :param content: the source of the page, text or bytes
+            :param str author: who made the change, optional.
+            :param str message: what changed, optional.
+            :param bool deleted: whether the page was deleted
+
+            :returns: the revision
+            :rtype: Revision
+        """
+        if not isinstance(content, bytes):
+            content = content.encode('utf-8')
+        version = hashlib.sha1(content).hexdigest()
+        log, idx = self.paths(url)
+        with file_lock(idx):
+            with open(log, 'ab'):
+                pass
+            self._repair(log, idx)
+            count = self.count(url)
+            if count:
+                latest = self.revision(url, count)
+                if (latest.version, latest.deleted) == (version, deleted):
+                    return latest
+            packed = zlib.compress(content)
+            header = {
+                'number': count + 1, 'time': time.time(), 'author': author,
+                'message': message, 'version': version,
+                'deleted': deleted, 'size': len(packed)}
+            with open(log, 'ab') as f:
+                offset = f.seek(0, os.SEEK_END)
+                f.write(json.dumps(header).encode('utf-8') + b'\n' + packed)
+                f.flush()
+                os.fsync(f.fileno())
+            with open(idx, 'ab') as f:
+                f.write(OFFSET.pack(offset))
+                f.flush()
+                os.fsync(f.fileno())
+        return self._revision(url, count + 1, header)
+
+    def _offsets(self, url, start, stop):
+        with open(self.paths(url)[1], 'rb') as f:
+            f.seek((start - 1) * OFFSET.size)
+            data = f.read((stop - start + 1) * OFFSET.size)
+        return [offset for offset, in OFFSET.iter_unpack(data)]
+
+    def revisions(self, url, limit=None, before=None):
+        """
+            Get the latest revisions of a page, the newest first. Only
+            the offsets of the requested revisions are read.
+
+            :param int limit: the maximum number of revisions
+            :param int before: only revisions older than this one
+
+            :rtype: list
+        """
+        stop = self.count(url)
+        if before is not None:
+            stop = min(stop, before - 1)
+        start = 1 if limit is None else max(1, stop - limit + 1)
+        if stop < start:
+            return []
+        offsets = self._offsets(url, start, stop)
+        revisions = []
+        with open(self.paths(url)[0], 'rb') as f:
+            for number, offset in enumerate(offsets, start):
+                revisions.append(
+                    self._revision(url, number, self._header(f, offset)))
+        revisions.reverse()
+        return revisions
+
+    def revision(self, url, number):
+        """
+            Get a single revision of a page.
+
+            :returns: the revision, ``None`` if it does not exist.
+            :rtype: Revision
+        """
+        if not 0 < number <= self.count(url):
+            return None
+        return self.revisions(url, 1, number + 1)[0]
+
+    def content(self, url, number):
+        """
+            Get the source of a page at a revision.
+
+            :rtype: str
+        """
+        if not 0 < number <= self.count(url):
+            return None
+        offset, = self._offsets(url, number, number)
+        with open(self.paths(url)[0], 'rb') as f:
+            header = self._header(f, offset)
+            packed = f.read(header['size'])
+        return zlib.decompress(packed).decode('utf-8')
+
+    def move(self, url, newurl):
+        """
+            Moves the history of a page along with it. If the new url
+            has a history already, e.g. of a page deleted there, the
+            revisions are appended to it.
+        """
+        if not self.count(url):
+            return
+        log, idx = self.paths(url)
+        newlog, newidx = self.paths(newurl)
+        if not self.count(newurl):
+            folder = os.path.dirname(newlog)
+            if not os.path.exists(folder):
+                os.makedirs(folder)
+            with file_lock(idx), file_lock(newidx):
+                os.replace(log, newlog)
+                os.replace(idx, newidx)
+        else:
+            for revision in reversed(self.revisions(url)):
+                self.append(
+                    newurl, self.content(url, revision.number),
+                    revision.author, revision.message, revision.deleted)
+            with file_lock(idx):
+                os.remove(log)
+                os.remove(idx)
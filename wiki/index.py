@@ -0,0 +1,604 @@
+"""
+    Index
+    ~~~~~
+"""
+from collections import namedtuple
+from collections import OrderedDict
+import base64
+import binascii
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+
+
+#: the version of :data:`SCHEMA`, whenever the schema changes this has
+#: to be increased, existing indexes are then rebuilt from scratch.
+SCHEMA_VERSION = 6
+
+#: the schema of the persistent index, every statement has to be
+#: idempotent as it is run whenever an index is opened.
+SCHEMA = u"""
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    mtime INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    valid INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    title_key TEXT NOT NULL,
+    tags TEXT NOT NULL,
+    meta TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pages_title ON pages (valid, title_key, url);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    field TEXT NOT NULL,
+    url TEXT NOT NULL,
+    positions TEXT NOT NULL,
+    PRIMARY KEY (term, field, url)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_url ON postings (url);
+CREATE TABLE IF NOT EXISTS tags (
+    tag TEXT NOT NULL,
+    url TEXT NOT NULL,
+    PRIMARY KEY (tag, url)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS tags_url ON tags (url);
+CREATE TABLE IF NOT EXISTS lengths (
+    url TEXT NOT NULL,
+    field TEXT NOT NULL,
+    length INTEGER NOT NULL,
+    PRIMARY KEY (url, field)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS links (
+    source TEXT NOT NULL,
+    target TEXT NOT NULL,
+    PRIMARY KEY (source, target)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS links_target ON links (target);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+#: A single page as it is known to the index. The body and the urls
+#: the page links to are only needed when the entry is written to the
+#: index.
+IndexEntry = namedtuple(
+    'IndexEntry',
+    ['url', 'path', 'mtime', 'size', 'hash', 'meta', 'body', 'links'],
+    defaults=[None, ()])
+
+
+#: the weights of the searchable fields when ranking results
+FIELDS = OrderedDict([('title', 3.0), ('tags', 2.0), ('body', 1.0)])
+
+TOKEN_RE = re.compile(r'\w+', re.U)
+QUERY_RE = re.compile(r'"([^"]*)"|(\S+)', re.U)
+
+#: parameters of the BM25 ranking function
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text):
+    """
+        Splits text into lowercase search terms.
+
+        :param str text: the text to tokenize
+
+        :returns: the terms in the order they appear in the text
+        :rtype: list
+    """
+    return TOKEN_RE.findall(text.lower())
+
+
+def parse_query(query):
+    """
+        Parses a search query into clauses that all have to match.
+
+        * ``word`` matches pages containing the term
+        * ``wo*`` matches pages containing a term starting with ``wo``
+        * ``"two words"`` matches pages containing the exact phrase
+
+        Words that tokenize into multiple terms (e.g. ``foo-bar``) are
+        treated as phrases.
+
+        :param str query: the query as entered by the user
+
+        :returns: a list of ``(kind, terms)`` tuples, where kind is one
+            of ``'term'``, ``'prefix'`` or ``'phrase'``.
+        :rtype: list
+    """
+    clauses = []
+    for phrase, word in QUERY_RE.findall(query):
+        if word:
+            terms = tokenize(word)
+            if len(terms) == 1 and word.endswith('*'):
+                clauses.append(('prefix', terms))
+            elif len(terms) == 1:
+                clauses.append(('term', terms))
+            elif terms:
+                clauses.append(('phrase', terms))
+        else:
+            terms = tokenize(phrase)
+            if len(terms) == 1:
+                clauses.append(('term', terms))
+            elif terms:
+                clauses.append(('phrase', terms))
+    return clauses
+
+
+def split_tags(tags):
+    """
+        Splits the comma separated tags of a page.
+
+        :param str tags: the tags meta value
+
+        :returns: the stripped tags, without empty ones
+        :rtype: list
+    """
+    tags = [tag.strip() for tag in tags.split(',')]
+    return [tag for tag in tags if tag]
+
+
+def encode_cursor(entry):
+    """
+        Encodes the position of an entry in the title listing as an
+        opaque string that can be passed around in urls.
+
+        :param IndexEntry entry: the last entry that was shown
+    """
+    position = [entry.meta.get('title', entry.url).lower(), entry.url]
+    return base64.urlsafe_b64encode(
+        json.dumps(position).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """
+        Decodes a cursor created by :func:`encode_cursor`.
+
+        :raises ValueError: if the cursor is invalid
+
+        :returns: a ``(title_key, url)`` tuple
+        :rtype: tuple
+    """
+    try:
+        title_key, url = json.loads(
+            base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    except (TypeError, UnicodeError, binascii.Error):
+        raise ValueError('Invalid cursor: %s' % cursor)
+    if not isinstance(title_key, str) or not isinstance(url, str):
+        raise ValueError('Invalid cursor: %s' % cursor)
+    return title_key, url
+
+
+def _positions(value):
+    return [int(pos) for pos in value.split()]
+
+
+class PageIndex(object):
+    """
+        Persistent index of page metadata and full-text postings,
+        stored as a SQLite database inside the content directory.
+
+        The index stores what is needed to list pages (title, tags
+        and the full meta header) together with the size, mtime and
+        content hash of the file it was built from, so callers can
+        decide cheaply whether an entry is still current. The title,
+        tags and body of every page are kept as positional postings to
+        answer ranked, prefix and phrase queries.
+
+        :param str path: the path of the database file, will be
+            created (including its folder) on first use.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self._conn = None
+
+    def connection(self):
+        """
+            Returns the connection to the database, opening it and
+            creating the schema if necessary.
+        """
+        if self._conn is None:
+            folder = os.path.dirname(self.path)
+            if folder and not os.path.exists(folder):
+                os.makedirs(folder)
+            conn = sqlite3.connect(
+                self.path, timeout=30, check_same_thread=False)
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            if version != SCHEMA_VERSION:
+                # the index can always be rebuilt from the content,
+                # so outdated indexes are simply thrown away
+                with conn:
+                    tables = conn.execute(
+                        "SELECT name FROM sqlite_master WHERE type = 'table'"
+                    ).fetchall()
+                    for name, in tables:
+                        conn.execute('DROP TABLE "%s"' % name)
+                    conn.execute('PRAGMA user_version = %d' % SCHEMA_VERSION)
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def close(self):
+        with self.lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self):
+        """
+            Get the stat information the index was built from.
+
+            :returns: a dictionary mapping every known url (including
+                the ones of invalid files) to a tuple of mtime and
+                size.
+            :rtype: dict
+        """
+        with self.lock:
+            rows = self.connection().execute(
+                'SELECT url, mtime, size FROM pages')
+            return dict((url, (mtime, size)) for url, mtime, size in rows)
+
+    def _postings(self, entry):
+        postings = []
+        lengths = []
+        texts = {
+            'title': entry.meta.get('title', entry.url),
+            'tags': entry.meta.get('tags', u''),
+            'body': entry.body or u'',
+        }
+        for field in FIELDS:
+            terms = {}
+            tokens = tokenize(texts[field])
+            for pos, term in enumerate(tokens):
+                terms.setdefault(term, []).append(str(pos))
+            for term, positions in terms.items():
+                postings.append((term, field, entry.url, u' '.join(positions)))
+            lengths.append((entry.url, field, len(tokens)))
+        return postings, lengths
+
+    def update(self, entries=(), removed=(), invalid=()):
+        """
+            Updates the index in a single transaction.
+
+            :param list entries: :class:`IndexEntry` objects to add
+                or replace.
+            :param list removed: urls that should be dropped.
+            :param list invalid: :class:`IndexEntry` objects for files
+                that could not be parsed, they are remembered so they
+                will not be parsed again until they change.
+        """
+        rows = []
+        postings = []
+        lengths = []
+        tags = []
+        links = []
+        for entry in entries:
+            meta = entry.meta
+            title = meta.get('title', entry.url)
+            rows.append((
+                entry.url, entry.path, entry.mtime, entry.size, entry.hash,
+                1, title, title.lower(), meta.get('tags', u''),
+                json.dumps(list(meta.items()))
+            ))
+            tags.extend(
+                (tag, entry.url)
+                for tag in set(split_tags(meta.get('tags', u''))))
+            links.extend((entry.url, target) for target in set(entry.links))
+            entry_postings, entry_lengths = self._postings(entry)
+            postings.extend(entry_postings)
+            lengths.extend(entry_lengths)
+        for entry in invalid:
+            rows.append((
+                entry.url, entry.path, entry.mtime, entry.size, entry.hash,
+                0, u'', u'', u'', u'[]'
+            ))
+        dropped = [(url,) for url in removed]
+        dropped.extend((row[0],) for row in rows)
+        with self.lock:
+            conn = self.connection()
+            with conn:
+                conn.executemany('DELETE FROM pages WHERE url = ?', dropped)
+                conn.executemany('DELETE FROM postings WHERE url = ?', dropped)
+                conn.executemany('DELETE FROM lengths WHERE url = ?', dropped)
+                conn.executemany('DELETE FROM tags WHERE url = ?', dropped)
+                conn.executemany(
+                    'DELETE FROM links WHERE source = ?', dropped)
+                conn.executemany(
+                    'INSERT INTO pages VALUES '
+                    '(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+                conn.executemany(
+                    'INSERT INTO postings VALUES (?, ?, ?, ?)', postings)
+                conn.executemany(
+                    'INSERT INTO lengths VALUES (?, ?, ?)', lengths)
+                conn.executemany('INSERT INTO tags VALUES (?, ?)', tags)
+                conn.executemany('INSERT INTO links VALUES (?, ?)', links)
+                if dropped:
+                    revision = conn.execute(
+                        "SELECT value FROM state WHERE key = 'revision'"
+                    ).fetchone()
+                    conn.executemany(
+                        'INSERT OR REPLACE INTO state VALUES (?, ?)',
+                        [('revision', (revision[0] if revision else 0) + 1),
+                         ('modified', time.time())])
+
+    def revision(self):
+        """
+            Get the revision of the index, which changes whenever a
+            page is added, changed or removed.
+
+            :returns: a tuple of the revision number and the time of
+                the last change, ``(0, None)`` for an empty index.
+            :rtype: tuple
+        """
+        with self.lock:
+            state = dict(self.connection().execute(
+                "SELECT key, value FROM state "
+                "WHERE key IN ('revision', 'modified')"))
+        return state.get('revision', 0), state.get('modified')
+
+    def entries(self, urls=None):
+        """
+            Get valid pages in the index.
+
+            :param list urls: only return the pages with the given
+                urls, optional.
+
+            :returns: a list of :class:`IndexEntry` objects.
+            :rtype: list
+        """
+        query = ('SELECT url, path, mtime, size, hash, meta FROM pages '
+                 'WHERE valid = 1')
+        with self.lock:
+            conn = self.connection()
+            if urls is None:
+                rows = conn.execute(query).fetchall()
+            else:
+                rows = []
+                for url in urls:
+                    rows.extend(conn.execute(query + ' AND url = ?', (url,)))
+        return [
+            IndexEntry(url, path, mtime, size, hash_,
+                       OrderedDict(json.loads(meta)))
+            for url, path, mtime, size, hash_, meta in rows
+        ]
+
+    def listing(self, after=None, limit=None):
+        """
+            Get valid pages sorted by their lowercase title (and url for
+            pages with the same title), served from the title index.
+
+            :param tuple after: only return the pages sorted after this
+                ``(title_key, url)`` position, optional.
+            :param int limit: the maximum number of pages, optional.
+
+            :returns: a list of :class:`IndexEntry` objects.
+            :rtype: list
+        """
+        query = ('SELECT url, path, mtime, size, hash, meta FROM pages '
+                 'WHERE valid = 1')
+        args = []
+        if after is not None:
+            query += ' AND (title_key, url) > (?, ?)'
+            args.extend(after)
+        query += ' ORDER BY title_key, url'
+        if limit is not None:
+            query += ' LIMIT ?'
+            args.append(limit)
+        with self.lock:
+            rows = self.connection().execute(query, args).fetchall()
+        return [
+            IndexEntry(url, path, mtime, size, hash_,
+                       OrderedDict(json.loads(meta)))
+            for url, path, mtime, size, hash_, meta in rows
+        ]
+
+    def tag_counts(self):
+        """
+            Get all tags in use.
+
+            :returns: a dictionary mapping every tag to the number of
+                pages tagged with it.
+            :rtype: dict
+        """
+        with self.lock:
+            return dict(self.connection().execute(
+                'SELECT tag, COUNT(*) FROM tags GROUP BY tag'))
+
+    def tagged(self, tag=None):
+        """
+            Get the urls of tagged pages.
+
+            :param str tag: only return the pages with exactly this
+                tag, optional.
+
+            :returns: a list of tuples of tag and url
+            :rtype: list
+        """
+        with self.lock:
+            conn = self.connection()
+            if tag is None:
+                return conn.execute('SELECT tag, url FROM tags').fetchall()
+            return conn.execute(
+                'SELECT tag, url FROM tags WHERE tag = ?', (tag,)).fetchall()
+
+    def links(self, url):
+        """
+            Get the urls a page links to, whether they exist or not.
+
+            :rtype: list
+        """
+        with self.lock:
+            return [target for target, in self.connection().execute(
+                'SELECT target FROM links WHERE source = ? ORDER BY target',
+                (url,))]
+
+    def backlinks(self, url):
+        """
+            Get the urls of the pages linking to a page.
+
+            :rtype: list
+        """
+        with self.lock:
+            return [source for source, in self.connection().execute(
+                'SELECT source FROM links WHERE target = ? ORDER BY source',
+                (url,))]
+
+    def referrers(self, urls):
+        """
+            Get the pages linking to any of the given urls.
+
+            :param list urls: the urls linked to
+
+            :returns: the urls of the linking pages, sorted
+            :rtype: list
+        """
+        urls = list(urls)
+        sources = set()
+        with self.lock:
+            conn = self.connection()
+            # stay below the limit of variables of a statement
+            for start in range(0, len(urls), 500):
+                chunk = urls[start:start + 500]
+                sources.update(source for source, in conn.execute(
+                    'SELECT DISTINCT source FROM links WHERE target IN '
+                    '(%s)' % ', '.join('?' * len(chunk)), chunk))
+        return sorted(sources)
+
+    def descendants(self, url):
+        """
+            Get the urls of all the files below an url, including
+            the ones of invalid files.
+
+            :rtype: list
+        """
+        prefix = url + u'/'
+        with self.lock:
+            return [child for child, in self.connection().execute(
+                'SELECT url FROM pages WHERE url >= ? AND url < ? '
+                'ORDER BY url', (prefix, prefix + u'\U0010ffff'))]
+
+    def broken_links(self):
+        """
+            Get the links to pages that do not exist.
+
+            :returns: a list of tuples of the url of the linking page
+                and the url it links to.
+            :rtype: list
+        """
+        with self.lock:
+            return self.connection().execute(
+                'SELECT source, target FROM links WHERE target NOT IN '
+                '(SELECT url FROM pages WHERE valid = 1) '
+                'ORDER BY source, target').fetchall()
+
+    def orphans(self):
+        """
+            Get the urls of the pages no other page links to.
+
+            :rtype: list
+        """
+        with self.lock:
+            return [url for url, in self.connection().execute(
+                'SELECT url FROM pages WHERE valid = 1 AND url NOT IN '
+                '(SELECT target FROM links WHERE source != target) '
+                'ORDER BY url')]
+
+    def _match(self, conn, kind, terms):
+        # returns a dictionary of (url, field) -> number of matches
+        if kind == 'term':
+            rows = conn.execute(
+                'SELECT url, field, positions FROM postings WHERE term = ?',
+                (terms[0],))
+            return dict(((url, field), len(positions.split()))
+                        for url, field, positions in rows)
+        if kind == 'prefix':
+            rows = conn.execute(
+                'SELECT url, field, positions FROM postings '
+                'WHERE term >= ? AND term < ?',
+                (terms[0], terms[0] + u'\U0010ffff'))
+            matches = {}
+            for url, field, positions in rows:
+                key = (url, field)
+                matches[key] = matches.get(key, 0) + len(positions.split())
+            return matches
+        # phrases: all terms in the same field, at consecutive positions
+        candidates = None
+        for offset, term in enumerate(terms):
+            rows = conn.execute(
+                'SELECT url, field, positions FROM postings WHERE term = ?',
+                (term,))
+            current = {}
+            for url, field, positions in rows:
+                key = (url, field)
+                if candidates is not None and key not in candidates:
+                    continue
+                shifted = set(pos - offset for pos in _positions(positions))
+                if candidates is not None:
+                    shifted &= candidates[key]
+                if shifted:
+                    current[key] = shifted
+            candidates = current
+            if not candidates:
+                break
+        return dict((key, len(starts)) for key, starts in candidates.items())
+
+    def search(self, query, limit=None):
+        """
+            Runs a full-text query against the index, see
+            :func:`parse_query` for the syntax. Every clause has to
+            match in one of the fields, the results are ranked with
+            BM25, weighted by :data:`FIELDS`.
+
+            :param str query: the query
+            :param int limit: the maximum number of results, optional.
+
+            :returns: a list of urls, the best match first.
+            :rtype: list
+        """
+        clauses = parse_query(query)
+        if not clauses:
+            return []
+        with self.lock:
+            conn = self.connection()
+            total = conn.execute(
+                'SELECT COUNT(*) FROM pages WHERE valid = 1').fetchone()[0]
+            averages = dict(conn.execute(
+                'SELECT field, AVG(length) FROM lengths GROUP BY field'))
+            matches = [self._match(conn, kind, terms)
+                       for kind, terms in clauses]
+            urls = set.intersection(*[
+                set(url for url, _ in match) for match in matches])
+            lengths = {}
+            for url in urls:
+                lengths.update(
+                    ((url, field), length) for field, length in conn.execute(
+                        'SELECT field, length FROM lengths WHERE url = ?',
+                        (url,)))
+        scores = dict((url, 0.0) for url in urls)
+        for match in matches:
+            found = set(url for url, _ in match)
+            idf = math.log(1 + (total - len(found) + 0.5) / (len(found) + 0.5))
+            for (url, field), tf in match.items():
+                if url not in scores:
+                    continue
+                norm = lengths.get((url, field), 0) / \
+                    (averages.get(field) or 1.0)
+                scores[url] += FIELDS[field] * idf * \
+                    tf * (K1 + 1) / (tf + K1 * (1 - B + B * norm))
+        ranked = sorted(scores, key=lambda url: (-scores[url], url))
+        if limit is not None:
+            ranked = ranked[:limit]
+        return ranked
@@ -0,0 +1,96 @@
+"""
+    Journal
+    ~~~~~~~
+
+    A small write-ahead journal of the pages that are being changed.
+    Every change to the content directory is recorded before it starts
+    and marked as done once the indexes are updated, so the indexes can
+    be brought back in line with the files after a crash.
+"""
+from contextlib import contextmanager
+from io import open
+import json
+import os
+import uuid
+
+from wiki.files import file_lock
+
+
+class Journal(object):
+    """
+        The journal is a file of json lines, either ``{"id", "urls"}``
+        when a change starts, or ``{"done"}`` when it is complete. It
+        is truncated whenever no change is pending, so it stays small.
+
+        :param str path: the journal file, created on first use.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def _append(self, record):
+        # the lock keeps the records of concurrent processes whole and
+        # the truncation from dropping a change that just started
+        with file_lock(self.path + '.lock'):
+            with open(self.path, 'ab') as f:
+                f.write(json.dumps(record).encode('utf-8') + b'\n')
+                f.flush()
+                os.fsync(f.fileno())
+            if 'done' in record and not self._pending():
+                with open(self.path, 'wb'):
+                    pass
+
+    def _pending(self):
+        started = {}
+        try:
+            with open(self.path, 'rb') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line.decode('utf-8'))
+                    except ValueError:
+                        # a partial line of a crashed write
+                        continue
+                    if 'done' in record:
+                        started.pop(record['done'], None)
+                    else:
+                        started[record['id']] = record['urls']
+        except (IOError, OSError):
+            pass
+        return started
+
+    def begin(self, urls):
+        """
+            Records that the given pages are about to change.
+
+            :returns: the id of the change
+        """
+        change = uuid.uuid4().hex
+        self._append({'id': change, 'urls': sorted(urls)})
+        return change
+
+    def done(self, change):
+        """
+            Records that a change is complete.
+        """
+        self._append({'done': change})
+
+    @contextmanager
+    def record(self, urls):
+        """
+            Records a change around the block. If the block raises,
+            the change stays pending and is replayed.
+        """
+        change = self.begin(urls)
+        yield change
+        self.done(change)
+
+    def pending(self):
+        """
+            Get the changes that were started but not completed.
+
+            :returns: a dictionary mapping the ids of the changes to
+                the urls of the pages they touch.
+            :rtype: dict
+        """
+        with file_lock(self.path + '.lock'):
+            return self._pending()
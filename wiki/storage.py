@@ -0,0 +1,473 @@
+"""
+    Storage
+    ~~~~~~~
+
+    Where the sources of the pages are kept. The wiki reads and writes
+    pages only through a :class:`Storage`, so the content directory of
+    markdown files can be replaced by a single SQLite file for very
+    large wikis, or by memory for tests and benchmarks.
+"""
+from collections import namedtuple
+import errno
+from io import open
+import os
+import sqlite3
+import threading
+import time
+
+from wiki.files import atomic_write
+
+
+#: the mtime in nanoseconds and the size of a page, named like the
+#: fields of :func:`os.stat` results, which the files storage returns
+Stat = namedtuple('Stat', ['st_mtime_ns', 'st_size'])
+
+
+def not_found(url):
+    return FileNotFoundError(errno.ENOENT, 'No such page', url)
+
+
+def below(url):
+    # the range of the urls below a folder: '/' is followed by '0'
+    return url + u'/', url + u'0'
+
+
+class Storage(object):
+    """
+        The interface of the storages. Pages are addressed by their
+        url, their sources are bytes. Reading, renaming or deleting a
+        page that does not exist raises :class:`FileNotFoundError`,
+        just like a missing file.
+    """
+
+    #: the name of the storage in the ``STORAGE`` setting
+    name = None
+
+    #: whether worker processes can open the storage, otherwise
+    #: :meth:`~wiki.core.Wiki.build_index` runs in the current process
+    parallel = True
+
+    def path(self, url):
+        """
+            Get what identifies the page in the page index and in
+            messages, the path of its file where there is one.
+        """
+        raise NotImplementedError()
+
+    def stat(self, url):
+        """
+            Get the :class:`Stat` of a page, ``None`` if it does not
+            exist.
+        """
+        raise NotImplementedError()
+
+    def exists(self, url):
+        return self.stat(url) is not None
+
+    def read(self, url):
+        raise NotImplementedError()
+
+    def write(self, url, data):
+        """
+            Writes a page atomically, readers either get the old or
+            the new source.
+        """
+        raise NotImplementedError()
+
+    def delete(self, url):
+        raise NotImplementedError()
+
+    def walk(self, prefix=None):
+        """
+            Get all the pages, or the ones below the given url.
+
+            :returns: a generator of tuples of url and :class:`Stat`
+        """
+        raise NotImplementedError()
+
+    def is_folder(self, url):
+        """
+            Whether there are pages below the given url.
+        """
+        for _ in self.walk(url):
+            return True
+        return False
+
+    def rename(self, url, newurl):
+        raise NotImplementedError()
+
+    def rename_folder(self, url, newurl):
+        """
+            Moves all the pages below a url.
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+
+class FileStorage(Storage):
+    """
+        Keeps every page as a markdown file in the content directory,
+        e.g. ``docs/intro.md`` for the url ``docs/intro``. Files whose
+        names are not clean urls (e.g. ``My Page.md`` for ``my_page``)
+        are looked up folder by folder when there is no file with the
+        clean name, and read and written through the path they were
+        found at.
+
+        :param str root: the content directory
+        :param list exclude: folders of the content directory that do
+            not hold pages.
+    """
+
+    name = 'files'
+
+    def __init__(self, root, exclude=()):
+        self.root = root
+        self.exclude = list(exclude)
+        #: the paths of the files whose name differs from their url
+        self.paths = {}
+
+    def path(self, url):
+        path = self.paths.get(url)
+        if path is not None:
+            return path
+        return os.path.abspath(os.path.join(self.root, url + '.md'))
+
+    def lookup(self, url, folder=False):
+        """
+            Looks up the file, or the folder, of a url whose name is
+            not clean, e.g. after a restart or if it was created since
+            the last walk. Only the folders along the url are listed.
+
+            :returns: the path or ``None`` if there is no such file
+        """
+        # imported here, the core imports the storages
+        from wiki.core import clean_url
+        path = os.path.abspath(self.root)
+        parts = url.split(u'/')
+        for index, part in enumerate(parts):
+            is_file = not folder and index == len(parts) - 1
+            try:
+                names = sorted(os.listdir(path))
+            except OSError:
+                return None
+            if not index:
+                names = [name for name in names if name not in self.exclude]
+            for name in names:
+                if is_file:
+                    found = name.endswith('.md') and \
+                        clean_url(name[:-3]) == part
+                else:
+                    found = clean_url(name) == part
+                if found and os.path.isdir(os.path.join(path, name)) != \
+                        is_file:
+                    path = os.path.join(path, name)
+                    break
+            else:
+                return None
+        return path
+
+    def find(self, url):
+        """
+            Looks up the file of a page and remembers it, see
+            :meth:`lookup`.
+        """
+        self.paths.pop(url, None)
+        path = self.lookup(url)
+        if path is not None:
+            self.paths[url] = path
+        return path
+
+    def existing(self, url):
+        """
+            Get the path of the file of a page, which is the clean one
+            if there is no file yet.
+        """
+        path = self.path(url)
+        if not os.path.exists(path):
+            path = self.find(url) or self.path(url)
+        return path
+
+    def folder(self, url):
+        path = os.path.join(self.root, url)
+        if not os.path.isdir(path):
+            path = self.lookup(url, folder=True) or path
+        return path
+
+    def stat(self, url):
+        try:
+            return os.stat(self.path(url))
+        except OSError:
+            path = self.find(url)
+        try:
+            return os.stat(path) if path else None
+        except OSError:
+            return None
+
+    def read(self, url):
+        with open(self.existing(url), 'rb') as f:
+            return f.read()
+
+    def write(self, url, data):
+        atomic_write(self.existing(url), data)
+
+    def delete(self, url):
+        os.remove(self.existing(url))
+        self.paths.pop(url, None)
+
+    def url_for_path(self, path):
+        """
+            Get the url of a markdown file in the content directory.
+
+            :returns: the url or ``None`` if the path is no page
+        """
+        # imported here, the core imports the storages
+        from wiki.core import clean_url
+        root = os.path.abspath(self.root)
+        path = os.path.abspath(path)
+        if not path.startswith(root + os.sep) or not path.endswith('.md'):
+            return None
+        relative = path[len(root)+1:]
+        if relative.split(os.sep, 1)[0] in self.exclude:
+            return None
+        url = clean_url(relative[:-3])
+        if os.path.join(root, url + '.md') != path:
+            self.paths[url] = path
+        return url
+
+    def walk(self, prefix=None):
+        # make sure we always have the absolute path for fixing the
+        # walk path
+        root = os.path.abspath(self.root)
+        folder = os.path.abspath(self.folder(prefix)) if prefix else root
+        for cur_dir, dirs, files in os.walk(folder):
+            if cur_dir == root:
+                dirs[:] = [name for name in dirs if name not in self.exclude]
+            for cur_file in files:
+                if cur_file.endswith('.md'):
+                    path = os.path.join(cur_dir, cur_file)
+                    yield self.url_for_path(path), os.stat(path)
+
+    def is_folder(self, url):
+        return os.path.isdir(self.folder(url))
+
+    def _rename(self, source, target):
+        folder = os.path.dirname(target)
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        os.rename(source, target)
+
+    def rename(self, url, newurl):
+        self._rename(self.existing(url), self.path(newurl))
+        self.paths.pop(url, None)
+
+    def rename_folder(self, url, newurl):
+        # the whole folder is moved, including the files that are no
+        # pages (e.g. images)
+        self._rename(self.folder(url), os.path.join(self.root, newurl))
+        start, end = below(url)
+        for moved in [u for u in self.paths if start <= u < end]:
+            del self.paths[moved]
+
+
+class SQLiteStorage(Storage):
+    """
+        Keeps all the pages in a single SQLite database. Listing the
+        pages and their stat information is a single query, however
+        many folders the wiki has.
+
+        :param str filename: the database file, created on first use
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self._conn = None
+
+    def __getstate__(self):
+        # worker processes open their own connection
+        return {'filename': self.filename}
+
+    def __setstate__(self, state):
+        self.__init__(state['filename'])
+
+    def connection(self):
+        if self._conn is None:
+            folder = os.path.dirname(self.filename)
+            if folder and not os.path.exists(folder):
+                os.makedirs(folder)
+            conn = sqlite3.connect(
+                self.filename, timeout=30, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS pages ('
+                'url TEXT PRIMARY KEY, data BLOB NOT NULL, '
+                'mtime INTEGER NOT NULL, size INTEGER NOT NULL)')
+            self._conn = conn
+        return self._conn
+
+    def close(self):
+        with self.lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def path(self, url):
+        return u'%s#%s' % (os.path.abspath(self.filename), url)
+
+    def stat(self, url):
+        with self.lock:
+            row = self.connection().execute(
+                'SELECT mtime, size FROM pages WHERE url = ?',
+                (url,)).fetchone()
+        return Stat(*row) if row else None
+
+    def read(self, url):
+        with self.lock:
+            row = self.connection().execute(
+                'SELECT data FROM pages WHERE url = ?', (url,)).fetchone()
+        if row is None:
+            raise not_found(url)
+        return bytes(row[0])
+
+    def write(self, url, data):
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        with self.lock:
+            conn = self.connection()
+            with conn:
+                row = conn.execute(
+                    'SELECT mtime FROM pages WHERE url = ?',
+                    (url,)).fetchone()
+                # every write changes the mtime, so the page index
+                # notices it even within the resolution of the clock
+                mtime = time.time_ns()
+                if row is not None:
+                    mtime = max(mtime, row[0] + 1)
+                conn.execute(
+                    'INSERT OR REPLACE INTO pages (url, data, mtime, size) '
+                    'VALUES (?, ?, ?, ?)', (url, data, mtime, len(data)))
+
+    def delete(self, url):
+        with self.lock:
+            conn = self.connection()
+            with conn:
+                deleted = conn.execute(
+                    'DELETE FROM pages WHERE url = ?', (url,)).rowcount
+        if not deleted:
+            raise not_found(url)
+
+    def walk(self, prefix=None):
+        query = 'SELECT url, mtime, size FROM pages'
+        args = ()
+        if prefix:
+            query += ' WHERE url >= ? AND url < ?'
+            args = below(prefix)
+        with self.lock:
+            rows = self.connection().execute(query, args).fetchall()
+        for url, mtime, size in rows:
+            yield url, Stat(mtime, size)
+
+    def rename(self, url, newurl):
+        with self.lock:
+            conn = self.connection()
+            with conn:
+                renamed = conn.execute(
+                    'UPDATE pages SET url = ? WHERE url = ?',
+                    (newurl, url)).rowcount
+        if not renamed:
+            raise not_found(url)
+
+    def rename_folder(self, url, newurl):
+        start, end = below(url)
+        with self.lock:
+            conn = self.connection()
+            with conn:
+                conn.execute(
+                    'UPDATE pages SET url = ? || substr(url, ?) '
+                    'WHERE url >= ? AND url < ?',
+                    (newurl, len(url) + 1, start, end))
+
+
+class MemoryStorage(Storage):
+    """
+        Keeps the pages in a dictionary, for tests and benchmarks.
+        Nothing is persisted.
+    """
+
+    name = 'memory'
+    parallel = False
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pages = {}
+
+    def path(self, url):
+        return u'memory:%s' % url
+
+    def stat(self, url):
+        with self.lock:
+            page = self.pages.get(url)
+        return page[1] if page else None
+
+    def read(self, url):
+        with self.lock:
+            page = self.pages.get(url)
+        if page is None:
+            raise not_found(url)
+        return page[0]
+
+    def write(self, url, data):
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        with self.lock:
+            mtime = time.time_ns()
+            if url in self.pages:
+                mtime = max(mtime, self.pages[url][1].st_mtime_ns + 1)
+            self.pages[url] = (data, Stat(mtime, len(data)))
+
+    def delete(self, url):
+        with self.lock:
+            if self.pages.pop(url, None) is None:
+                raise not_found(url)
+
+    def walk(self, prefix=None):
+        with self.lock:
+            pages = sorted(self.pages.items())
+        start, end = below(prefix) if prefix else (u'', None)
+        for url, (_, stat) in pages:
+            if url >= start and (end is None or url < end):
+                yield url, stat
+
+    def rename(self, url, newurl):
+        with self.lock:
+            if url not in self.pages:
+                raise not_found(url)
+            self.pages[newurl] = self.pages.pop(url)
+
+    def rename_folder(self, url, newurl):
+        start, end = below(url)
+        with self.lock:
+            for old in [u for u in self.pages if start <= u < end]:
+                self.pages[newurl + old[len(url):]] = self.pages.pop(old)
+
+
+def create_storage(name, root, exclude=()):
+    """
+        Creates the storage for the ``STORAGE`` setting.
+
+        :param str name: ``'files'``, ``'sqlite'`` or ``'memory'``
+        :param str root: the content directory, the SQLite storage
+            keeps its database there as ``pages.db``.
+        :param list exclude: see :class:`FileStorage`
+    """
+    if name == 'files':
+        return FileStorage(root, exclude)
+    if name == 'sqlite':
+        return SQLiteStorage(os.path.join(root, 'pages.db'))
+    if name == 'memory':
+        return MemoryStorage()
+    raise ValueError('Unknown storage: %s' % name)
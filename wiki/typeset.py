@@ -0,0 +1,186 @@
+"""
+    Typesetting
+    ~~~~~~~~~~~
+
+    Renders the math of pages to SVG on the server, instead of leaving
+    it to ``tex-svg.js`` in the browser. Formulas are cached by hash,
+    so formulas repeated across pages are typeset once.
+"""
+from collections import OrderedDict
+import hashlib
+from io import open
+import os
+import re
+import subprocess
+import threading
+
+from flask import current_app
+from flask import has_app_context
+from markupsafe import escape
+
+from wiki.files import atomic_write
+
+
+#: the math left in the html by the ``mdx_math`` extension
+MATH_RE = re.compile(
+    r'<script type="math/tex(; mode=display)?">(.*?)</script>', re.S)
+
+#: math that only ``tex-svg.js`` typesets, ``mdx_math`` does not
+#: handle single dollar delimiters
+DOLLAR_RE = re.compile(r'\$[^$\n]+\$')
+
+
+class TypesetError(Exception):
+    pass
+
+
+class StandInTypesetter(object):
+    """
+        Renders formulas as their plain TeX source inside an SVG, for
+        tests and setups without a TeX renderer.
+    """
+
+    name = 'standin'
+
+    def __call__(self, tex, display=False):
+        width = max(len(tex), 1) * 8
+        return (
+            u'<svg xmlns="http://www.w3.org/2000/svg" class="math-standin" '
+            u'role="img" aria-label="{0}" width="{1}" height="20">'
+            u'<text x="0" y="15" font-family="serif">{0}</text>'
+            u'</svg>'.format(escape(tex), width))
+
+
+class CommandTypesetter(object):
+    """
+        Renders formulas with an external command that prints the
+        SVG, e.g. ``tex2svg`` of ``mathjax-node-cli``. The command is
+        called with ``--inline`` for inline math and the formula as
+        the last argument, after ``--`` so formulas starting with a
+        dash are not taken for options.
+
+        :param list command: the command and its arguments
+        :param float timeout: how long to wait for one formula
+    """
+
+    name = 'command'
+
+    def __init__(self, command=('tex2svg',), timeout=10.0):
+        self.command = list(command)
+        self.timeout = timeout
+        self.name = u'command:%s' % u' '.join(self.command)
+
+    def __call__(self, tex, display=False):
+        args = self.command + ([] if display else ['--inline']) + \
+            ['--', tex]
+        try:
+            result = subprocess.run(
+                args, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                timeout=self.timeout)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            raise TypesetError(str(e))
+        if result.returncode != 0 or b'<svg' not in result.stdout:
+            raise TypesetError(result.stderr.decode('utf-8', 'replace'))
+        return result.stdout.decode('utf-8').strip()
+
+
+class MathRenderer(object):
+    """
+        Replaces the math of rendered html with SVG.
+
+        :param typesetter: called with the TeX source and whether it
+            is display math, returns the SVG.
+        :param str folder: a folder to keep the SVG in between
+            restarts, optional.
+        :param int max_entries: how many formulas are kept in memory
+    """
+
+    def __init__(self, typesetter, folder=None, max_entries=4096):
+        self.typesetter = typesetter
+        self.folder = folder
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def key(self, tex, display):
+        digest = hashlib.sha1()
+        for part in (self.typesetter.name, u'display' if display else u'',
+                     tex):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def svg(self, tex, display=False):
+        """
+            Get the SVG of a formula, from the cache if possible.
+
+            :raises TypesetError: if the formula could not be rendered
+        """
+        key = self.key(tex, display)
+        with self.lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        path = None
+        svg = None
+        if self.folder is not None:
+            path = os.path.join(self.folder, key[:2], key + '.svg')
+            try:
+                with open(path, encoding='utf-8') as f:
+                    svg = f.read()
+            except (IOError, OSError):
+                pass
+        if svg is None:
+            svg = self.typesetter(tex, display)
+            if path is not None:
+                atomic_write(path, svg)
+        with self.lock:
+            self._entries[key] = svg
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return svg
+
+    def __call__(self, html):
+        def replace(match):
+            display = bool(match.group(1))
+            try:
+                svg = self.svg(match.group(2), display)
+            except TypesetError:
+                # left to the browser
+                return match.group(0)
+            if display:
+                return u'<span class="math display" style="display: block; ' \
+                    u'text-align: center">%s</span>' % svg
+            return u'<span class="math">%s</span>' % svg
+        return MATH_RE.sub(replace, html)
+
+
+def create_renderer(name, folder=None, command=None):
+    """
+        Creates the math renderer for the ``MATH_RENDERER`` setting.
+
+        :param str name: ``'standin'`` or ``'command'``
+        :param str folder: see :class:`MathRenderer`
+        :param list command: the command of the
+            :class:`CommandTypesetter`, optional.
+    """
+    if name == 'standin':
+        typesetter = StandInTypesetter()
+    elif name == 'command':
+        typesetter = CommandTypesetter(command or ('tex2svg',))
+    else:
+        raise ValueError('Unknown math renderer: %s' % name)
+    return MathRenderer(typesetter, folder)
+
+
+def render_math(html):
+    """
+        Postprocessor that renders math with the renderer of the
+        current app, if one is configured.
+    """
+    if not has_app_context():
+        return html
+    renderer = current_app.extensions.get('math')
+    if renderer is None:
+        return html
+    return renderer(html)
@@ -0,0 +1,200 @@
+"""
+    Watcher
+    ~~~~~~~
+
+    Keeps the indexes of a :class:`~wiki.core.Wiki` current when the
+    content directory is changed outside of the web interface (editors,
+    git pulls, sync tools). Only the files storage has a content
+    directory to watch.
+"""
+import os
+import threading
+
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+
+class Watcher(object):
+    """
+        Base class of the watchers. A watcher runs in a background
+        thread, collects the paths that changed within one interval
+        and hands them to :meth:`~wiki.core.Wiki.refresh` as a batch.
+
+        :param wiki: the :class:`~wiki.core.Wiki` to keep current
+        :param float interval: how long to collect changes before
+            they are processed, in seconds.
+    """
+
+    def __init__(self, wiki, interval=1.0):
+        self.wiki = wiki
+        self.interval = interval
+        self.root = os.path.abspath(wiki.root)
+        self.state = os.path.join(self.root, wiki.state_folder)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def relevant(self, path):
+        """
+            Whether a change to the given path can affect the wiki.
+        """
+        return path.endswith('.md') and \
+            not path.startswith(self.state + os.sep)
+
+    def prepare(self):
+        """
+            Called before the initial sync, so no change between the
+            sync and the first poll is missed.
+        """
+
+    def poll(self):
+        """
+            Waits up to one interval for changes.
+
+            :returns: the set of changed paths
+            :rtype: set
+        """
+        raise NotImplementedError()
+
+    def check(self):
+        """
+            Polls once and refreshes the wiki with the changes found.
+
+            :returns: the set of changed paths
+            :rtype: set
+        """
+        paths = set(path for path in self.poll() if self.relevant(path))
+        if paths:
+            self.wiki.refresh(paths)
+        return paths
+
+    def run(self):
+        while not self._stop.is_set():
+            self.check()
+
+    def start(self):
+        """
+            Brings the index up to date and starts watching in a
+            background thread.
+        """
+        self.prepare()
+        self.wiki.update_index()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name='wiki-watcher')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+class PollingWatcher(Watcher):
+    """
+        Watcher that compares the mtime and size of all the markdown
+        files with the last poll. Only needs :func:`os.stat`, so it
+        works everywhere.
+    """
+
+    def __init__(self, wiki, interval=1.0):
+        super(PollingWatcher, self).__init__(wiki, interval)
+        self.snapshot = {}
+
+    def scan(self):
+        snapshot = {}
+        for _, path, stat in self.wiki.walk():
+            snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def prepare(self):
+        self.snapshot = self.scan()
+
+    def poll(self):
+        if self._stop.wait(self.interval):
+            return set()
+        snapshot = self.scan()
+        changed = set(
+            path for path, stat in snapshot.items()
+            if self.snapshot.get(path) != stat)
+        changed.update(set(self.snapshot) - set(snapshot))
+        self.snapshot = snapshot
+        return changed
+
+
+class InotifyWatcher(Watcher):
+    """
+        Watcher that is notified by the kernel, requires Linux and
+        the ``inotify_simple`` package.
+    """
+
+    def __init__(self, wiki, interval=1.0):
+        super(InotifyWatcher, self).__init__(wiki, interval)
+        flags = inotify_simple.flags
+        self.mask = (flags.CLOSE_WRITE | flags.CREATE | flags.DELETE |
+                     flags.MOVED_FROM | flags.MOVED_TO | flags.MODIFY)
+        self.inotify = None
+        self.folders = {}
+
+    def watch(self, folder):
+        for cur_dir, dirs, _ in os.walk(folder):
+            if cur_dir == self.root and self.wiki.state_folder in dirs:
+                dirs.remove(self.wiki.state_folder)
+            wd = self.inotify.add_watch(cur_dir, self.mask)
+            self.folders[wd] = cur_dir
+
+    def prepare(self):
+        self.inotify = inotify_simple.INotify()
+        self.watch(self.root)
+
+    def poll(self):
+        changed = set()
+        # wait for the first event and keep collecting for the
+        # interval, so bursts (e.g. git checkouts) end up in one batch
+        events = self.inotify.read(
+            timeout=int(self.interval * 1000),
+            read_delay=int(self.interval * 1000))
+        for event in events:
+            folder = self.folders.get(event.wd)
+            if folder is None:
+                continue
+            path = os.path.join(folder, event.name)
+            flags = inotify_simple.flags
+            if event.mask & flags.ISDIR:
+                if event.mask & (flags.CREATE | flags.MOVED_TO):
+                    # new folders may already contain files
+                    self.watch(path)
+                    prefix = os.path.relpath(path, self.root)
+                    changed.update(p for _, p, _ in self.wiki.walk(
+                        prefix.replace(os.sep, '/')))
+                elif event.mask & flags.MOVED_FROM:
+                    # the files of a folder moved away vanish silently
+                    prefix = path + os.sep
+                    changed.update(
+                        entry.path for entry in self.wiki.page_index.entries()
+                        if entry.path.startswith(prefix))
+                continue
+            changed.add(path)
+        return changed
+
+    def stop(self):
+        super(InotifyWatcher, self).stop()
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
+
+
+def create_watcher(wiki, interval=1.0, polling=False):
+    """
+        Creates the best available watcher for the given wiki.
+
+        :param wiki: the :class:`~wiki.core.Wiki` to keep current
+        :param float interval: see :class:`Watcher`
+        :param bool polling: always use the :class:`PollingWatcher`
+    """
+    if inotify_simple is not None and not polling:
+        return InotifyWatcher(wiki, interval)
+    return PollingWatcher(wiki, interval)
@@ -2,29 +2,31 @@ import os
 
 from flask import current_app
 from flask import Flask
-from flask import g
 from flask_login import LoginManager
 from werkzeug.local import LocalProxy
 
+from wiki.core import RenderCache
 from wiki.core import Wiki
+from wiki.highlight import highlight_cache
+from wiki.storage import create_storage
+from wiki.typeset import create_renderer
+from wiki.watcher import create_watcher
+from wiki.web.assets import Assets
+from wiki.web.assets import compress_response
 from wiki.web.user import UserManager
 
 class WikiError(Exception):
     pass
 
 def get_wiki():
-    wiki = getattr(g, '_wiki', None)
-    if wiki is None:
-        wiki = g._wiki = Wiki(current_app.config['CONTENT_DIR'])
-    return wiki
+    # the wiki is shared by all requests of the app, so its indexes
+    # and caches survive between them
+    return current_app.extensions['wiki']
 
 current_wiki = LocalProxy(get_wiki)
 
 def get_users():
-    users = getattr(g, '_users', None)
-    if users is None:
-        users = g._users = UserManager(current_app.config['CONTENT_DIR'])
-    return users
+    return current_app.extensions['users']
 
 current_users = LocalProxy(get_users)
 
@@ -41,6 +43,47 @@ def create_app(directory):
         msg = "You need to place a config.py in your content directory."
         raise WikiError(msg)
 
+    cache_folder = None
+    if app.config.get('RENDER_CACHE_DISK', False):
+        cache_folder = os.path.join(directory, Wiki.state_folder, 'cache')
+    render_cache = RenderCache(
+        max_bytes=app.config.get('RENDER_CACHE_SIZE', 32 * 1024 * 1024),
+        folder=cache_folder)
+    highlight_cache.max_bytes = app.config.get(
+        'HIGHLIGHT_CACHE_SIZE', highlight_cache.max_bytes)
+    storage = create_storage(
+        app.config.get('STORAGE', 'files'), directory,
+        exclude=[Wiki.state_folder])
+    wiki = Wiki(directory, render_cache=render_cache,
+                # only the files storage can be changed from outside
+                watched=app.config.get('WATCH', False) and
+                storage.name == 'files',
+                history=app.config.get('HISTORY', False), storage=storage,
+                scan_interval=app.config.get('SCAN_INTERVAL', 2.0))
+    app.extensions['wiki'] = wiki
+    wiki.recover()
+    app.extensions['users'] = UserManager(directory)
+    if app.config.get('MATH_RENDERER'):
+        app.extensions['math'] = create_renderer(
+            app.config['MATH_RENDERER'],
+            os.path.join(directory, Wiki.state_folder, 'math'),
+            app.config.get('MATH_COMMAND'))
+
+    if wiki.watched:
+        app.extensions['watcher'] = create_watcher(
+            wiki,
+            interval=app.config.get('WATCH_INTERVAL', 1.0),
+            polling=app.config.get('WATCH_POLLING', False)).start()
+
+    assets = Assets(
+        app.static_folder,
+        os.path.join(directory, Wiki.state_folder, 'assets'),
+        compress=app.config.get('ASSETS_COMPRESS', True)).build()
+    app.extensions['assets'] = assets
+    app.jinja_env.globals['asset'] = assets.url
+    if app.config.get('GZIP_HTML', False):
+        app.after_request(compress_response)
+
     loginmanager.init_app(app)
 
     from wiki.web.routes import bp
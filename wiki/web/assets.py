@@ -0,0 +1,199 @@
+"""
+    Assets
+    ~~~~~~
+
+    Serves the static files under content-hashed names, so browsers
+    and proxies can cache them forever, together with precompressed
+    gzip and brotli variants. Also compresses html responses on the
+    fly if configured.
+"""
+import gzip
+import hashlib
+from io import BytesIO
+from io import open
+import mimetypes
+import os
+import shutil
+
+from flask import abort
+from flask import request
+from flask import send_file
+from flask import url_for
+
+from wiki.files import atomic_write
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+#: the Cache-Control of fingerprinted files, their content never changes
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+#: html responses smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 500
+
+
+def _gzip(data):
+    # a fixed mtime keeps the output stable between runs, written
+    # through GzipFile as gzip.compress only takes it from Python 3.8
+    buf = BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=9,
+                       mtime=0) as f:
+        f.write(data)
+    return buf.getvalue()
+
+
+def _brotli(data):
+    return brotli.compress(data, quality=11)
+
+
+#: the precompressed variants, in order of preference
+ENCODINGS = [('br', '.br', _brotli), ('gzip', '.gz', _gzip)]
+
+
+class Assets(object):
+    """
+        The fingerprinted copies of a static folder.
+
+        :param str source: the static folder
+        :param str folder: where the fingerprinted files and their
+            compressed variants are written
+        :param bool compress: whether compressed variants are created
+    """
+
+    def __init__(self, source, folder, compress=True):
+        self.source = source
+        self.folder = folder
+        self.compress = compress
+        #: maps the original names to the fingerprinted ones
+        self.files = {}
+        #: maps the fingerprinted names to the original ones
+        self.originals = {}
+
+    def encodings(self):
+        return [(name, suffix, func) for name, suffix, func in ENCODINGS
+                if func is not _brotli or brotli is not None]
+
+    def build(self):
+        """
+            Creates the fingerprinted files. Files are only written
+            (and compressed) once, as their names change with their
+            content.
+
+            :returns: the assets
+        """
+        files = {}
+        for cur_dir, _, names in os.walk(self.source):
+            for name in names:
+                path = os.path.join(cur_dir, name)
+                relative = os.path.relpath(path, self.source).replace(
+                    os.sep, '/')
+                with open(path, 'rb') as f:
+                    data = f.read()
+                base, ext = os.path.splitext(relative)
+                fingerprinted = u'%s.%s%s' % (
+                    base, hashlib.sha1(data).hexdigest()[:12], ext)
+                target = os.path.join(self.folder, fingerprinted)
+                if not os.path.exists(target):
+                    atomic_write(target, data)
+                if self.compress:
+                    for _, suffix, func in self.encodings():
+                        if os.path.exists(target + suffix):
+                            continue
+                        compressed = func(data)
+                        # an empty variant marks data that does not
+                        # compress, so it is not tried again
+                        if len(compressed) >= len(data):
+                            compressed = b''
+                        atomic_write(target + suffix, compressed)
+                files[relative] = fingerprinted
+        self.files = files
+        self.originals = dict((v, k) for k, v in files.items())
+        return self
+
+    def url(self, filename):
+        """
+            Get the url of a static file, used as ``asset()`` in the
+            templates.
+        """
+        if filename not in self.files:
+            return url_for('static', filename=filename)
+        return url_for('wiki.asset', filename=self.files[filename])
+
+    def variants(self, fingerprinted):
+        """
+            Get the files of a fingerprinted name that exist.
+
+            :returns: a list of tuples of the encoding (``None`` for
+                the uncompressed file) and the path, the preferred
+                encoding first.
+            :rtype: list
+        """
+        path = os.path.join(self.folder, fingerprinted)
+        variants = []
+        for encoding, suffix, _ in self.encodings():
+            if os.path.exists(path + suffix) and \
+                    os.path.getsize(path + suffix) > 0:
+                variants.append((encoding, path + suffix))
+        variants.append((None, path))
+        return variants
+
+    def send(self, fingerprinted):
+        """
+            Creates the response for a fingerprinted file, choosing
+            the best variant the client accepts.
+        """
+        if fingerprinted not in self.originals:
+            abort(404)
+        for encoding, path in self.variants(fingerprinted):
+            if encoding is None or request.accept_encodings[encoding]:
+                break
+        mimetype = mimetypes.guess_type(self.originals[fingerprinted])[0]
+        response = send_file(
+            path, mimetype=mimetype or 'application/octet-stream',
+            conditional=True)
+        if encoding is not None:
+            response.content_encoding = encoding
+        response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = IMMUTABLE
+        return response
+
+    def copy(self, folder):
+        """
+            Copies the current fingerprinted files and their variants
+            to another folder, used by static builds.
+        """
+        for fingerprinted in self.originals:
+            for _, path in self.variants(fingerprinted):
+                target = os.path.join(
+                    folder, os.path.relpath(path, self.folder))
+                if not os.path.exists(os.path.dirname(target)):
+                    os.makedirs(os.path.dirname(target))
+                shutil.copyfile(path, target)
+
+
+def compress_response(response):
+    """
+        Gzips html responses for clients that accept it, registered
+        as an ``after_request`` handler if ``GZIP_HTML`` is set.
+    """
+    if response.status_code != 200 or response.is_streamed or \
+            response.direct_passthrough or \
+            response.mimetype != 'text/html' or \
+            'Content-Encoding' in response.headers:
+        return response
+    response.vary.add('Accept-Encoding')
+    if not request.accept_encodings['gzip']:
+        return response
+    data = response.get_data()
+    if len(data) < MIN_COMPRESS_SIZE:
+        return response
+    response.set_data(gzip.compress(data, 6))
+    response.content_encoding = 'gzip'
+    # the compressed bytes differ, but the content is the same
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
@@ -0,0 +1,135 @@
+"""
+    Static build
+    ~~~~~~~~~~~~
+
+    Renders the whole wiki to static html files, which can be served
+    by any web server without running python.
+"""
+from io import open
+import json
+import os
+import shutil
+from urllib.parse import unquote
+
+from flask import render_template
+from flask import url_for
+
+from wiki.files import atomic_write
+from wiki.web.caching import template_version
+
+
+#: the file in the output folder remembering what was built
+MANIFEST = '.manifest.json'
+
+
+class StaticBuilder(object):
+    """
+        Builds a static copy of the wiki of an app into a folder.
+
+        Pages are only rendered again if their source or the
+        templates changed since the last build, the listings (index,
+        tags) are always rendered again.
+
+        :param app: the app created by :func:`~wiki.web.create_app`
+        :param str out: the output folder
+    """
+
+    def __init__(self, app, out):
+        self.app = app
+        self.out = os.path.abspath(out)
+        self.wiki = app.extensions['wiki']
+
+    def version(self):
+        """
+            A hash of everything besides the source that influences
+            the output of pages: the templates and the processor.
+        """
+        return template_version(self.app)
+
+    def target(self, path):
+        """
+            Get the file a url path is written to.
+        """
+        relative = unquote(path).strip('/')
+        target = os.path.normpath(
+            os.path.join(self.out, relative, 'index.html'))
+        if not target.startswith(self.out + os.sep):
+            raise RuntimeError('Possible write outside output: %s' % path)
+        return target
+
+    def write(self, path, html):
+        atomic_write(self.target(path), html)
+
+    def read_manifest(self):
+        try:
+            with open(os.path.join(self.out, MANIFEST),
+                      encoding='utf-8') as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def build(self, jobs=None):
+        """
+            Runs the build.
+
+            :param int jobs: the number of processes used to render
+                the markdown, see :meth:`~wiki.core.Wiki.build_index`.
+
+            :returns: a tuple of the number of pages rendered and
+                skipped.
+            :rtype: tuple
+        """
+        version = self.version()
+        manifest = self.read_manifest()
+        built = manifest.get('pages', {})
+        if manifest.get('version') != version:
+            built = {}
+        self.wiki.build_index(jobs=jobs, render=False)
+        pages = self.wiki.index()
+        hashes = dict(
+            (entry.url, entry.hash) for entry in self.wiki.page_index.entries())
+        # render the markdown of the changed pages in parallel, the
+        # templates are then filled from the render cache
+        self.wiki.render_pages(
+            [page.url for page in pages
+             if built.get(page.url) != hashes[page.url]],
+            jobs=jobs)
+        rendered = skipped = 0
+        current = {}
+        with self.app.test_request_context():
+            for page in pages:
+                path = url_for('wiki.display', url=page.url)
+                current[page.url] = hashes[page.url]
+                if built.get(page.url) == hashes[page.url] and \
+                        os.path.exists(self.target(path)):
+                    skipped += 1
+                    continue
+                self.write(path, render_template('page.html', page=page))
+                rendered += 1
+            for url in set(built) - set(current):
+                target = self.target(url_for('wiki.display', url=url))
+                if os.path.exists(target):
+                    os.remove(target)
+
+            home = self.wiki.get('home')
+            if home:
+                html = render_template('page.html', page=home)
+            else:
+                html = render_template('home.html')
+            atomic_write(os.path.join(self.out, 'index.html'), html)
+            self.write(url_for('wiki.index'),
+                       render_template('index.html', pages=pages))
+            self.write(url_for('wiki.tags'), render_template(
+                'tags.html', tags=self.wiki.tag_counts()))
+            for tag in self.wiki.tag_counts():
+                self.write(url_for('wiki.tag', name=tag), render_template(
+                    'tag.html', pages=self.wiki.index_by_tag(tag), tag=tag))
+
+        static = os.path.join(self.out, 'static')
+        if os.path.exists(static):
+            shutil.rmtree(static)
+        shutil.copytree(self.app.static_folder, static)
+        self.app.extensions['assets'].copy(os.path.join(self.out, 'assets'))
+        atomic_write(os.path.join(self.out, MANIFEST), json.dumps(
+            {'version': version, 'pages': current}))
+        return rendered, skipped
@@ -0,0 +1,118 @@
+"""
+    HTTP caching
+    ~~~~~~~~~~~~
+
+    Conditional GET support for the read-only views: responses carry an
+    ``ETag`` and a ``Last-Modified`` header, and requests that still
+    have a current copy are answered with a 304 without rendering.
+"""
+from datetime import datetime
+from datetime import timezone
+import hashlib
+from io import open
+import os
+
+from flask import current_app
+from flask import make_response
+from flask import request
+from flask import Response
+from flask import session
+from flask_login import current_user
+from werkzeug.http import is_resource_modified
+
+from wiki.core import Processor
+
+
+def template_version(app):
+    """
+        A hash of everything besides the source that influences the
+        output of pages: the templates, the title, the processor and
+        the math renderer.
+
+        :param app: the app created by :func:`~wiki.web.create_app`
+    """
+    digest = hashlib.sha1()
+    folder = os.path.join(app.root_path, app.template_folder)
+    for name in sorted(os.listdir(folder)):
+        with open(os.path.join(folder, name), 'rb') as f:
+            digest.update(f.read())
+    digest.update(app.config['TITLE'].encode('utf-8'))
+    digest.update(Processor(u'').config().encode('utf-8'))
+    math = app.extensions.get('math')
+    if math is not None:
+        digest.update(math.typesetter.name.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def get_template_version():
+    # the templates only change with a restart, unless they are
+    # reloaded automatically
+    app = current_app._get_current_object()
+    if app.jinja_env.auto_reload:
+        return template_version(app)
+    if 'template_version' not in app.extensions:
+        app.extensions['template_version'] = template_version(app)
+    return app.extensions['template_version']
+
+
+def is_private():
+    """
+        Whether the response may only be cached by the browser of the
+        current user: always for private wikis, otherwise only for
+        logged in users, as the navigation shows who is logged in.
+    """
+    return bool(current_app.config.get('PRIVATE')) or \
+        current_user.is_authenticated
+
+
+def cache_control(response):
+    """
+        Sets the ``Cache-Control`` header configured by
+        ``CACHE_CONTROL`` or, for private responses (see
+        :func:`is_private`), by ``CACHE_CONTROL_PRIVATE``.
+    """
+    if is_private():
+        policy = current_app.config.get(
+            'CACHE_CONTROL_PRIVATE', 'private, no-cache')
+    else:
+        policy = current_app.config.get('CACHE_CONTROL', 'no-cache')
+    if policy:
+        response.headers['Cache-Control'] = policy
+    response.vary.add('Cookie')
+    return response
+
+
+def conditional(validator, modified, render):
+    """
+        Answers a GET request conditionally.
+
+        :param str validator: identifies the data the response is
+            rendered from, it is combined with the template version
+            and the user into the ``ETag``.
+        :param float modified: the time the data was last changed,
+            used as ``Last-Modified``, optional.
+        :param function render: called without arguments to render
+            the response, unless the client has a current copy.
+
+        :returns: the response
+    """
+    digest = hashlib.sha1()
+    for part in (get_template_version(), validator,
+                 current_user.get_id() if current_user.is_authenticated
+                 else u''):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    etag = digest.hexdigest()
+    last_modified = None
+    if modified is not None:
+        last_modified = datetime.fromtimestamp(int(modified), timezone.utc)
+    # pending messages are only shown on a fresh rendering
+    if '_flashes' not in session and not is_resource_modified(
+            request.environ, etag=etag, last_modified=last_modified):
+        response = Response(status=304)
+    else:
+        response = make_response(render())
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    return cache_control(response)
@@ -8,6 +8,7 @@ try:
     from wtforms import StringField as StringField
 except ImportError:
     from wtforms import TextField as StringField
+from wtforms import HiddenField
 from wtforms import TextAreaField
 from wtforms import PasswordField
 from wtforms.validators import InputRequired
@@ -29,18 +30,46 @@ class URLForm(FlaskForm):
         return clean_url(url)
 
 
+class MoveForm(URLForm):
+    subtree = BooleanField('Also move the pages below it', default=True)
+    links = BooleanField('Update the links to moved pages', default=True)
+
+
 class SearchForm(FlaskForm):
     term = StringField('', [InputRequired()])
     ignore_case = BooleanField(
         description='Ignore Case',
         # FIXME: default is not correctly populated
         default=True)
+    regex = BooleanField(
+        description='Regex',
+        default=False)
 
 
 class EditorForm(FlaskForm):
     title = StringField('', [InputRequired()])
     body = TextAreaField('', [InputRequired()])
     tags = StringField('')
+    #: what changed, recorded in the history
+    message = StringField('')
+    #: the version of the page the editor was opened with
+    version = HiddenField('')
+
+    def populate_obj(self, obj):
+        # the version is not written to the page, it is checked when
+        # the page is saved
+        for name in ('title', 'body', 'tags'):
+            self[name].populate_obj(obj, name)
+
+    @property
+    def base_version(self):
+        """
+            The version to save over, ``None`` for clients that do not
+            send one.
+        """
+        if self.version.raw_data:
+            return self.version.data
+        return None
 
 
 class LoginForm(FlaskForm):
@@ -2,22 +2,34 @@
     Routes
     ~~~~~~
 """
+from datetime import datetime
+import difflib
+
+from flask import abort
 from flask import Blueprint
+from flask import current_app
 from flask import flash
 from flask import redirect
 from flask import render_template
 from flask import request
+from flask import Response
+from flask import stream_with_context
 from flask import url_for
 from flask_login import current_user
 from flask_login import login_required
 from flask_login import login_user
 from flask_login import logout_user
 
+from wiki.core import ConflictException
+from wiki.core import diff_versions
 from wiki.core import Processor
+from wiki.core import source_cache
 from wiki.web.forms import EditorForm
 from wiki.web.forms import LoginForm
+from wiki.web.forms import MoveForm
 from wiki.web.forms import SearchForm
 from wiki.web.forms import URLForm
+from wiki.web.caching import conditional
 from wiki.web import current_wiki
 from wiki.web import current_users
 from wiki.web.user import protect
@@ -26,6 +38,23 @@ from wiki.web.user import protect
 bp = Blueprint('wiki', __name__)
 
 
+@bp.app_template_filter('datetime')
+def format_datetime(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M')
+
+
+def stream_template(template_name, **context):
+    """
+        Renders a template as a stream, so the beginning of the
+        response can be sent while the rest is still being rendered.
+    """
+    current_app.update_template_context(context)
+    template = current_app.jinja_env.get_template(template_name)
+    stream = template.stream(context)
+    stream.enable_buffering(20)
+    return Response(stream_with_context(stream))
+
+
 @bp.route('/')
 @protect
 def home():
@@ -35,18 +64,44 @@ def home():
     return render_template('home.html')
 
 
+def listing(render):
+    """
+        Answers conditionally for views that list pages, which change
+        with every change to the page index.
+    """
+    revision, modified = current_wiki.revision()
+    return conditional(u'%s:%r' % (revision, modified), modified, render)
+
+
 @bp.route('/index/')
 @protect
 def index():
-    pages = current_wiki.index()
-    return render_template('index.html', pages=pages)
+    # ?stream=0 turns streaming off, even if it is configured
+    if request.args.get('stream', current_app.config.get('INDEX_STREAM'),
+                        type=int):
+        return listing(lambda: stream_template(
+            'index.html', pages=current_wiki.iter_index()))
+
+    def render():
+        try:
+            pages, following = current_wiki.index_page(
+                request.args.get('after'),
+                current_app.config.get('INDEX_PAGE_SIZE', 100))
+        except ValueError:
+            abort(400)
+        return render_template('index.html', pages=pages, following=following)
+    return listing(render)
 
 
 @bp.route('/<path:url>/')
 @protect
 def display(url):
-    page = current_wiki.get_or_404(url)
-    return render_template('page.html', page=page)
+    fingerprint = current_wiki.fingerprint(url)
+    if fingerprint is None:
+        abort(404)
+    source_hash, modified = fingerprint
+    return conditional(source_hash, modified, lambda: render_template(
+        'page.html', page=current_wiki.get_or_404(url)))
 
 
 @bp.route('/create/', methods=['GET', 'POST'])
@@ -68,12 +123,62 @@ def edit(url):
         if not page:
             page = current_wiki.get_bare(url)
         form.populate_obj(page)
-        page.save()
+        try:
+            page.save(version=form.base_version, author=author(),
+                      message=form.message.data or None)
+        except ConflictException:
+            return conflict(page, form)
         flash('"%s" was saved.' % page.title, 'success')
         return redirect(url_for('wiki.display', url=url))
+    if page and not form.is_submitted():
+        # kept as the base of the diff, should the save conflict
+        source_cache.set(page.version, page.content)
     return render_template('editor.html', form=form, page=page)
 
 
+def author():
+    """
+        The name of the current user, recorded in the history.
+    """
+    if current_user.is_authenticated:
+        return current_user.get_id()
+    return None
+
+
+def conflict(page, form):
+    """
+        Shows the editor again after a conflicting save, with the
+        changes saved in the meantime and the rejected ones. The
+        editor now carries the current version, so saving again
+        replaces it.
+    """
+    base = u''
+    if form.version.data:
+        base = source_cache.get(form.version.data)
+    current = current_wiki.get(page.url)
+    theirs = current.content if current else u''
+    form.version.data = current.version if current else u''
+    diff = diff_versions(base, theirs, page.serialize())
+    return render_template(
+        'editor.html', form=form, page=page, conflict=diff), 409
+
+
+@bp.route('/version/<path:url>/')
+@protect
+def version(url):
+    """
+        The current version of a page, for editors polling for
+        changes. It is answered from the page index, the page is
+        neither read nor rendered.
+    """
+    fingerprint = current_wiki.fingerprint(url)
+    if fingerprint is None:
+        abort(404)
+    source_hash, modified = fingerprint
+    return conditional(source_hash, modified, lambda: {
+        'url': url, 'version': source_hash, 'modified': modified})
+
+
 @bp.route('/preview/', methods=['POST'])
 @protect
 def preview():
@@ -87,11 +192,19 @@ def preview():
 @protect
 def move(url):
     page = current_wiki.get_or_404(url)
-    form = URLForm(obj=page)
+    form = MoveForm(obj=page)
     if form.validate_on_submit():
         newurl = form.url.data
-        renamed = current_wiki.move(url, newurl)
-        return redirect(url_for('wiki.display', url=renamed))
+        try:
+            renamed = current_wiki.move(
+                url, newurl, subtree=form.subtree.data,
+                rewrite_links=form.links.data)
+        except (RuntimeError, OSError) as error:
+            # e.g. the folder of the new url exists already, the files
+            # that were changed are restored
+            flash(str(error), 'error')
+        else:
+            return redirect(url_for('wiki.display', url=renamed))
     return render_template('move.html', form=form, page=page)
 
 
@@ -99,7 +212,7 @@ def move(url):
 @protect
 def delete(url):
     page = current_wiki.get_or_404(url)
-    current_wiki.delete(url)
+    current_wiki.delete(url, author=author())
     flash('Page "%s" was deleted.' % page.title, 'success')
     return redirect(url_for('wiki.home'))
 
@@ -107,15 +220,96 @@ def delete(url):
 @bp.route('/tags/')
 @protect
 def tags():
-    tags = current_wiki.get_tags()
-    return render_template('tags.html', tags=tags)
+    return listing(lambda: render_template(
+        'tags.html', tags=current_wiki.tag_counts()))
 
 
 @bp.route('/tag/<string:name>/')
 @protect
 def tag(name):
-    tagged = current_wiki.index_by_tag(name)
-    return render_template('tag.html', pages=tagged, tag=name)
+    return listing(lambda: render_template(
+        'tag.html', pages=current_wiki.index_by_tag(name), tag=name))
+
+
+@bp.route('/backlinks/<path:url>/')
+@protect
+def backlinks(url):
+    return listing(lambda: render_template(
+        'backlinks.html', pages=current_wiki.backlinks(url), url=url))
+
+
+def get_history_or_404():
+    history = current_wiki.history
+    if history is None:
+        abort(404)
+    return history
+
+
+@bp.route('/history/<path:url>/')
+@protect
+def history(url):
+    """
+        The latest revisions of a page. Only the revisions that are
+        shown are read, older ones are on the pages linked below.
+    """
+    history = get_history_or_404()
+    before = request.args.get('before', type=int)
+    count = history.count(url)
+    if not count:
+        abort(404)
+
+    def render():
+        revisions = history.revisions(
+            url, current_app.config.get('HISTORY_PAGE_SIZE', 50), before)
+        older = None
+        if revisions and revisions[-1].number > 1:
+            older = revisions[-1].number
+        return render_template(
+            'history.html', url=url, revisions=revisions, older=older)
+    return conditional(u'history:%s:%d:%s' % (url, count, before), None,
+                       render)
+
+
+@bp.route('/diff/<path:url>/')
+@protect
+def diff(url):
+    """
+        The changes of a revision of a page, against the revision
+        before it or the one given as ``old``. Only these two
+        revisions are read.
+    """
+    history = get_history_or_404()
+    new = request.args.get('new', history.count(url), type=int)
+    old = request.args.get('old', new - 1, type=int)
+    revision = history.revision(url, new)
+    if revision is None or old < 0 or (
+            old and history.revision(url, old) is None):
+        abort(404)
+
+    def render():
+        lines = difflib.unified_diff(
+            (history.content(url, old) or u'').splitlines(),
+            history.content(url, new).splitlines(),
+            u'revision %d' % old, u'revision %d' % new, lineterm=u'')
+        return render_template(
+            'diff.html', url=url, revision=revision, old=old,
+            lines=list(lines))
+    # revisions never change, neither does their diff
+    return conditional(u'diff:%s:%d:%d' % (url, old, new), None, render)
+
+
+@bp.route('/broken/')
+@protect
+def broken():
+    return listing(lambda: render_template(
+        'broken.html', links=current_wiki.broken_links()))
+
+
+@bp.route('/orphans/')
+@protect
+def orphans():
+    return listing(lambda: render_template(
+        'orphans.html', pages=current_wiki.orphans()))
 
 
 @bp.route('/search/', methods=['GET', 'POST'])
@@ -123,12 +317,21 @@ def tag(name):
 def search():
     form = SearchForm()
     if form.validate_on_submit():
-        results = current_wiki.search(form.term.data, form.ignore_case.data)
+        if form.regex.data:
+            results = current_wiki.search(
+                form.term.data, form.ignore_case.data)
+        else:
+            results = current_wiki.query(form.term.data)
         return render_template('search.html', form=form,
                                results=results, search=form.term.data)
     return render_template('search.html', form=form, search=None)
 
 
+@bp.route('/assets/<path:filename>')
+def asset(filename):
+    return current_app.extensions['assets'].send(filename)
+
+
 @bp.route('/user/login/', methods=['GET', 'POST'])
 def user_login():
     form = LoginForm()
@@ -5,75 +5,114 @@
 import os
 import json
 import binascii
+import copy
 import hashlib
+import threading
+from contextlib import contextmanager
 from functools import wraps
 
 from flask import current_app
 from flask_login import current_user
 
+from wiki.files import atomic_write
+from wiki.files import file_lock
 
 
 class UserManager(object):
-    """A very simple user Manager, that saves it's data as json."""
+    """A very simple user Manager, that saves it's data as json.
+
+    The parsed file is kept in memory and only read again when its
+    mtime or size changed. Writes are atomic and serialized across
+    threads and processes with a lock file next to the data."""
     def __init__(self, path):
         self.file = os.path.join(path, 'users.json')
+        # the manager is shared by all the threads of the app, so
+        # every read-modify-write cycle has to hold the lock
+        self.lock = threading.RLock()
+        self._data = {}
+        self._stat = None
+
+    def _load(self):
+        """Returns the cached data, reloading it if the file changed.
+        The result must not be modified."""
+        try:
+            stat = os.stat(self.file)
+        except OSError:
+            return {}
+        key = (stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            if key != self._stat:
+                with open(self.file) as f:
+                    self._data = json.loads(f.read())
+                self._stat = key
+            return self._data
 
     def read(self):
-        if not os.path.exists(self.file):
-            return {}
-        with open(self.file) as f:
-            data = json.loads(f.read())
-        return data
+        return copy.deepcopy(self._load())
 
     def write(self, data):
-        with open(self.file, 'w') as f:
-            f.write(json.dumps(data, indent=2))
+        with self.lock:
+            atomic_write(self.file, json.dumps(data, indent=2))
+            stat = os.stat(self.file)
+            self._data = copy.deepcopy(data)
+            self._stat = (stat.st_mtime_ns, stat.st_size)
+
+    @contextmanager
+    def writing(self):
+        """Holds the locks needed for a read-modify-write cycle."""
+        with self.lock, file_lock(self.file + '.lock'):
+            yield
 
     def add_user(self, name, password,
                  active=True, roles=[], authentication_method=None):
-        users = self.read()
-        if users.get(name):
-            return False
-        if authentication_method is None:
-            authentication_method = get_default_authentication_method()
-        new_user = {
-            'active': active,
-            'roles': roles,
-            'authentication_method': authentication_method,
-            'authenticated': False
-        }
-        # Currently we have only two authentication_methods: cleartext and
-        # hash. If we get more authentication_methods, we will need to go to a
-        # strategy object pattern that operates on User.data.
-        if authentication_method == 'hash':
-            new_user['hash'] = make_salted_hash(password)
-        elif authentication_method == 'cleartext':
-            new_user['password'] = password
-        else:
-            raise NotImplementedError(authentication_method)
-        users[name] = new_user
-        self.write(users)
+        with self.writing():
+            users = self.read()
+            if users.get(name):
+                return False
+            if authentication_method is None:
+                authentication_method = get_default_authentication_method()
+            new_user = {
+                'active': active,
+                'roles': roles,
+                'authentication_method': authentication_method,
+                'authenticated': False
+            }
+            # Currently we have only two authentication_methods: cleartext
+            # and hash. If we get more authentication_methods, we will need
+            # to go to a strategy object pattern that operates on User.data.
+            if authentication_method == 'hash':
+                new_user['hash'] = make_salted_hash(password)
+            elif authentication_method == 'cleartext':
+                new_user['password'] = password
+            else:
+                raise NotImplementedError(authentication_method)
+            users[name] = new_user
+            self.write(users)
         userdata = users.get(name)
         return User(self, name, userdata)
 
     def get_user(self, name):
-        users = self.read()
-        userdata = users.get(name)
+        userdata = self._load().get(name)
         if not userdata:
             return None
-        return User(self, name, userdata)
+        return User(self, name, copy.deepcopy(userdata))
 
     def delete_user(self, name):
-        users = self.read()
-        if not users.pop(name, False):
-            return False
-        self.write(users)
+        with self.writing():
+            users = self.read()
+            if not users.pop(name, False):
+                return False
+            self.write(users)
         return True
 
     def update(self, name, userdata):
-        data = self.read()
-        data[name] = userdata
-        self.write(data)
+        with self.writing():
+            data = self.read()
+            if data.get(name) == userdata:
+                # e.g. logging in again, nothing to write
+                return
+            data[name] = userdata
+            self.write(data)
 
 
 class User(object):